@@ -1,63 +1,557 @@
+import bisect
+import itertools
 import math
+from array import array
+
+POLICIES = ('restart', 'freeze', 'prune')  # Políticas ao atingir o orçamento de memória
+
+# Estimativa de memória (CPython 64 bits) usada por PPMModel.estimated_bytes,
+# ajustada com tracemalloc em ordens 2 a 8: custo de um nó (objeto, arrays e
+# dict de filhos) e de cada símbolo adicional contado em um nó (com os 32
+# bytes do float de entropy_sum).
+NODE_BYTES = 440
+ENTRY_BYTES = 16
+# Custo de cada StaleTable guardada no modo de reconstrução periódica (com a
+# tabela do backend 'huffman', a maior) e de cada frequência dela.
+TABLE_BYTES = 960
+TABLE_ENTRY_BYTES = 160
+
+# Acréscimo de c*log2(c) quando uma contagem passa de c para c + 1 (ver
+# ContextNode.entropy_sum), tabelado para as contagens pequenas
+DELTAS_ENTROPIA = [(c + 1) * math.log2(c + 1) - (c * math.log2(c) if c else 0.0) for c in range(1024)]
+
+def delta_entropia(c):
+    if c < 1024:
+        return DELTAS_ENTROPIA[c]
+    return (c + 1) * math.log2(c + 1) - c * math.log2(c)
+
+class ContextNode:
+    """
+    Nó da árvore de contextos do PPMModel.
+
+    Cada nó representa um contexto de tamanho depth. Os filhos estendem o
+    contexto com mais um símbolo no fim (o filho 'c' de "ab" é "abc") e o
+    sufixo aponta para o contexto sem o símbolo mais antigo ("abc" -> "bc").
+    As contagens ficam em dois arrays paralelos: ids dos símbolos e contagens,
+    e mask tem o bit de cada id presente em symbols (usado na exclusão).
+    entropy_sum (soma de c*log2(c) das contagens) é mantida por update e
+    rescale, para a entropia do contexto sem percorrer as contagens (ver
+    PPMModel.context_entropy). table guarda a StaleTable do nó no modo de
+    reconstrução periódica.
+    """
+    __slots__ = ('symbols', 'counts', 'mask', 'total', 'entropy_sum', 'children', 'suffix', 'depth', 'table')
+
+    def __init__(self, depth, suffix, typecode, leaf):
+        self.symbols = array(typecode)  # Ids dos símbolos vistos neste contexto
+        self.counts = array('I')  # Contagem de cada símbolo em symbols
+        self.mask = 0  # Bit 1 << id de cada símbolo em symbols
+        self.total = 0  # Soma de counts
+        self.entropy_sum = 0.0  # Soma de c*log2(c) de counts
+        self.children = None if leaf else {}  # {id: nó do contexto estendido}
+        self.suffix = suffix
+        self.depth = depth
+        self.table = None  # Ver PPMModel.stale_table
+
+class StaleTable:
+    """
+    Tabela de codificação de um contexto, reconstruída só periodicamente (ver
+    PPMModel.stale_table).
+
+    Como as contagens do nó mudam entre as reconstruções, a tabela guarda a
+    sua própria máscara: só os símbolos de mask podem ser codificados com ela,
+    e são esses (e não os de node.mask) que vão para a exclusão seguinte e
+    para k=-1.
+    """
+    __slots__ = ('coding', 'frequencies', 'mask', 'total', 'entropy')
+
+    def __init__(self, coding, frequencies, mask, total, entropy=None):
+        self.coding = coding  # Tabela preparada pelo backend (ver backends.py)
+        self.frequencies = frequencies
+        self.mask = mask  # Símbolos da tabela, sem o escape nem os excluídos
+        self.total = total  # node.total na construção
+        self.entropy = entropy  # Entropia das frequências (só nas tabelas sem exclusão)
 
 class PPMModel:
-    def __init__(self, alphabet, order):
+    """
+    Modelo PPM adaptativo sobre uma árvore de contextos.
+
+    Args:
+        alphabet (iterable): Símbolos do alfabeto: caracteres, ou inteiros de
+            0 a 255 no modo binário (entrada em bytes).
+        order (int): Ordem máxima dos contextos.
+        max_nodes (int): Limite de nós da árvore (None = sem limite).
+        max_bytes (int): Limite da memória estimada em bytes (None = sem limite).
+        policy (str): O que fazer ao passar do limite: 'restart' recomeça o
+            modelo do zero, 'freeze' para de criar contextos (as contagens
+            continuam sendo atualizadas) e 'prune' remove os contextos menos
+            usados até voltar à metade do limite.
+        rescale_threshold (int): Quando o total de um contexto passa deste
+            valor, suas contagens são divididas por dois.
+
+    Todas as decisões dependem apenas da sequência de símbolos, de modo que o
+    decodificador reproduz exatamente o mesmo modelo com os mesmos parâmetros.
+    """
+    node_class = ContextNode  # Classe dos nós criados (ver new_child)
+
+    def __init__(self, alphabet, order, max_nodes=None, max_bytes=None, policy='restart',
+                 rescale_threshold=65535):
+        if policy not in POLICIES:
+            raise ValueError(f"Política desconhecida: {policy!r}")
+        if order < 0:
+            raise ValueError("A ordem deve ser positiva ou zero.")
         self.order = order
-        self.contexts = {k: {} for k in range(1, order + 1)}  # {k: {contexto: {símbolo: contagem}}}
-        self.k0_frequencies = {}  # {símbolo: contagem}
         self.alphabet = set(alphabet)
-        self.seen_symbols = set()
-        self.k0_unique_symbols = 0  # Conta símbolos únicos para k=0
+        self.max_nodes = max_nodes
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.rescale_threshold = rescale_threshold
+        # Símbolos são tratados internamente como inteiros pequenos
+        self.symbols = sorted(self.alphabet)
+        self.symbol_ids = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.binary = all(isinstance(symbol, int) for symbol in self.symbols)
+        # Com o alfabeto de todos os bytes, o id é o próprio byte
+        self.identity = self.symbols == list(range(len(self.symbols)))
+        self.escape = len(self.symbols)  # Id usado para o escape nas tabelas de código
+        self.full_mask = (1 << len(self.symbols)) - 1  # Máscara com todos os símbolos
+        self.typecode = 'B' if len(self.symbols) <= 256 else 'I'
+        self.restarts = 0
+        self.instrumentation = None  # Instrumentation opcional (ver instrumentacao.py)
+        self.reset()
+
+    def reset(self):
+        """Descarta todas as estatísticas (modelo vazio)."""
+        self.root = self.node_class(0, None, self.typecode, self.order == 0)  # Contexto k=0
+        self.seen_symbols = set()  # Ids já vistos (os demais ficam em k=-1)
+        self.unseen = list(range(len(self.symbols)))  # Tabela de k=-1: ids não vistos, em ordem
+        self.node_count = 1
+        self.entry_count = 0  # Símbolos contados, somando todos os nós
+        self.table_count = 0  # StaleTable guardadas nos nós (ver stale_table)
+        self.table_entries = 0  # Frequências dessas tabelas
+        self.frozen = False
+
+    @property
+    def params(self):
+        """Parâmetros do modelo, além de alfabeto e ordem, para o cabeçalho."""
+        return {
+            'max_nodes': self.max_nodes,
+            'max_bytes': self.max_bytes,
+            'policy': self.policy,
+            'rescale_threshold': self.rescale_threshold,
+        }
+
+    @property
+    def estimated_bytes(self):
+        """Memória estimada da árvore de contextos e das tabelas guardadas, em bytes."""
+        return (self.node_count * NODE_BYTES + self.entry_count * ENTRY_BYTES
+                + self.table_count * TABLE_BYTES + self.table_entries * TABLE_ENTRY_BYTES)
+
+    def over_budget(self):
+        if self.max_nodes is not None and self.node_count > self.max_nodes:
+            return True
+        return self.max_bytes is not None and self.estimated_bytes > self.max_bytes
 
-    def update(self, symbol, history):
+    def find_context(self, history):
+        """
+        Retorna o nó do contexto mais longo (até order) de history que existe
+        na árvore, descendo a partir da raiz. history é uma lista de ids.
+
+        Os codificadores não precisam disto: mantêm o contexto atual com o
+        retorno de update. Serve para consultas a partir de um histórico.
+        """
+        k = min(self.order, len(history))
+        while k > 0:
+            node = self.root
+            for symbol in history[len(history) - k:]:
+                node = node.children.get(symbol)
+                if node is None:
+                    break
+            else:
+                return node
+            k -= 1
+        return self.root
+
+    def update(self, symbol, context):
+        """
+        Conta symbol (id) no contexto atual e em todos os seus sufixos, até k=0,
+        e cria os contextos seguintes.
+
+        Args:
+            symbol (int): Id do símbolo.
+            context (ContextNode): Contexto atual (root no início do texto).
+
+        Returns:
+            ContextNode: Contexto seguinte, já incluindo symbol.
+        """
         # Atualiza k=-1
         if symbol not in self.seen_symbols:
             self.seen_symbols.add(symbol)
-            self.k0_unique_symbols += 1  # Incrementa contador de símbolos únicos
+            self.unseen.remove(symbol)
 
-        # Atualiza k=0
-        if symbol not in self.k0_frequencies:
-            self.k0_frequencies[symbol] = 0
-        self.k0_frequencies[symbol] += 1
+        # Atualiza k=order, ..., k=1, k=0 e cria os filhos (contextos seguintes)
+        node = context
+        previous = None
+        next_context = self.root
+        while node is not None:
+            symbols = node.symbols
+            if node.mask >> symbol & 1:
+                counts = node.counts
+                i = symbols.index(symbol)
+                count = counts[i]
+                counts[i] = count + 1
+                node.entropy_sum += DELTAS_ENTROPIA[count] if count < 1024 else delta_entropia(count)
+            else:
+                symbols.append(symbol)
+                node.counts.append(1)
+                node.mask |= 1 << symbol
+                self.entry_count += 1
+            node.total += 1
+            if node.total > self.rescale_threshold:
+                self.rescale(node)
 
-        # Atualiza k=1, k=2, ..., k=order
-        for k in range(1, self.order + 1):
-            if len(history) >= k:
-                context = "".join(history[-k:])  # Contexto de tamanho k
-                if context not in self.contexts[k]:
-                    self.contexts[k][context] = {'symbols': set(), 'frequencies': {}}
+            if node.children is not None:
+                child = node.children.get(symbol)
+                if child is None:
+                    child = self.new_child(node, symbol)
+                    if child is None:
+                        node = node.suffix
+                        continue
+                # O sufixo do filho mais profundo é o filho do nó seguinte
+                if previous is not None:
+                    if previous.suffix is None:
+                        previous.suffix = child
+                else:
+                    next_context = child
+                previous = child
+            node = node.suffix
+
+        if (self.max_nodes is not None or self.max_bytes is not None) and self.over_budget():
+            next_context = self.enforce_budget(next_context)
+        return next_context
+
+    def new_child(self, node, symbol):
+        """
+        Cria o filho symbol de node (o contexto estendido), chamado por update
+        quando ele ainda não existe; o sufixo do filho é ligado por update.
+
+        Returns:
+            ContextNode: O novo nó, ou None se o modelo estiver congelado.
+        """
+        if self.frozen:
+            return None
+        child = self.node_class(node.depth + 1, self.root if node is self.root else None,
+                                self.typecode, node.depth + 1 == self.order)
+        node.children[symbol] = child
+        self.node_count += 1
+        if self.instrumentation is not None:
+            created = self.instrumentation.contexts_created
+            created[child.depth] = created.get(child.depth, 0) + 1
+        return child
+
+    def train(self, text, context=None):
+        """
+        Atualiza o modelo com text (str) como se ele tivesse sido codificado,
+        para gerar um modelo pré-treinado (ver arquivo_utils.escrever_snapshot).
+
+        Returns:
+            ContextNode: Contexto após o último símbolo.
+
+        Raises:
+            ValueError: Se o texto tiver um símbolo fora do alfabeto.
+        """
+        context = self.root if context is None else context
+        symbol_ids = self.symbol_ids
+        for symbol in text:
+            if symbol not in symbol_ids:
+                raise ValueError(f"Símbolo fora do alfabeto: {symbol!r}")
+            context = self.update(symbol_ids[symbol], context)
+        return context
+
+    def to_arrays(self):
+        """
+        Achata a árvore em arrays, com os nós em ordem de largura (a raiz é o
+        nó 0): pai e símbolo de cada nó além da raiz, número de símbolos de
+        cada nó e os símbolos e contagens de todos os nós, concatenados.
+
+        Returns:
+            tuple: (parents, edges, sizes, symbols, counts).
+        """
+        parents = array('I')
+        edges = array(self.typecode)
+        sizes = array('I')
+        symbols = array(self.typecode)
+        counts = array('I')
+        nodes = [self.root]
+        i = 0
+        while i < len(nodes):
+            node = nodes[i]
+            sizes.append(len(node.symbols))
+            symbols.extend(node.symbols)
+            counts.extend(node.counts)
+            if node.children:
+                for symbol, child in node.children.items():
+                    parents.append(i)
+                    edges.append(symbol)
+                    nodes.append(child)
+            i += 1
+        return parents, edges, sizes, symbols, counts
+
+    @classmethod
+    def from_arrays(cls, alphabet, order, params, frozen, parents, edges, sizes, symbols, counts):
+        """
+        Reconstrói um modelo a partir dos arrays de to_arrays. Os sufixos não
+        são gravados: o sufixo do filho s de um nó é o filho s do sufixo do nó,
+        já criado porque os nós estão em ordem de largura.
+        """
+        model = cls(alphabet, order, **params)
+        root = model.root
+        nodes = [root]
+        new = ContextNode.__new__
+        for parent, symbol in zip(parents, edges):
+            parent = nodes[parent]
+            # Os arrays de cada nó são preenchidos abaixo, sem passar por __init__
+            child = new(ContextNode)
+            child.depth = parent.depth + 1
+            child.suffix = root if parent is root else parent.suffix.children[symbol]
+            child.children = None if child.depth == order else {}
+            child.table = None
+            parent.children[symbol] = child
+            nodes.append(child)
+
+        inicio = 0
+        for node, size in zip(nodes, sizes):
+            fim = inicio + size
+            node.symbols = symbols[inicio:fim]
+            node.counts = counts[inicio:fim]
+            node.total = sum(node.counts)
+            node.entropy_sum = entropy_sum(node.counts)
+            mask = 0
+            for symbol in node.symbols:
+                mask |= 1 << symbol
+            node.mask = mask
+            inicio = fim
 
-                if symbol not in self.contexts[k][context]['symbols']:
-                    self.contexts[k][context]['symbols'].add(symbol)
+        model.seen_symbols = set(root.symbols)
+        model.unseen = [i for i in range(len(model.symbols)) if i not in model.seen_symbols]
+        model.node_count = len(nodes)
+        model.entry_count = len(symbols)
+        model.frozen = frozen
+        return model
 
-                if symbol not in self.contexts[k][context]['frequencies']:
-                    self.contexts[k][context]['frequencies'][symbol] = 0
-                self.contexts[k][context]['frequencies'][symbol] += 1
+    def rescale(self, node):
+        """Divide as contagens de node por dois, mantendo todos os símbolos."""
+        if self.instrumentation is not None:
+            self.instrumentation.rescales += 1
+        counts = node.counts
+        for i in range(len(counts)):
+            counts[i] = (counts[i] + 1) >> 1
+        node.total = sum(counts)
+        node.entropy_sum = entropy_sum(counts)
+
+    def enforce_budget(self, context):
+        """
+        Aplica a política de memória e retorna o contexto atual válido.
+        """
+        if self.instrumentation is not None:
+            self.instrumentation.budget_events += 1
+        if self.policy == 'restart':
+            self.restarts += 1
+            self.reset()
+            return self.root
+        if self.policy == 'freeze':
+            self.frozen = True
+            return context
+
+        # 'prune': remove contextos com contagem total até threshold, dobrando
+        # threshold até ficar com no máximo metade do orçamento
+        threshold = 1
+        while True:
+            context = self.prune(threshold, context)
+            if self.node_count == 1 or not self._above_half_budget():
+                return context
+            threshold *= 2
+
+    def _above_half_budget(self):
+        if self.max_nodes is not None and self.node_count > self.max_nodes // 2:
+            return True
+        return self.max_bytes is not None and self.estimated_bytes > self.max_bytes // 2
+
+    def prune(self, threshold, context=None):
+        """
+        Remove os contextos (k >= 1) com contagem total até threshold, junto com
+        os contextos mais longos que dependem deles (filhos, ou contextos cujo
+        sufixo foi removido). Percorre a árvore por nível: o sufixo de um nó
+        está sempre no nível anterior, já decidido.
+
+        Returns:
+            ContextNode: O sufixo mais longo de context que foi mantido.
+        """
+        chain = set()  # Sufixos do contexto atual
+        node = context
+        while node is not None:
+            chain.add(node)
+            node = node.suffix
+
+        new_context = self.root
+        level = [self.root]
+        node_count = 1
+        entry_count = len(self.root.symbols)
+        table_count = table_entries = 0
+        while level:
+            kept = set(level)
+            next_level = []
+            for node in level:
+                if node.table is not None:
+                    table_count += 1
+                    table_entries += len(node.table.frequencies)
+                if not node.children:
+                    continue
+                for symbol, child in list(node.children.items()):
+                    if child.total <= threshold or child.suffix not in kept:
+                        del node.children[symbol]
+                        continue
+                    next_level.append(child)
+                    node_count += 1
+                    entry_count += len(child.symbols)
+                    if child in chain:
+                        new_context = child  # Os níveis são visitados em ordem crescente
+            level = next_level
+        self.node_count = node_count
+        self.entry_count = entry_count
+        self.table_count = table_count
+        self.table_entries = table_entries
+        return new_context
+
+    def coding_frequencies(self, node, excluded=0):
+        """
+        Frequências usadas para codificar no contexto node, excluindo os
+        símbolos da máscara excluded (os já vistos nos contextos de ordem
+        superior percorridos antes do escape). Inclui o escape (contagem =
+        símbolos distintos) se ainda houver símbolos fora de node e de excluded.
+
+        Returns:
+            dict: {id: contagem}, vazio se não restar nenhum símbolo.
+        """
+        mask = node.mask & ~excluded
+        if not mask:
+            return {}
+        if mask == node.mask:
+            frequencies = dict(zip(node.symbols, node.counts))
+        else:
+            frequencies = {s: c for s, c in zip(node.symbols, node.counts) if mask >> s & 1}
+
+        if excluded | mask != self.full_mask:
+            frequencies[self.escape] = len(frequencies)
+        return frequencies
+
+    def context_entropy(self, node):
+        """
+        Entropia (bits/símbolo) da distribuição de codificação de node sem
+        exclusão (coding_frequencies(node)), com o escape se houver símbolos
+        fora de node. Usa node.entropy_sum: O(1), sem percorrer as contagens.
+        """
+        escape = len(node.symbols) if node.mask != self.full_mask else 0
+        total = node.total + escape
+        soma = node.entropy_sum + (escape * math.log2(escape) if escape else 0.0)
+        return math.log2(total) - soma / total
+
+    def stale_table(self, node, excluded, interval, build):
+        """
+        Tabela de codificação de node, com a exclusão excluded, no modo de
+        reconstrução periódica.
+
+        Cada nó guarda a sua tabela sem exclusão (em node.table), que é
+        reconstruída quando node.total cresce interval desde a construção,
+        quando dobra (contextos novos mudam rápido) ou quando diminui
+        (reescala); no intervalo, a tabela antiga é usada. Como o critério
+        depende só das contagens, o decodificador reconstrói as tabelas nos
+        mesmos pontos.
+
+        Tabelas com exclusão quase nunca se repetem e não são guardadas, nem
+        as dos contextos com total menor que interval, que mudariam logo:
+        essas são montadas a cada uso, como sem reconstrução periódica. As
+        tabelas guardadas entram em estimated_bytes, de modo que o orçamento
+        de memória vale também para elas, e com o modelo congelado só as que
+        já existem são reconstruídas.
+
+        Args:
+            node (ContextNode): Contexto com contagens.
+            excluded (int): Máscara das tabelas já percorridas.
+            interval (int): Crescimento de node.total entre reconstruções.
+            build (callable): Prepara a tabela do backend a partir das
+                frequências (ex.: backend.table).
+
+        Returns:
+            StaleTable: A tabela atual, com coding None se não restar símbolo.
+        """
+        table = node.table
+        total = node.total
+        if excluded or table is None or total - table.total >= interval or total >= 2 * table.total \
+                or total < table.total:
+            frequencies = self.coding_frequencies(node, excluded)
+            coding = build(frequencies) if frequencies else None
+            if excluded:
+                return StaleTable(coding, frequencies, node.mask & ~excluded, total)
+            new = StaleTable(coding, frequencies, node.mask, total, self.context_entropy(node))
+            if table is not None:
+                self.table_entries += len(frequencies) - len(table.frequencies)
+                node.table = new
+            elif total >= interval and not self.frozen:
+                self.table_count += 1
+                self.table_entries += len(frequencies)
+                node.table = new
+            table = new
+        return table
+
+    def unseen_symbols(self):
+        """
+        Ids ainda não vistos (k=-1), em ordem. É a lista mantida por update
+        (não deve ser alterada), de modo que k=-1 não percorre o alfabeto.
+        """
+        return self.unseen
+
+    def unseen_index(self, symbol):
+        """Posição de symbol (não visto) em unseen_symbols, por busca binária."""
+        return bisect.bisect_left(self.unseen, symbol)
+
+    def iter_contexts(self):
+        """Percorre a árvore gerando (contexto como str, nó) de cada contexto com contagens."""
+        stack = [("", self.root)]
+        while stack:
+            context, node = stack.pop()
+            if node.symbols:
+                yield context, node
+            if node.children:
+                for symbol, child in node.children.items():
+                    stack.append((context + self.symbols[symbol], child))
 
     def get_context_data(self, history):
-        context_data = {}
-        for k in range(self.order, 0, -1):
-            if len(history) >= k:
-                context = "".join(history[-k:])
-                if context in self.contexts[k]:
-                    context_data['context'] = context
-                    context_data['symbols'] = self.contexts[k][context]['frequencies']
-                    return context_data
+        node = self.find_context(history)
+        while node is not None and node.depth > 0:
+            if node.symbols:
+                return {
+                    'context': "".join(self.symbols[s] for s in history[len(history) - node.depth:]),
+                    'symbols': {self.symbols[s]: c for s, c in zip(node.symbols, node.counts)},
+                }
+            node = node.suffix
         return None  # Retorna None se não encontrar contexto
 
     def print_tables(self, history):
         context_data = self.get_context_data(history)
+        contexts = {k: {} for k in range(1, self.order + 1)}
+        for context, node in self.iter_contexts():
+            if node.depth > 0:
+                contexts[node.depth][context] = node
 
         # Imprime tabelas k=order, k=order-1, ..., k=1
         for k in range(self.order, 0, -1):
             print(f"\n=== Contextos de Ordem {k} (k={k}) ===")
             print("Contexto   Simb.   Cont.   Prob.")
-            for context in sorted(self.contexts[k].keys()):
-                frequencies = self.contexts[k][context]['frequencies']
-                unique_symbols = len(self.contexts[k][context]['symbols'])
-                total = sum(frequencies.values())
+            for context in sorted(contexts[k].keys()):
+                node = contexts[k][context]
+                unique_symbols = len(node.symbols)
+                total = sum(node.counts)
 
-                for symbol, count in sorted(frequencies.items()):
+                for symbol, count in sorted((self.symbols[s], c) for s, c in zip(node.symbols, node.counts)):
                     prob = count / (total + unique_symbols)
                     print(f"{context:<10} {symbol:<6} {count:<6} {prob:.4f}")
                 print(f"{context:<10} esc    {unique_symbols:<6} {unique_symbols / (total + unique_symbols):.4f}")
@@ -66,89 +560,219 @@ class PPMModel:
         # Imprime tabela k=0
         print("\n=== Frequências de Ordem 0 (k=0) ===")
         print("Simb.   Cont.   Prob.")
-        total = sum(self.k0_frequencies.values())
-        if total + self.k0_unique_symbols > 0:
-            for symbol, count in sorted(self.k0_frequencies.items()):
-                prob = count / (total + self.k0_unique_symbols)
+        total = sum(self.root.counts)
+        unique_symbols = len(self.root.symbols)
+        if total + unique_symbols > 0:
+            for symbol, count in sorted((self.symbols[s], c) for s, c in zip(self.root.symbols, self.root.counts)):
+                prob = count / (total + unique_symbols)
                 print(f"{symbol:<6} {count:<6} {prob:.4f}")
             # Verifica se todos os símbolos foram vistos
             if len(self.seen_symbols) < len(self.alphabet):  # Apenas exibe 'esc' se nem todos os símbolos foram vistos
-                print(f"esc    {self.k0_unique_symbols:<6} {self.k0_unique_symbols / (total + self.k0_unique_symbols):.4f}")
+                print(f"esc    {unique_symbols:<6} {unique_symbols / (total + unique_symbols):.4f}")
         else:
-            print(f"esc    {self.k0_unique_symbols:<6} 0.0000")
+            print(f"esc    {unique_symbols:<6} 0.0000")
 
         # Imprime tabela k=-1
         print("\n=== Símbolos Não Vistos (k=-1) ===")
         print("Simb.   Prob.")
-        unseen = self.alphabet - self.seen_symbols
+        unseen = self.unseen_symbols()
         if unseen:
             prob = 1.0 / len(unseen)
-            for symbol in sorted(unseen):
-                print(f"{symbol:<6} {prob:.4f}")
+            for symbol in unseen:
+                print(f"{self.symbols[symbol]:<6} {prob:.4f}")
         else:
             print("(Todos os símbolos já foram vistos)")
 
         return context_data
-    def calculate_entropy(self, history):
+    def calculate_entropy(self, context):
         """Calcula a entropia para o contexto atual em bits/símbolo"""
-        for k in range(self.order, -2, -1):
-            if k >= 0:
-                if k > 0:
-                    if len(history) < k:
-                        continue
-                    context = "".join(history[-k:])
-                    if context not in self.contexts[k]:
-                        continue
-                    frequencies = self.contexts[k][context]['frequencies'].copy()
-                    unique_symbols = len(self.contexts[k][context]['symbols'])
-                    total = sum(frequencies.values())
-                    
-                    # Aplica exclusão
-                    if k < self.order and len(history) >= k + 1:
-                        higher_context = "".join(history[-(k + 1):])
-                        if higher_context in self.contexts[k + 1]:
-                            seen_higher = self.contexts[k + 1][higher_context]['symbols']
-                            frequencies = {s: f for s, f in frequencies.items() if s not in seen_higher}
-                            unique_symbols = len(set(frequencies.keys()))
-                            total = sum(frequencies.values())
-                else:
-                    # k = 0
-                    frequencies = self.k0_frequencies.copy()
-                    unique_symbols = self.k0_unique_symbols
-                    total = sum(frequencies.values())
-                    
-                    # Aplica exclusão
-                    if self.order > 0 and len(history) >= 1:
-                        higher_context = history[-1]
-                        if higher_context in self.contexts[1]:
-                            seen_higher = self.contexts[1][higher_context]['symbols']
-                            frequencies = {s: f for s, f in frequencies.items() if s not in seen_higher}
-                            unique_symbols = len(set(frequencies.keys()))
-                            total = sum(frequencies.values())
-
+        # Percorre os contextos de k=order até k=0 pelos sufixos
+        node = context
+        excluded = 0
+        while node is not None:
+            if node.symbols:
+                frequencies = self.coding_frequencies(node, excluded)
                 if frequencies:
-                    denominator = total + unique_symbols
-                    if denominator == 0:
-                        continue
-                        
+                    denominator = sum(frequencies.values())
                     entropy = 0.0
-                    # Probabilidades dos símbolos conhecidos
-                    for symbol, count in frequencies.items():
+                    # Probabilidades dos símbolos conhecidos (e do escape, se houver)
+                    for count in frequencies.values():
                         prob = count / denominator
-                        if prob > 0:
-                            entropy -= prob * math.log2(prob)
-                    
-                    # Probabilidade do escape (se aplicável)
-                    if unique_symbols > 0 and len(frequencies) < len(self.alphabet):
-                        prob_esc = unique_symbols / denominator
-                        entropy -= prob_esc * math.log2(prob_esc)
-                    
+                        entropy -= prob * math.log2(prob)
                     return entropy
-            
-            else:  # k = -1 (símbolos não vistos)
-                unseen = self.alphabet - self.seen_symbols
-                if unseen:
-                    prob = 1.0 / len(unseen)
-                    return -math.log2(prob)  # Todos têm a mesma probabilidade
-        
+            excluded |= node.mask
+            node = node.suffix
+
+        # k = -1 (símbolos não vistos)
+        unseen = self.unseen_symbols()
+        if unseen:
+            prob = 1.0 / len(unseen)
+            return -math.log2(prob)  # Todos têm a mesma probabilidade
+
         return 0.0  # Caso padrão
+
+
+def entropy_sum(counts):
+    """Soma de c*log2(c) das contagens (ver ContextNode.entropy_sum)."""
+    return sum(count * math.log2(count) for count in counts if count > 1)
+
+def overlay_supported(params):
+    """Se um modelo com os parâmetros params pode ser base de um OverlayModel (sem 'prune' com orçamento)."""
+    return not (params.get('policy') == 'prune' and (params.get('max_nodes') is not None
+                                                     or params.get('max_bytes') is not None))
+
+class FlatModel:
+    """
+    Modelo pré-treinado em arrays planos, somente leitura, usado como base
+    de OverlayModel (ver arquivo_utils.ModelSnapshot e
+    modelo_compartilhado.SharedModel).
+
+    Os nós estão em ordem de largura (a raiz é o nó 0). Cada nó tem o seu
+    total, o início dos seus símbolos em symbols e counts (symbol_starts) e
+    o início dos seus filhos em child_nodes e child_symbols (child_starts),
+    com os filhos ordenados por símbolo para a busca binária. Os arrays podem
+    ser array ou memoryview (ex.: de um segmento de memória compartilhada).
+
+    Args:
+        alphabet (iterable): Alfabeto do modelo.
+        order (int): Ordem do modelo.
+        params (dict): Parâmetros do PPMModel (ver PPMModel.params).
+        frozen (bool): Se o modelo estava congelado.
+        totals, symbol_starts, child_starts, child_nodes, symbols, counts,
+            child_symbols: Arrays do modelo (ver arrays).
+    """
+    def __init__(self, alphabet, order, params, frozen, totals, symbol_starts, child_starts, child_nodes,
+                 symbols, counts, child_symbols):
+        self.alphabet = set(alphabet)
+        self.order = order
+        self.params = params
+        self.frozen = frozen
+        self.typecode = PPMModel(alphabet, 0).typecode
+        self.totals = totals
+        self.symbol_starts = symbol_starts
+        self.child_starts = child_starts
+        self.child_nodes = child_nodes
+        self.symbols = symbols
+        self.counts = counts
+        self.child_symbols = child_symbols
+        self.node_count = len(totals)
+        self.entry_count = len(symbols)
+
+    @classmethod
+    def from_arrays(cls, alphabet, order, params, frozen, parents, edges, sizes, symbols, counts):
+        """Monta os arrays a partir dos de PPMModel.to_arrays (ver PPMModel.from_arrays)."""
+        node_count = len(sizes)
+        symbol_starts = array('I', itertools.accumulate(sizes, initial=0))
+        totals = array('I', (sum(counts[symbol_starts[i]:symbol_starts[i + 1]]) for i in range(node_count)))
+        # Os filhos de cada nó são consecutivos (ordem de largura): só a ordem muda
+        child_starts = array('I', [0]) * (node_count + 1)
+        for parent in parents:
+            child_starts[parent + 1] += 1
+        for i in range(node_count):
+            child_starts[i + 1] += child_starts[i]
+        child_symbols = array(edges.typecode)
+        child_nodes = array('I')
+        for i in range(node_count):
+            inicio, fim = child_starts[i], child_starts[i + 1]
+            for symbol, child in sorted(zip(edges[inicio:fim], range(inicio + 1, fim + 1))):
+                child_symbols.append(symbol)
+                child_nodes.append(child)
+        return cls(alphabet, order, params, frozen, totals, symbol_starts, child_starts, child_nodes,
+                   symbols, counts, child_symbols)
+
+    @property
+    def arrays(self):
+        """Os arrays, na ordem dos argumentos de __init__."""
+        return (self.totals, self.symbol_starts, self.child_starts, self.child_nodes, self.symbols,
+                self.counts, self.child_symbols)
+
+    def child(self, index, symbol):
+        """Índice do filho symbol do nó index, ou None se não existir."""
+        inicio, fim = self.child_starts[index], self.child_starts[index + 1]
+        j = bisect.bisect_left(self.child_symbols, symbol, inicio, fim)
+        if j < fim and self.child_symbols[j] == symbol:
+            return self.child_nodes[j]
+        return None
+
+    def node(self, index, depth, suffix):
+        """Cópia privada (OverlayNode) do nó index, com as suas contagens."""
+        inicio, fim = self.symbol_starts[index], self.symbol_starts[index + 1]
+        node = OverlayNode.__new__(OverlayNode)
+        node.symbols = array(self.typecode)
+        node.symbols.frombytes(memoryview(self.symbols)[inicio:fim].cast('B'))
+        node.counts = array('I')
+        node.counts.frombytes(memoryview(self.counts)[inicio:fim].cast('B'))
+        mask = 0
+        for symbol in node.symbols:
+            mask |= 1 << symbol
+        node.mask = mask
+        node.total = self.totals[index]
+        node.entropy_sum = entropy_sum(node.counts)
+        node.children = None if depth == self.order else {}
+        node.suffix = suffix
+        node.depth = depth
+        node.table = None
+        node.base = index
+        return node
+
+    def model(self):
+        """Novo OverlayModel sobre este modelo (um por documento)."""
+        return OverlayModel(self)
+
+class OverlayNode(ContextNode):
+    """ContextNode de um OverlayModel; base é o índice do nó no FlatModel (None se for novo)."""
+    __slots__ = ('base',)
+
+    def __init__(self, depth, suffix, typecode, leaf):
+        super().__init__(depth, suffix, typecode, leaf)
+        self.base = None
+
+class OverlayModel(PPMModel):
+    """
+    PPMModel que usa um FlatModel como camada base, somente leitura.
+
+    Os nós só são copiados da base (com as suas contagens) quando o texto
+    chega a eles, e a partir daí são atualizados normalmente; contextos que
+    não existem na base são criados como no PPMModel. Criar o modelo não
+    custa nada além da raiz, e a memória privada é a dos contextos visitados
+    pelo documento. As decisões são as mesmas do modelo completo de
+    PPMModel.from_arrays: node_count e entry_count contam também os nós da
+    base, para que o orçamento de memória seja aplicado nos mesmos pontos.
+    Depois de um 'restart' o modelo recomeça vazio, sem a base.
+
+    Args:
+        flat (FlatModel): Modelo base.
+
+    Raises:
+        ValueError: Se o modelo usar a política 'prune' com orçamento, que
+            precisaria percorrer a base inteira (ver overlay_supported).
+    """
+    node_class = OverlayNode
+
+    def __init__(self, flat):
+        if not overlay_supported(flat.params):
+            raise ValueError("A política 'prune' com orçamento requer o modelo completo.")
+        self.flat = flat
+        super().__init__(flat.alphabet, flat.order, **flat.params)
+
+    def reset(self):
+        super().reset()
+        if self.restarts:
+            self.flat = None  # 'restart': a base também é descartada
+            return
+        flat = self.flat
+        self.root = flat.node(0, 0, None)
+        self.seen_symbols = set(self.root.symbols)
+        self.unseen = [i for i in range(len(self.symbols)) if i not in self.seen_symbols]
+        self.node_count = flat.node_count
+        self.entry_count = flat.entry_count
+        self.frozen = flat.frozen
+
+    def new_child(self, node, symbol):
+        if self.flat is not None and node.base is not None:
+            index = self.flat.child(node.base, symbol)
+            if index is not None:
+                child = self.flat.node(index, node.depth + 1, self.root if node is self.root else None)
+                node.children[symbol] = child
+                return child
+        return super().new_child(node, symbol)
@@ -1,3 +1,27 @@
+import codecs
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from PPM import FlatModel, PPMModel, overlay_supported
+
+CHUNK_SIZE = 65536  # Tamanho padrão dos blocos de entrada do modo streaming
+BLOCK_SIZE = 1 << 20  # Tamanho padrão dos blocos independentes do modo em blocos
+
+MAGIC = b"PPMH"  # Fluxo em quadros (compress_stream)
+MAGIC_BLOCOS = b"PPMB"  # Contêiner de blocos independentes (compress_blocks)
+MAGIC_SNAPSHOT = b"PPMS"  # Modelo pré-treinado (escrever_snapshot)
+MAGIC_SEMIESTATICO = b"PPMT"  # Tabelas fixas e blocos (semi_estatico.compress_semistatic)
+MAGIC_PALAVRAS = b"PPMW"  # Fluxo do modo de palavras (palavras.compress_tokens)
+VERSION = 3  # 3: códigos Huffman com comprimento limitado (huffman.MAX_CODE_LENGTH)
+
+ENTRADA_INDICE = struct.Struct("<QQQI")  # Deslocamento, tamanho, símbolos, CRC-32
+RODAPE = struct.Struct("<QQI4s")  # Deslocamento do índice, número de blocos, CRC-32, assinatura
+TAMANHOS_SNAPSHOT = struct.Struct("<QQB")  # Nós, símbolos contados, modelo congelado
+
 def escrever_byte(arquivo, bits):
     """
     Escreve um byte (8 bits) no arquivo.
@@ -38,4 +62,432 @@ def ler_byte(arquivo):
     if not byte:
         return None  # Fim do arquivo
 
-    return bin(byte[0])[2:].zfill(8)
\ No newline at end of file
+    return bin(byte[0])[2:].zfill(8)
+
+class BitWriter:
+    """
+    Escritor de bits sobre um acumulador inteiro.
+
+    Os códigos são recebidos como pares (valor, comprimento) e acumulados em um
+    inteiro; os bytes completos vão para um bytearray, gravado no arquivo em
+    blocos de block_size bytes.
+
+    Args:
+        arquivo (file): Objeto de arquivo aberto para escrita binária.
+        block_size (int): Tamanho do bloco gravado de cada vez.
+    """
+    def __init__(self, arquivo, block_size=65536):
+        self.arquivo = arquivo
+        self.block_size = block_size
+        self.buffer = bytearray()
+        self.acc = 0  # Bits pendentes (menos de 64 entre chamadas)
+        self.nbits = 0
+        self.bytes_flushed = 0
+
+    @property
+    def bit_count(self):
+        """Total de bits escritos até agora."""
+        return (self.bytes_flushed + len(self.buffer)) * 8 + self.nbits
+
+    def write(self, value, length):
+        """Escreve os length bits menos significativos de value."""
+        self.acc = (self.acc << length) | value
+        self.nbits += length
+        if self.nbits >= 64:
+            self._drain()
+
+    def _drain(self):
+        # Move os bytes completos do acumulador para o buffer
+        nbytes = self.nbits >> 3
+        rest = self.nbits & 7
+        self.buffer += (self.acc >> rest).to_bytes(nbytes, byteorder='big')
+        self.acc &= (1 << rest) - 1
+        self.nbits = rest
+        if len(self.buffer) >= self.block_size:
+            self._write_buffer()
+
+    def _write_buffer(self):
+        self.arquivo.write(self.buffer)
+        self.bytes_flushed += len(self.buffer)
+        self.buffer = bytearray()
+
+    def flush(self):
+        """Grava os bits pendentes, completando o último byte com zeros."""
+        self._drain()
+        if self.nbits:
+            self.buffer.append((self.acc << (8 - self.nbits)) & 0xFF)
+            self.acc = 0
+            self.nbits = 0
+        if self.buffer:
+            self._write_buffer()
+
+
+class BitReader:
+    """
+    Leitor de bits sobre um acumulador inteiro.
+
+    O arquivo é lido em blocos de block_size bytes e consumido por uma
+    memoryview, até 8 bytes por vez. Após o fim do arquivo, os bits lidos são
+    completados com zeros (como em escrever_bits_restantes).
+
+    Args:
+        arquivo (file): Objeto de arquivo aberto para leitura binária.
+        block_size (int): Tamanho do bloco lido de cada vez.
+    """
+    def __init__(self, arquivo, block_size=65536):
+        self.arquivo = arquivo
+        self.block_size = block_size
+        self.buffer = memoryview(b"")
+        self.index = 0
+        self.acc = 0  # Contém exatamente nbits bits ainda não consumidos
+        self.nbits = 0
+        self.padding = 0  # Zeros acrescentados após o fim do arquivo
+
+    @property
+    def exhausted(self):
+        """Indica se já foram consumidos bits além do fim do arquivo."""
+        return self.nbits < self.padding
+
+    def _fill(self, n):
+        # Garante ao menos n bits no acumulador
+        while self.nbits < n:
+            if self.index >= len(self.buffer):
+                data = self.arquivo.read(self.block_size)
+                if not data:
+                    missing = n - self.nbits
+                    self.acc <<= missing
+                    self.nbits = n
+                    self.padding += missing
+                    return
+                self.buffer = memoryview(data)
+                self.index = 0
+            chunk = self.buffer[self.index:self.index + 8]
+            self.acc = (self.acc << (len(chunk) * 8)) | int.from_bytes(chunk, byteorder='big')
+            self.nbits += len(chunk) * 8
+            self.index += len(chunk)
+
+    def peek(self, n):
+        """Retorna os próximos n bits sem consumi-los."""
+        if self.nbits < n:
+            self._fill(n)
+        return self.acc >> (self.nbits - n)
+
+    def skip(self, n):
+        """Consome n bits já disponíveis (após um peek)."""
+        self.nbits -= n
+        self.acc &= (1 << self.nbits) - 1
+
+    def read(self, n):
+        """Lê e consome os próximos n bits."""
+        if self.nbits < n:
+            self._fill(n)
+        self.nbits -= n
+        value = self.acc >> self.nbits
+        self.acc &= (1 << self.nbits) - 1
+        return value
+
+
+def alfabeto_binario(alphabet):
+    """Se alphabet é de bytes (inteiros de 0 a 255), como no modo binário."""
+    return all(isinstance(simbolo, int) for simbolo in alphabet)
+
+def escrever_cabecalho(arquivo, order, alphabet, params=None, magic=MAGIC):
+    """
+    Escreve o cabeçalho do arquivo comprimido: assinatura, versão, ordem,
+    alfabeto e os demais parâmetros do modelo (em JSON). Um alfabeto de
+    bytes é gravado com os próprios bytes e marcado com 'bytes' nos
+    parâmetros.
+
+    Args:
+        arquivo (file): Objeto de arquivo aberto para escrita binária.
+        order (int): Ordem do modelo PPM.
+        alphabet (iterable): Símbolos do alfabeto.
+        params (dict): Parâmetros que o decodificador precisa reproduzir.
+        magic (bytes): Assinatura do formato (MAGIC ou MAGIC_BLOCOS).
+
+    Returns:
+        bytes: O cabeçalho escrito.
+    """
+    if alfabeto_binario(alphabet):
+        simbolos = bytes(sorted(alphabet))
+        params = dict(params or {}, bytes=True)
+    else:
+        simbolos = "".join(sorted(alphabet)).encode('utf-8')
+    parametros = json.dumps(params or {}, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    cabecalho = (struct.pack("<4sBBH", magic, VERSION, order, len(simbolos)) + simbolos
+                 + struct.pack("<H", len(parametros)) + parametros)
+    arquivo.write(cabecalho)
+    return cabecalho
+
+def ler_cabecalho(arquivo, magic=MAGIC):
+    """
+    Lê o cabeçalho escrito por escrever_cabecalho.
+
+    Args:
+        arquivo (file): Objeto de arquivo aberto para leitura binária.
+        magic (bytes): Assinatura esperada.
+
+    Returns:
+        tuple: (ordem, alfabeto como set, de str ou de int, parâmetros como dict).
+
+    Raises:
+        ValueError: Se o cabeçalho estiver truncado ou não for reconhecido.
+    """
+    cabecalho = arquivo.read(8)
+    if len(cabecalho) != 8:
+        raise ValueError("Cabeçalho inválido.")
+    assinatura, version, order, tamanho = struct.unpack("<4sBBH", cabecalho)
+    if assinatura != magic or version != VERSION:
+        raise ValueError("Formato de arquivo não reconhecido.")
+    simbolos = arquivo.read(tamanho)
+    tamanho_parametros = arquivo.read(2)
+    if len(simbolos) != tamanho or len(tamanho_parametros) != 2:
+        raise ValueError("Cabeçalho inválido.")
+    tamanho, = struct.unpack("<H", tamanho_parametros)
+    parametros = arquivo.read(tamanho)
+    if len(parametros) != tamanho:
+        raise ValueError("Cabeçalho inválido.")
+    parametros = json.loads(parametros)
+    if parametros.pop('bytes', False):
+        return order, set(simbolos), parametros
+    return order, set(simbolos.decode('utf-8')), parametros
+
+def escrever_quadro(arquivo, num_simbolos, dados):
+    """
+    Escreve um quadro do fluxo: número de símbolos, tamanho em bytes e os dados.
+    Um quadro com zero símbolos marca o fim do fluxo.
+    """
+    arquivo.write(struct.pack("<II", num_simbolos, len(dados)))
+    arquivo.write(dados)
+
+def ler_quadro(arquivo):
+    """
+    Lê um quadro escrito por escrever_quadro.
+
+    Returns:
+        tuple: (número de símbolos, dados), com zero símbolos no fim do fluxo.
+
+    Raises:
+        ValueError: Se o quadro estiver truncado.
+    """
+    cabecalho = arquivo.read(8)
+    if len(cabecalho) != 8:
+        raise ValueError("Fluxo truncado.")
+    num_simbolos, tamanho = struct.unpack("<II", cabecalho)
+    dados = arquivo.read(tamanho)
+    if len(dados) != tamanho:
+        raise ValueError("Fluxo truncado.")
+    return num_simbolos, dados
+
+def escrever_indice(arquivo, inicio, blocos, cabecalho):
+    """
+    Escreve o índice do contêiner de blocos e o rodapé que aponta para ele. O
+    rodapé guarda o CRC-32 do cabeçalho e do índice.
+
+    Args:
+        arquivo (file): Objeto de arquivo aberto para escrita binária.
+        inicio (int): Deslocamento do índice no arquivo.
+        blocos (list): Tuplas (deslocamento, tamanho, símbolos, CRC-32) de cada bloco.
+        cabecalho (bytes): Cabeçalho escrito no início do contêiner.
+    """
+    indice = b"".join(ENTRADA_INDICE.pack(*bloco) for bloco in blocos)
+    crc = zlib.crc32(indice, zlib.crc32(cabecalho))
+    arquivo.write(indice)
+    arquivo.write(RODAPE.pack(inicio, len(blocos), crc, MAGIC_BLOCOS))
+
+def ler_indice(arquivo):
+    """
+    Lê o índice do contêiner de blocos a partir do rodapé, conferindo o CRC-32
+    do cabeçalho e do índice (o arquivo precisa permitir seek).
+
+    Returns:
+        list: Tuplas (deslocamento, tamanho, símbolos, CRC-32) de cada bloco.
+
+    Raises:
+        ValueError: Se o rodapé ou o índice estiverem corrompidos.
+    """
+    arquivo.seek(0, os.SEEK_END)
+    fim = arquivo.tell()
+    if fim < RODAPE.size:
+        raise ValueError("Contêiner truncado.")
+    arquivo.seek(fim - RODAPE.size)
+    inicio, num_blocos, crc, assinatura = RODAPE.unpack(arquivo.read(RODAPE.size))
+    if assinatura != MAGIC_BLOCOS or inicio + num_blocos * ENTRADA_INDICE.size != fim - RODAPE.size:
+        raise ValueError("Índice de blocos inválido.")
+    arquivo.seek(inicio)
+    dados = arquivo.read(num_blocos * ENTRADA_INDICE.size)
+    blocos = list(ENTRADA_INDICE.iter_unpack(dados))
+
+    # O cabeçalho vai do início do arquivo até o primeiro bloco (ou o índice)
+    arquivo.seek(0)
+    cabecalho = arquivo.read(blocos[0][0] if blocos else inicio)
+    if zlib.crc32(dados, zlib.crc32(cabecalho)) != crc:
+        raise ValueError("CRC do cabeçalho ou do índice não confere.")
+    return blocos
+
+def escrever_snapshot(arquivo, model):
+    """
+    Grava um modelo pré-treinado em formato binário compacto: o cabeçalho de
+    escrever_cabecalho (com MAGIC_SNAPSHOT e os parâmetros do modelo), os
+    tamanhos, os arrays de PPMModel.to_arrays (little-endian) e o CRC-32 de
+    tudo o que vem antes.
+
+    Args:
+        arquivo (str | file): Caminho ou arquivo aberto para escrita binária.
+        model (PPMModel): Modelo treinado (ver PPMModel.train).
+
+    Returns:
+        int: CRC-32 do modelo gravado, que identifica o modelo nos arquivos
+            comprimidos com ele.
+    """
+    if isinstance(arquivo, (str, os.PathLike)):
+        with open(arquivo, 'wb') as destino:
+            return escrever_snapshot(destino, model)
+
+    arrays = model.to_arrays()
+    parents, edges, sizes, symbols, counts = arrays
+    crc = zlib.crc32(escrever_cabecalho(arquivo, model.order, model.alphabet, model.params,
+                                        MAGIC_SNAPSHOT))
+    partes = [TAMANHOS_SNAPSHOT.pack(len(sizes), len(symbols), model.frozen)]
+    for dados in arrays:
+        if sys.byteorder == 'big':
+            dados = array(dados.typecode, dados)
+            dados.byteswap()
+        partes.append(dados.tobytes())
+    for parte in partes:
+        crc = zlib.crc32(parte, crc)
+        arquivo.write(parte)
+    arquivo.write(struct.pack("<I", crc))
+    return crc
+
+class ModelSnapshot:
+    """
+    Modelo pré-treinado lido de um arquivo gravado por escrever_snapshot.
+
+    O arquivo é mapeado em memória, conferido pelo CRC-32 e lido de uma vez
+    para os arrays planos (arrays), dos quais sai o FlatModel (flat) com o
+    índice dos filhos de cada nó. Cada chamada de model() cria um
+    OverlayModel sobre ele, que só copia os nós que o texto visita: o custo
+    por mensagem não cresce com o modelo. Com a política 'prune' e
+    orçamento, que precisa da árvore inteira, flat é None e model() monta o
+    PPMModel completo. O codificador e o decodificador precisam usar o mesmo
+    modelo, identificado no cabeçalho comprimido por crc.
+
+    Args:
+        caminho (str): Arquivo do modelo.
+
+    Raises:
+        ValueError: Se o arquivo não for reconhecido ou estiver corrompido.
+    """
+    def __init__(self, caminho):
+        with open(caminho, 'rb') as arquivo, \
+                mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+            dados = memoryview(mapa)
+            try:
+                if len(dados) < 4:
+                    raise ValueError("Modelo pré-treinado truncado.")
+                self.crc, = struct.unpack_from("<I", dados, len(dados) - 4)
+                if zlib.crc32(dados[:-4]) != self.crc:
+                    raise ValueError("CRC do modelo pré-treinado não confere.")
+                self.order, self.alphabet, self.params = ler_cabecalho(mapa, MAGIC_SNAPSHOT)
+                posicao = mapa.tell()
+                num_nos, num_entradas, frozen = TAMANHOS_SNAPSHOT.unpack_from(dados, posicao)
+                posicao += TAMANHOS_SNAPSHOT.size
+                self.frozen = bool(frozen)
+
+                typecode = PPMModel(self.alphabet, self.order).typecode
+                self.arrays = []
+                for codigo, tamanho in (('I', num_nos - 1), (typecode, num_nos - 1), ('I', num_nos),
+                                        (typecode, num_entradas), ('I', num_entradas)):
+                    valores = array(codigo)
+                    fim = posicao + tamanho * valores.itemsize
+                    if fim > len(dados) - 4:
+                        raise ValueError("Modelo pré-treinado truncado.")
+                    valores.frombytes(dados[posicao:fim])
+                    if sys.byteorder == 'big':
+                        valores.byteswap()
+                    self.arrays.append(valores)
+                    posicao = fim
+            finally:
+                dados.release()
+        self.flat = None
+        if overlay_supported(self.params):
+            self.flat = FlatModel.from_arrays(self.alphabet, self.order, self.params, self.frozen,
+                                              *self.arrays)
+
+    def model(self):
+        """Novo PPMModel com as estatísticas do modelo pré-treinado."""
+        if self.flat is None:
+            return PPMModel.from_arrays(self.alphabet, self.order, self.params, self.frozen, *self.arrays)
+        return self.flat.model()
+
+def ler_blocos(origem, chunk_size=CHUNK_SIZE, use_mmap=False, binary=False):
+    """
+    Gera o texto de entrada em blocos de até chunk_size caracteres (ou bytes).
+
+    Args:
+        origem (str | file | iterable): Caminho, objeto de arquivo (texto ou
+            binário) ou iterável de blocos de texto de qualquer tamanho (ex.:
+            pre_processamento.preprocess_chunks), reagrupados em chunk_size.
+            Bytes são decodificados como UTF-8 de forma incremental, de modo que
+            caracteres divididos entre blocos são tratados corretamente.
+        chunk_size (int): Tamanho de cada bloco.
+        use_mmap (bool): Mapeia o arquivo em memória em vez de usar read();
+            requer um caminho ou um arquivo com fileno().
+        binary (bool): Gera os bytes sem decodificar (modo binário); os
+            blocos de um iterável devem ser bytes.
+
+    Returns:
+        iterator: Blocos (str | bytes) de texto.
+
+    Raises:
+        ValueError: Se chunk_size não for positivo (um read(0) pareceria o
+            fim da entrada).
+    """
+    if chunk_size < 1:
+        raise ValueError("O tamanho dos blocos deve ser positivo.")
+    return _ler_blocos(origem, chunk_size, use_mmap, binary)
+
+def _ler_blocos(origem, chunk_size, use_mmap, binary):
+    if isinstance(origem, (str, os.PathLike)):
+        with open(origem, 'rb') as arquivo:
+            yield from _ler_blocos(arquivo, chunk_size, use_mmap, binary)
+        return
+    if not hasattr(origem, 'read'):
+        buffer = b"" if binary else ""
+        for bloco in origem:
+            buffer += bloco
+            while len(buffer) >= chunk_size:
+                yield buffer[:chunk_size]
+                buffer = buffer[chunk_size:]
+        if buffer:
+            yield buffer
+        return
+
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    if use_mmap:
+        tamanho = os.fstat(origem.fileno()).st_size
+        if tamanho == 0:
+            return
+        with mmap.mmap(origem.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+            for inicio in range(0, tamanho, chunk_size):
+                bloco = mapa[inicio:inicio + chunk_size]
+                if not binary:
+                    bloco = decoder.decode(bloco)
+                if bloco:
+                    yield bloco
+    else:
+        while True:
+            bloco = origem.read(chunk_size)
+            if not bloco:
+                break
+            if isinstance(bloco, str):
+                if binary:
+                    raise ValueError("O modo binário requer uma entrada binária.")
+            elif not binary:
+                bloco = decoder.decode(bloco)
+            if bloco:
+                yield bloco
+    resto = decoder.decode(b"", final=True)
+    if resto:
+        yield resto
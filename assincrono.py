@@ -0,0 +1,302 @@
+import asyncio
+import codecs
+import io
+import itertools
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from arquivo_utils import alfabeto_binario, escrever_cabecalho, escrever_quadro, ler_cabecalho
+from ppm_huffman_decoder import PPMHuffmanDecoder
+from ppm_huffman_encoder import ALPHABET, PPMHuffmanTest
+
+BATCH_SIZE = 16384  # Bytes lidos (e símbolos codificados) por lote de uma sessão
+
+_sessoes = {}  # Codificadores e decodificadores das sessões abertas neste processo
+_ids = itertools.count()
+
+class SessionExecutor:
+    """
+    Executores onde as sessões assíncronas fazem a modelagem.
+
+    O modelo de cada sessão vive no processo que a executa, então uma sessão
+    usa sempre o mesmo executor: com processes, cada processo é um
+    ProcessPoolExecutor de um trabalhador e as sessões são distribuídas entre
+    eles em rodízio; sem processes, todas as sessões usam um
+    ThreadPoolExecutor (as sessões são independentes, mas o GIL limita o
+    paralelismo).
+
+    Args:
+        workers (int): Número de threads ou de processos.
+        processes (bool): Usa processos em vez de threads.
+    """
+    def __init__(self, workers=None, processes=False):
+        if processes:
+            self.executors = [ProcessPoolExecutor(1) for _ in range(workers or 1)]
+        else:
+            self.executors = [ThreadPoolExecutor(workers)]
+        self._rodizio = itertools.cycle(self.executors)
+
+    def assign(self):
+        """Executor de uma nova sessão."""
+        return next(self._rodizio)
+
+    def shutdown(self, wait=True):
+        for executor in self.executors:
+            executor.shutdown(wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+class SessionStats:
+    """
+    Estatísticas de uma sessão de compress ou decompress.
+
+    latencies tem o tempo (s) de cada lote, da entrega ao executor até o
+    resultado, incluindo a espera por um trabalhador livre; model_bytes é a
+    memória estimada do modelo (PPMModel.estimated_bytes) após o último lote
+    e peak_model_bytes, o maior valor durante a sessão.
+    """
+    def __init__(self):
+        self.symbols = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.batches = 0
+        self.latencies = []
+        self.model_bytes = 0
+        self.peak_model_bytes = 0
+        self.elapsed = 0.0  # Duração total da sessão (s)
+
+    def record(self, latencia, model_bytes):
+        self.batches += 1
+        self.latencies.append(latencia)
+        self.model_bytes = model_bytes
+        self.peak_model_bytes = max(self.peak_model_bytes, model_bytes)
+
+    def percentile(self, p):
+        """Latência de lote no percentil p (0 a 100), pelo valor mais próximo."""
+        if not self.latencies:
+            return 0.0
+        ordenadas = sorted(self.latencies)
+        return ordenadas[min(len(ordenadas) - 1, int(p / 100 * len(ordenadas)))]
+
+    def to_dict(self):
+        return {
+            'symbols': self.symbols,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'batches': self.batches,
+            'elapsed': self.elapsed,
+            'latency': {
+                'p50': self.percentile(50),
+                'p99': self.percentile(99),
+                'max': max(self.latencies, default=0.0),
+            },
+            'model_bytes': self.model_bytes,
+            'peak_model_bytes': self.peak_model_bytes,
+        }
+
+
+# Funções executadas nas threads ou processos (devem ser importáveis pelo pickle)
+
+def _abrir_codificador(sessao, alphabet, order, snapshot, params):
+    encoder = PPMHuffmanTest(alphabet, order, snapshot=snapshot, **params)
+    _sessoes[sessao] = encoder
+    cabecalho = dict(encoder.ppm.params, coder=params.get('coder', 'huffman'),
+                     rebuild_interval=params.get('rebuild_interval'))
+    if snapshot is not None:
+        cabecalho['snapshot'] = snapshot.crc
+    buffer = io.BytesIO()
+    escrever_cabecalho(buffer, order, alphabet, cabecalho)
+    return buffer.getvalue()
+
+def _codificar(sessao, texto):
+    encoder = _sessoes[sessao]
+    num_simbolos, dados = encoder.encode_block(texto)
+    return num_simbolos, dados, encoder.ppm.estimated_bytes
+
+def _abrir_decodificador(sessao, alphabet, order, snapshot, params):
+    _sessoes[sessao] = PPMHuffmanDecoder(alphabet, order, snapshot=snapshot, **params)
+
+def _decodificar(sessao, dados, num_simbolos):
+    decoder = _sessoes[sessao]
+    texto = decoder.decode_block(dados, num_simbolos)
+    return texto, decoder.ppm.estimated_bytes
+
+def _fechar_sessao(sessao):
+    _sessoes.pop(sessao, None)
+
+
+def _quadro(num_simbolos, dados):
+    buffer = io.BytesIO()
+    escrever_quadro(buffer, num_simbolos, dados)
+    return buffer.getvalue()
+
+def _executor(executor):
+    """Executor de uma sessão: SessionExecutor, Executor comum ou None (padrão do loop)."""
+    if isinstance(executor, SessionExecutor):
+        return executor.assign()
+    if isinstance(executor, ProcessPoolExecutor):
+        raise ValueError("Use SessionExecutor(processes=True): a sessão precisa ficar em um só processo.")
+    return executor
+
+async def _em_lote(loop, executor, stats, funcao, *args):
+    inicio = time.perf_counter()
+    resultado = await loop.run_in_executor(executor, funcao, *args)
+    stats.record(time.perf_counter() - inicio, resultado[-1])
+    return resultado
+
+async def compress(reader, writer, order, alphabet=ALPHABET, batch_size=BATCH_SIZE, executor=None,
+                   snapshot=None, **params):
+    """
+    Comprime o texto UTF-8 lido de reader no formato de compress_stream,
+    escrevendo em writer, sem bloquear o loop.
+
+    Cada sessão tem o seu próprio modelo, mantido no executor. A entrada é
+    lida em lotes de batch_size bytes (passados sem decodificar se o
+    alfabeto for de bytes); a modelagem de cada lote vai para o
+    executor enquanto o lote seguinte é lido, e cada quadro é escrito com
+    writer.drain(), de modo que um leitor ou escritor lento segura a sessão
+    (no máximo dois lotes em memória).
+
+    Args:
+        reader (asyncio.StreamReader): Entrada (qualquer objeto com read() assíncrono).
+        writer (asyncio.StreamWriter): Saída (write() e drain() assíncrono);
+            não é fechada.
+        order (int): Ordem do modelo PPM.
+        alphabet (iterable): Alfabeto dos símbolos de entrada.
+        batch_size (int): Tamanho dos lotes.
+        executor (SessionExecutor | Executor): Onde a modelagem é executada
+            (None = executor padrão do loop).
+        snapshot (ModelSnapshot): Modelo pré-treinado (ver compress_stream).
+        **params: coder, rebuild_interval e parâmetros do PPMModel (ver
+            compress_stream).
+
+    Returns:
+        SessionStats: Estatísticas da sessão.
+
+    Raises:
+        ValueError: Se o texto tiver um símbolo fora do alfabeto.
+    """
+    loop = asyncio.get_running_loop()
+    executor = _executor(executor)
+    stats = SessionStats()
+    inicio = time.perf_counter()
+    sessao = next(_ids)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    binario = alfabeto_binario(alphabet)
+
+    async def ler():
+        # Próximo lote de texto, ou "" no fim da entrada
+        while True:
+            dados = await reader.read(batch_size)
+            stats.bytes_in += len(dados)
+            texto = dados if binario else decoder.decode(dados, final=not dados)
+            if texto or not dados:
+                return texto
+
+    def escrever(dados):
+        writer.write(dados)
+        stats.bytes_out += len(dados)
+
+    try:
+        escrever(await loop.run_in_executor(executor, _abrir_codificador, sessao, set(alphabet),
+                                            order, snapshot, params))
+        texto = await ler()
+        while texto:
+            pendente = asyncio.ensure_future(_em_lote(loop, executor, stats, _codificar, sessao, texto))
+            try:
+                proximo = await ler()  # Lido enquanto o lote atual é codificado
+            except BaseException:
+                pendente.cancel()
+                raise
+            num_simbolos, dados, _ = await pendente
+            escrever(_quadro(num_simbolos, dados))
+            await writer.drain()
+            stats.symbols += num_simbolos
+            texto = proximo
+        escrever(_quadro(0, b""))  # Fim do fluxo
+        await writer.drain()
+    finally:
+        await loop.run_in_executor(executor, _fechar_sessao, sessao)
+        stats.elapsed = time.perf_counter() - inicio
+    return stats
+
+async def _ler_exatamente(reader, n):
+    try:
+        return await reader.readexactly(n)
+    except asyncio.IncompleteReadError:
+        raise ValueError("Fluxo truncado.") from None
+
+async def decompress(reader, writer, executor=None, snapshot=None):
+    """
+    Descomprime um fluxo de compress_stream (ou compress) lido de reader,
+    escrevendo o texto em UTF-8 em writer, sem bloquear o loop.
+
+    Cada quadro é decodificado no executor enquanto o seguinte é lido, e a
+    saída é escrita com writer.drain() (ver compress).
+
+    Args:
+        reader (asyncio.StreamReader): Entrada comprimida (com readexactly()).
+        writer (asyncio.StreamWriter): Saída; não é fechada.
+        executor (SessionExecutor | Executor): Onde a modelagem é executada.
+        snapshot (ModelSnapshot): Modelo pré-treinado usado na compressão.
+
+    Returns:
+        SessionStats: Estatísticas da sessão.
+
+    Raises:
+        ValueError: Se o fluxo não for reconhecido ou estiver corrompido.
+    """
+    loop = asyncio.get_running_loop()
+    executor = _executor(executor)
+    stats = SessionStats()
+    inicio = time.perf_counter()
+    sessao = next(_ids)
+
+    async def ler(n):
+        dados = await _ler_exatamente(reader, n)
+        stats.bytes_in += n
+        return dados
+
+    async def ler_quadro():
+        num_simbolos, tamanho = struct.unpack("<II", await ler(8))
+        return num_simbolos, await ler(tamanho)
+
+    # O cabeçalho é lido por partes e interpretado por ler_cabecalho
+    cabecalho = await ler(8)
+    cabecalho += await ler(struct.unpack_from("<H", cabecalho, 6)[0] + 2)
+    cabecalho += await ler(struct.unpack_from("<H", cabecalho, len(cabecalho) - 2)[0])
+    order, alphabet, params = ler_cabecalho(io.BytesIO(cabecalho))
+    crc = params.pop('snapshot', None)
+    if crc is None:
+        snapshot = None
+    elif snapshot is None or snapshot.crc != crc:
+        raise ValueError("O arquivo foi comprimido com outro modelo pré-treinado.")
+
+    try:
+        await loop.run_in_executor(executor, _abrir_decodificador, sessao, alphabet, order,
+                                   snapshot, params)
+        num_simbolos, dados = await ler_quadro()
+        while num_simbolos:
+            pendente = asyncio.ensure_future(_em_lote(loop, executor, stats, _decodificar, sessao,
+                                                      dados, num_simbolos))
+            try:
+                proximo = await ler_quadro()
+            except BaseException:
+                pendente.cancel()
+                raise
+            texto, _ = await pendente
+            saida = texto if isinstance(texto, bytes) else texto.encode('utf-8')
+            writer.write(saida)
+            stats.bytes_out += len(saida)
+            stats.symbols += len(texto)
+            await writer.drain()
+            num_simbolos, dados = proximo
+    finally:
+        await loop.run_in_executor(executor, _fechar_sessao, sessao)
+        stats.elapsed = time.perf_counter() - inicio
+    return stats
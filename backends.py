@@ -0,0 +1,212 @@
+import bisect
+import itertools
+import math
+from arquivo_utils import BitReader, BitWriter
+from huffman import CACHE_SIZE, MAX_CODE_LENGTH, HuffmanCache, HuffmanSimple
+from range_coder import MAX_TOTAL, RangeDecoder, RangeEncoder
+
+class HuffmanBackend:
+    """
+    Codificação por códigos Huffman canônicos, uma tabela por distribuição
+    (guardadas no HuffmanCache), e códigos de tamanho fixo em k=-1.
+
+    Todo backend cria, para cada quadro ou bloco, um codificador com
+    encode(frequencies, symbol), encode_uniform(index, n), bit_count e
+    finish(), e um decodificador com decode(frequencies), decode_uniform(n) e
+    exhausted. frequencies é o dict de PPMModel.coding_frequencies.
+
+    Para o modo de reconstrução periódica, table(frequencies) prepara uma
+    tabela reutilizável, usada por encode_table(table, symbol) e
+    decode_table(table) sem refazer nada por símbolo. Com cached=False, a
+    tabela não passa pelo cache (para distribuições grandes que mudam sempre).
+
+    Args:
+        cache_size (int): Número máximo de tabelas no cache (0 = sem cache).
+        max_length (int): Comprimento máximo dos códigos (ver HuffmanSimple).
+    """
+    name = 'huffman'
+
+    def __init__(self, cache_size=CACHE_SIZE, max_length=MAX_CODE_LENGTH):
+        self.cache = HuffmanCache(cache_size, max_length)
+
+    def table(self, frequencies, cached=True):
+        if cached:
+            return self.cache.table(frequencies)
+        table = HuffmanSimple(self.cache.max_length)
+        table.build_tree(frequencies)
+        return table
+
+    def encoder(self, arquivo):
+        return HuffmanEncoder(self.cache, arquivo)
+
+    def decoder(self, arquivo):
+        return HuffmanDecoder(self.cache, arquivo)
+
+class HuffmanEncoder:
+    def __init__(self, cache, arquivo):
+        self.cache = cache
+        self.writer = BitWriter(arquivo)
+        self.table = None  # Última tabela usada (ver ideal_length)
+
+    @property
+    def bit_count(self):
+        return self.writer.bit_count
+
+    def encode(self, frequencies, symbol):
+        self.table = self.cache.table(frequencies)
+        self.writer.write(*self.table.codes[symbol])
+
+    def encode_table(self, table, symbol):
+        self.table = table
+        self.writer.write(*table.codes[symbol])
+
+    def encode_uniform(self, index, n):
+        # O código fixo é o próprio índice; nenhum bit se só houver um valor
+        if n > 1:
+            self.writer.write(index, math.ceil(math.log2(n)))
+
+    def ideal_length(self, frequencies, symbol):
+        """Comprimento ideal de symbol em frequencies, a distribuição do último encode."""
+        return self.table.ideal_length(symbol)
+
+    def finish(self):
+        self.writer.flush()
+
+class HuffmanDecoder:
+    def __init__(self, cache, arquivo):
+        self.cache = cache
+        self.reader = BitReader(arquivo)
+
+    @property
+    def exhausted(self):
+        return self.reader.exhausted
+
+    def decode(self, frequencies):
+        return self.cache.table(frequencies).decode(self.reader)
+
+    def decode_table(self, table):
+        return table.decode(self.reader)
+
+    def decode_uniform(self, n):
+        if n <= 1:
+            return 0
+        return self.reader.read(math.ceil(math.log2(n)))
+
+
+class RangeBackend:
+    """
+    Codificação aritmética por intervalos (range_coder) direto das contagens
+    do PPMModel: não há construção de tabelas, cada símbolo custa uma fração
+    de bit proporcional a -log2 p e k=-1 custa exatamente log2 n bits.
+
+    O total de cada distribuição deve ser menor que MAX_TOTAL, o que vale
+    sempre que rescale_threshold + tamanho do alfabeto < MAX_TOTAL.
+    """
+    name = 'range'
+    cache = None  # Sem tabelas
+
+    def table(self, frequencies, cached=True):
+        return RangeTable(frequencies)
+
+    def encoder(self, arquivo):
+        return RangeBackendEncoder(arquivo)
+
+    def decoder(self, arquivo):
+        return RangeBackendDecoder(arquivo)
+
+def _total(frequencies):
+    total = sum(frequencies.values())
+    if total >= MAX_TOTAL:
+        raise ValueError("Contagens altas demais para o range coder (reduza rescale_threshold).")
+    return total
+
+class RangeTable:
+    """Frequências acumuladas de uma distribuição, na ordem do dict (ver RangeBackend.table)."""
+    def __init__(self, frequencies):
+        self.total = _total(frequencies)
+        self.symbols = list(frequencies)
+        self.counts = list(frequencies.values())
+        self.cums = list(itertools.accumulate(self.counts[:-1], initial=0))
+        self.index = dict(zip(self.symbols, range(len(self.symbols))))
+
+class RangeBackendEncoder:
+    def __init__(self, arquivo):
+        self.coder = RangeEncoder(arquivo)
+        self.total = 0  # Total da distribuição do último encode (ver ideal_length)
+
+    @property
+    def bit_count(self):
+        return self.coder.bit_count
+
+    def encode(self, frequencies, symbol):
+        # Frequência acumulada na ordem do dict, a mesma usada em decode
+        cum = 0
+        for s, count in frequencies.items():
+            if s == symbol:
+                break
+            cum += count
+        self.total = _total(frequencies)
+        self.coder.encode(cum, frequencies[symbol], self.total)
+
+    def encode_table(self, table, symbol):
+        i = table.index[symbol]
+        self.total = table.total
+        self.coder.encode(table.cums[i], table.counts[i], table.total)
+
+    def encode_uniform(self, index, n):
+        if n > 1:
+            self.coder.encode(index, 1, n)
+
+    def ideal_length(self, frequencies, symbol):
+        """Comprimento ideal de symbol em frequencies, a distribuição do último encode."""
+        return math.log2(self.total / frequencies[symbol])
+
+    def finish(self):
+        self.coder.finish()
+
+class RangeBackendDecoder:
+    def __init__(self, arquivo):
+        self.coder = RangeDecoder(arquivo)
+
+    @property
+    def exhausted(self):
+        return self.coder.exhausted
+
+    def decode(self, frequencies):
+        target = self.coder.decode_freq(_total(frequencies))
+        cum = 0
+        for symbol, count in frequencies.items():
+            if target < cum + count:
+                break
+            cum += count
+        self.coder.decode_update(cum, count)
+        return symbol
+
+    def decode_table(self, table):
+        i = bisect.bisect_right(table.cums, self.coder.decode_freq(table.total)) - 1
+        self.coder.decode_update(table.cums[i], table.counts[i])
+        return table.symbols[i]
+
+    def decode_uniform(self, n):
+        if n <= 1:
+            return 0
+        index = self.coder.decode_freq(n)
+        self.coder.decode_update(index, 1)
+        return index
+
+
+BACKENDS = {backend.name: backend for backend in (HuffmanBackend, RangeBackend)}
+
+def make_backend(name, cache_size=CACHE_SIZE, max_length=MAX_CODE_LENGTH):
+    """
+    Cria o backend de codificação pelo nome ('huffman' ou 'range'); max_length
+    só se aplica ao 'huffman'.
+
+    Raises:
+        ValueError: Se o nome não for conhecido.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Codificador desconhecido: {name!r}")
+    if name == 'huffman':
+        return HuffmanBackend(cache_size, max_length)
+    return BACKENDS[name]()
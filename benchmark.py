@@ -0,0 +1,289 @@
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from backends import BACKENDS
+from huffman import CACHE_SIZE
+from ppm_huffman_encoder import ALPHABET, compress_blocks, compress_stream
+from ppm_huffman_decoder import decompress_blocks, decompress_stream
+
+CORPORA = ('memorias', 'uniforme', 'palavras')
+PATHS = ('stream', 'blocks')
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'memorias_processed.txt')
+REPEAT = 3  # Medições de tempo de cada caso, das quais vale a melhor
+# Cache de tabelas Huffman: 'auto' segue huffman.cache_size_for (desligado
+# abaixo da ordem 5); 'on' e 'off' o forçam, para medir o cruzamento
+CACHE_MODES = {'auto': None, 'on': CACHE_SIZE, 'off': 0}
+
+# Métricas comparadas com a linha de base: (nome, maior é melhor). As de
+# METRICS reprovam a execução; as de SPEED_METRICS variam com a carga da
+# máquina e só são reprovadas com --speed-tolerance
+METRICS = (
+    ('bits_per_symbol', False),
+    ('peak_bytes', False),
+)
+SPEED_METRICS = (
+    ('encode_sps', True),
+    ('decode_sps', True),
+)
+
+def carregar_corpus(nome, tamanho, seed=0):
+    """
+    Gera o texto de um corpus de teste com tamanho símbolos.
+
+    'memorias' usa o início de CORPUS (repetido se for curto),
+    'uniforme' sorteia símbolos do alfabeto com a mesma probabilidade e
+    'palavras' sorteia palavras de um vocabulário fixo com frequências de Zipf.
+    Os corpora sintéticos dependem só de seed, para medições reprodutíveis.
+    """
+    rng = random.Random(seed)
+    letras = sorted(ALPHABET - {' '})
+    if nome == 'memorias':
+        with open(CORPUS, encoding="utf-8") as arquivo:
+            texto = arquivo.read(tamanho)
+        if not texto:
+            raise ValueError(f"{CORPUS} está vazio.")
+        return (texto * (tamanho // len(texto) + 1))[:tamanho]
+    if nome == 'uniforme':
+        return "".join(rng.choices(sorted(ALPHABET), k=tamanho))
+    if nome == 'palavras':
+        vocabulario = ["".join(rng.choices(letras, k=rng.randint(1, 9))) for _ in range(2000)]
+        pesos = [1 / (i + 1) for i in range(len(vocabulario))]
+        partes = []
+        comprimento = 0
+        while comprimento < tamanho:
+            palavra = rng.choices(vocabulario, pesos)[0]
+            partes.append(palavra)
+            comprimento += len(palavra) + 1
+        return " ".join(partes)[:tamanho]
+    raise ValueError(f"Corpus desconhecido: {nome!r}")
+
+def comprimir(texto, order, caminho, stats=False, coder='huffman', rebuild_interval=None,
+               cache='auto'):
+    """
+    Comprime texto pelo caminho dado; retorna (bytes, codificador ou None).
+    O modo de cache só vale no caminho 'stream'.
+    """
+    dst = io.BytesIO()
+    if caminho == 'stream':
+        encoder = compress_stream(io.StringIO(texto), dst, order, stats=stats, coder=coder,
+                                  rebuild_interval=rebuild_interval, cache_size=CACHE_MODES[cache])
+    else:
+        compress_blocks(io.StringIO(texto), dst, order, workers=1, coder=coder,
+                        rebuild_interval=rebuild_interval)
+        encoder = None
+    return dst.getvalue(), encoder
+
+def descomprimir(dados, caminho, cache='auto'):
+    out = io.StringIO()
+    if caminho == 'stream':
+        decompress_stream(io.BytesIO(dados), out, cache_size=CACHE_MODES[cache])
+    else:
+        decompress_blocks(io.BytesIO(dados), out, workers=1)
+    return out.getvalue()
+
+def medir(texto, order, caminho, repeat=REPEAT, coder='huffman', rebuild_interval=None, cache='auto'):
+    """
+    Mede um caso: vazão de codificação e decodificação (melhor de repeat),
+    bits/símbolo, comprimento ideal e entropia do modelo (só no caminho
+    'stream') e pico de memória alocada na codificação (tracemalloc).
+
+    A vazão é medida sem tracemalloc nem estatísticas; o pico de memória e a
+    entropia vêm de uma codificação extra.
+
+    Raises:
+        ValueError: Se repeat não for positivo ou se a descompressão não
+            reproduzir o texto.
+    """
+    if repeat < 1:
+        raise ValueError("repeat deve ser positivo.")
+    num_simbolos = len(texto)
+    tempo_codificacao = tempo_decodificacao = float('inf')
+    for _ in range(repeat):
+        inicio = time.perf_counter()
+        dados, _ = comprimir(texto, order, caminho, coder=coder, rebuild_interval=rebuild_interval,
+                             cache=cache)
+        tempo_codificacao = min(tempo_codificacao, time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        decodificado = descomprimir(dados, caminho, cache)
+        tempo_decodificacao = min(tempo_decodificacao, time.perf_counter() - inicio)
+        if decodificado != texto:
+            raise ValueError(f"Descompressão incorreta (ordem {order}, caminho {caminho}).")
+
+    tracemalloc.start()
+    try:
+        _, encoder = comprimir(texto, order, caminho, stats=True, coder=coder,
+                               rebuild_interval=rebuild_interval, cache=cache)
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    resultado = {
+        'encode_sps': num_simbolos / tempo_codificacao,
+        'decode_sps': num_simbolos / tempo_decodificacao,
+        'compressed_bytes': len(dados),
+        'bits_per_symbol': 8 * len(dados) / max(num_simbolos, 1),
+        'ideal_bits_per_symbol': None,
+        'entropy': None,
+        'peak_bytes': pico,
+    }
+    if encoder is not None:
+        resultado['ideal_bits_per_symbol'] = encoder.ideal_bits / max(num_simbolos, 1)
+        resultado['entropy'] = encoder.total_entropy / max(num_simbolos, 1)
+    return resultado
+
+def executar(orders, sizes, corpora, paths, repeat=REPEAT, log=None, coders=('huffman',),
+             rebuild_intervals=(None,), caches=('auto',)):
+    """
+    Executa todas as combinações de corpus, tamanho, ordem, caminho, backend
+    de codificação, intervalo de reconstrução das tabelas (None = a cada
+    símbolo) e modo do cache de tabelas (ver CACHE_MODES).
+
+    Com caches=('on', 'off') e ordens de 2 a 6, o relatório mostra o
+    cruzamento que define huffman.CACHE_MIN_ORDER: abaixo dele o cache custa
+    mais do que economiza.
+
+    Returns:
+        dict: Relatório com o ambiente e a lista de resultados.
+    """
+    resultados = []
+    for corpus in corpora:
+        for tamanho in sizes:
+            texto = carregar_corpus(corpus, tamanho)
+            for order in orders:
+                for caminho, coder, intervalo, cache in itertools.product(paths, coders,
+                                                                          rebuild_intervals, caches):
+                    resultado = {'corpus': corpus, 'size': tamanho, 'order': order, 'path': caminho,
+                                 'coder': coder, 'rebuild_interval': intervalo, 'cache': cache}
+                    resultado.update(medir(texto, order, caminho, repeat, coder, intervalo, cache))
+                    resultados.append(resultado)
+                    if log is not None:
+                        print(f"{corpus:<9} {tamanho:>8} k={order} {caminho:<7} {coder:<7} "
+                              f"N={intervalo or '-':<5} cache={cache:<4} "
+                              f"cod {resultado['encode_sps']:>9.0f} s/s  "
+                              f"dec {resultado['decode_sps']:>9.0f} s/s  "
+                              f"{resultado['bits_per_symbol']:.4f} bits/símbolo  "
+                              f"pico {resultado['peak_bytes'] / 1e6:.1f} MB", file=log)
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': resultados,
+    }
+
+def comparar(relatorio, linha_base, tolerance, metrics=METRICS):
+    """
+    Compara um relatório com uma linha de base gravada por executar.
+
+    Um caso regride quando uma métrica de metrics piora mais que a fração
+    tolerance em relação ao mesmo caso (corpus, tamanho, ordem, caminho, backend,
+    intervalo de reconstrução, modo do cache) na linha de base. Casos ausentes da linha de base são ignorados.
+
+    Returns:
+        list: Mensagens descrevendo cada regressão encontrada.
+    """
+    def chave(resultado):
+        return (resultado['corpus'], resultado['size'], resultado['order'], resultado['path'],
+                resultado.get('coder', 'huffman'), resultado.get('rebuild_interval'),
+                resultado.get('cache', 'auto'))
+
+    base = {chave(resultado): resultado for resultado in linha_base['results']}
+    regressoes = []
+    for resultado in relatorio['results']:
+        anterior = base.get(chave(resultado))
+        if anterior is None:
+            continue
+        for metrica, maior_melhor in metrics:
+            atual, referencia = resultado[metrica], anterior[metrica]
+            if maior_melhor:
+                piorou = atual < referencia * (1 - tolerance)
+            else:
+                piorou = atual > referencia * (1 + tolerance)
+            if piorou:
+                regressoes.append(f"{'/'.join(map(str, chave(resultado)))}: {metrica} "
+                                  f"{referencia:.4g} -> {atual:.4g}")
+    return regressoes
+
+def inteiro_positivo(texto):
+    """Tipo do argparse para tamanhos e contagens: inteiro maior que zero."""
+    valor = int(texto)
+    if valor < 1:
+        raise argparse.ArgumentTypeError(f"deve ser um inteiro positivo: {texto}")
+    return valor
+
+def lista_inteiros(texto):
+    """Converte '0-8' ou '1,2,4' em lista de inteiros."""
+    valores = []
+    for parte in texto.split(','):
+        if '-' in parte:
+            inicio, fim = parte.split('-')
+            valores.extend(range(int(inicio), int(fim) + 1))
+        else:
+            valores.append(int(parte))
+    return valores
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do compressor PPM-Huffman.")
+    parser.add_argument('--orders', type=lista_inteiros, default=list(range(9)),
+                        help="ordens, ex. 0-8 ou 2,4 (padrão: 0-8)")
+    parser.add_argument('--sizes', type=lista_inteiros, default=[20000],
+                        help="tamanhos das entradas em símbolos (padrão: 20000)")
+    parser.add_argument('--corpora', nargs='+', choices=CORPORA, default=list(CORPORA))
+    parser.add_argument('--paths', nargs='+', choices=PATHS, default=['stream'])
+    parser.add_argument('--coders', nargs='+', choices=sorted(BACKENDS), default=['huffman'])
+    parser.add_argument('--rebuild-intervals', type=lista_inteiros, default=[0],
+                        help="intervalos de reconstrução das tabelas, ex. 0,16,256 (0 = a cada símbolo)")
+    parser.add_argument('--caches', nargs='+', choices=CACHE_MODES, default=['auto'],
+                        help="modos do cache de tabelas Huffman no caminho stream; '--caches on off "
+                             "--orders 2-6' mostra a partir de que ordem o cache compensa (padrão: auto)")
+    parser.add_argument('--repeat', type=inteiro_positivo, default=REPEAT,
+                        help=f"repetições de cada medição de tempo, das quais vale a melhor (padrão: {REPEAT})")
+    parser.add_argument('--output', help="grava o relatório JSON neste arquivo")
+    parser.add_argument('--baseline', help="relatório JSON de referência para detectar regressões")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="piora relativa tolerada da taxa e da memória em relação à linha de base "
+                             "(padrão: 0.10)")
+    parser.add_argument('--speed-tolerance', type=float,
+                        help="reprova também a vazão que piorar mais que esta fração (padrão: a vazão só "
+                             "é informada)")
+    args = parser.parse_args(argv)
+
+    try:
+        relatorio = executar(args.orders, args.sizes, args.corpora, args.paths, args.repeat,
+                             log=sys.stderr, coders=args.coders,
+                             rebuild_intervals=[intervalo or None for intervalo in args.rebuild_intervals],
+                             caches=args.caches)
+    except FileNotFoundError:
+        print(f"Arquivo '{CORPUS}' não encontrado.", file=sys.stderr)
+        return 2
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as arquivo:
+            json.dump(relatorio, arquivo, indent=2)
+    else:
+        json.dump(relatorio, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as arquivo:
+            linha_base = json.load(arquivo)
+        regressoes = comparar(relatorio, linha_base, args.tolerance)
+        if args.speed_tolerance is not None:
+            regressoes += comparar(relatorio, linha_base, args.speed_tolerance, SPEED_METRICS)
+        else:
+            for variacao in comparar(relatorio, linha_base, args.tolerance, SPEED_METRICS):
+                print(f"VAZÃO: {variacao}", file=sys.stderr)
+        for regressao in regressoes:
+            print(f"REGRESSÃO: {regressao}", file=sys.stderr)
+        if regressoes:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,442 @@
+import argparse
+import io
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import benchmark
+from benchmark import inteiro_positivo
+from backends import BACKENDS
+from PPM import POLICIES, PPMModel
+from arquivo_utils import (BLOCK_SIZE, CHUNK_SIZE, MAGIC, MAGIC_BLOCOS, MAGIC_PALAVRAS,
+                           MAGIC_SEMIESTATICO, ModelSnapshot, escrever_snapshot, ler_blocos)
+from instrumentacao import Instrumentation, profile
+from modelo_compartilhado import SharedModel
+from ordem_automatica import GOALS, ORDERS, OrderSelector
+from palavras import compress_tokens, decompress_tokens
+from ppm_huffman_encoder import ALPHABET, BYTE_ALPHABET, compress_blocks, compress_stream
+from ppm_huffman_decoder import decompress_blocks, decompress_stream
+from pre_processamento import preprocess_chunks
+from semi_estatico import compress_semistatic, decompress_semistatic
+
+SUFIXO = '.ppmh'
+
+_snapshots = {}  # Modelos pré-treinados já abertos neste processo, por caminho (ou nome do segmento)
+
+def model_params(args):
+    """Parâmetros do PPMModel informados na linha de comando."""
+    return {
+        'max_nodes': args.max_nodes,
+        'max_bytes': args.max_bytes,
+        'policy': args.policy,
+        'rescale_threshold': args.rescale_threshold,
+    }
+
+def ordem(texto):
+    """Tipo do argparse para ordens: de 0 a 255, o que cabe no cabeçalho."""
+    valor = int(texto)
+    if not 0 <= valor <= 255:
+        raise argparse.ArgumentTypeError(f"deve estar entre 0 e 255: {texto}")
+    return valor
+
+def alfabeto(args):
+    """Alfabeto da linha de comando: o texto normalizado ou, com --bytes, os 256 bytes."""
+    if not args.bytes:
+        return ALPHABET
+    if args.normalize:
+        raise ValueError("--bytes não pode ser usado com --normalize.")
+    return BYTE_ALPHABET
+
+def abrir_snapshot(caminho):
+    """ModelSnapshot de caminho (None = sem modelo), aberto uma vez por processo."""
+    if caminho is None:
+        return None
+    if caminho not in _snapshots:
+        _snapshots[caminho] = ModelSnapshot(caminho)
+    return _snapshots[caminho]
+
+def abrir_compartilhado(nome):
+    """SharedModel publicado com o nome nome, ligado uma vez por processo."""
+    if nome not in _snapshots:
+        _snapshots[nome] = SharedModel(nome)
+    return _snapshots[nome]
+
+def abrir_entrada(caminho):
+    """Abre caminho para leitura binária ('-' = entrada padrão)."""
+    if caminho == '-':
+        return sys.stdin.buffer
+    return open(caminho, 'rb')
+
+def abrir_saida(caminho, binario):
+    """Abre caminho para escrita ('-' = saída padrão), binária ou texto."""
+    if caminho == '-':
+        return sys.stdout.buffer if binario else sys.stdout
+    if binario:
+        return open(caminho, 'wb')
+    return open(caminho, 'w', encoding='utf-8', newline='')
+
+def fechar(arquivo):
+    if arquivo not in (sys.stdin.buffer, sys.stdout.buffer, sys.stdout):
+        arquivo.close()
+
+def descartar_saida(caminho):
+    """Remove a saída incompleta de um comando que falhou ('-' é mantido)."""
+    if caminho != '-' and os.path.exists(caminho):
+        os.remove(caminho)
+
+class SaidaBinaria:
+    """
+    Saída binária para os descompressores: texto é gravado em UTF-8 e bytes
+    (modo binário) sem conversão, de modo que o formato só é conhecido ao ler
+    o cabeçalho.
+    """
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+
+    def write(self, dados):
+        if isinstance(dados, str):
+            dados = dados.encode('utf-8')
+        return self.arquivo.write(dados)
+
+def conflito_compressao(args, parser):
+    """
+    Mensagem de erro se as opções de compress (analisadas por parser) forem
+    incompatíveis entre si, ou None. Opções que um modo ignoraria são
+    recusadas em vez de descartadas em silêncio.
+    """
+    if args.bytes and (args.semi_static or args.tokens is not None):
+        return "--bytes não pode ser usado com --semi-static nem com --tokens"
+    if args.model is not None and (args.blocks or args.semi_static):
+        return "--model não pode ser usado com --blocks nem com --semi-static"
+    if args.tokens is not None and (args.model is not None or args.blocks or args.semi_static):
+        return "--tokens não pode ser usado com --model, --blocks nem --semi-static"
+    if args.stats and (args.semi_static or args.tokens is not None):
+        return "--stats não pode ser usado com --semi-static nem com --tokens"
+    if args.auto_order is not None and (args.model is not None or args.semi_static or args.tokens is not None):
+        return "--auto-order não pode ser usado com --model, --semi-static nem --tokens"
+    if args.semi_static:
+        # O modo semiestático tem tabelas Huffman fixas e não usa o PPMModel adaptativo
+        opcoes = (('--coder', 'coder'), ('--rebuild-interval', 'rebuild_interval'), ('--max-nodes', 'max_nodes'),
+                  ('--max-bytes', 'max_bytes'), ('--policy', 'policy'), ('--rescale-threshold', 'rescale_threshold'))
+        ignoradas = [opcao for opcao, destino in opcoes if getattr(args, destino) != parser.get_default(destino)]
+        if ignoradas:
+            return f"--semi-static não pode ser usado com {', '.join(ignoradas)}"
+    return None
+
+def comprimir(args):
+    instrumentation = Instrumentation() if args.stats else None
+    snapshot = abrir_snapshot(args.model)
+    order = args.order if snapshot is None else snapshot.order
+    alphabet = alfabeto(args) if snapshot is None else snapshot.alphabet
+    selector = None
+    if args.auto_order is not None:
+        selector = OrderSelector(args.orders, args.auto_order, args.min_ratio)
+    src = abrir_entrada(args.input)
+    dst = abrir_saida(args.output, binario=True)
+    concluido = False
+    try:
+        entrada = preprocess_chunks(src, args.chunk_size) if args.normalize else src
+        if args.tokens is not None:
+            params = {} if args.rebuild_interval is None else {'rebuild_interval': args.rebuild_interval}
+            compress_tokens(entrada, dst, args.tokens, order, args.chunk_size, alphabet=alphabet,
+                            coder=args.coder, **params)
+        elif args.semi_static:
+            compress_semistatic(entrada, dst, order, args.block_size)
+        elif args.blocks:
+            compress_blocks(entrada, dst, order, args.block_size, args.workers, alphabet,
+                            coder=args.coder, rebuild_interval=args.rebuild_interval, selector=selector,
+                            instrumentation=instrumentation, **model_params(args))
+        else:
+            if selector is not None:
+                order, trials, entrada = selector.select_stream(entrada, args.chunk_size, alphabet, args.workers,
+                                                                coder=args.coder,
+                                                                rebuild_interval=args.rebuild_interval,
+                                                                **model_params(args))
+                if args.stats:
+                    taxas = ", ".join(f"k={trial.order}: {trial.ratio:.3f}" for trial in trials)
+                    print(f"Ordem escolhida: {order} ({taxas})", file=sys.stderr)
+            compress_stream(entrada, dst, order, args.chunk_size, alphabet,
+                            instrumentation=instrumentation, snapshot=snapshot, coder=args.coder,
+                            rebuild_interval=args.rebuild_interval, **model_params(args))
+        dst.flush()
+        concluido = True
+    finally:
+        fechar(src)
+        fechar(dst)
+        if not concluido:
+            descartar_saida(args.output)
+    if instrumentation is not None:
+        instrumentation.dump(sys.stderr)
+        print(file=sys.stderr)
+
+def descomprimir(args):
+    instrumentation = Instrumentation() if args.stats else None
+    src = abrir_entrada(args.input)
+    dst = abrir_saida(args.output, binario=True)
+    saida = SaidaBinaria(dst)
+    concluido = False
+    try:
+        # O formato (fluxo ou contêiner de blocos) vem da assinatura
+        if src.seekable():
+            magic = src.read(len(MAGIC))
+            src.seek(0)
+        else:
+            magic = src.peek(len(MAGIC))[:len(MAGIC)]
+        if instrumentation is not None and magic in (MAGIC_BLOCOS, MAGIC_SEMIESTATICO, MAGIC_PALAVRAS):
+            raise ValueError("--stats só pode ser usado com fluxos (compress sem --blocks, "
+                             "--semi-static ou --tokens).")
+        if magic in (MAGIC_BLOCOS, MAGIC_SEMIESTATICO):
+            if not src.seekable():
+                src = io.BytesIO(src.read())  # O índice fica no fim do contêiner
+            if magic == MAGIC_BLOCOS:
+                decompress_blocks(src, saida, args.workers)
+            else:
+                decompress_semistatic(src, saida, args.workers)
+        elif magic == MAGIC_PALAVRAS:
+            decompress_tokens(src, saida)
+        else:
+            decompress_stream(src, saida, instrumentation, abrir_snapshot(args.model))
+        dst.flush()
+        concluido = True
+    finally:
+        fechar(src)
+        fechar(dst)
+        if not concluido:
+            descartar_saida(args.output)
+    if instrumentation is not None:
+        instrumentation.dump(sys.stderr)
+        print(file=sys.stderr)
+
+def listar_arquivos(entradas, saida, sufixo):
+    """
+    Expande arquivos e diretórios (recursivamente) em pares (origem, destino).
+
+    Com saida, os destinos repetem a estrutura de cada diretório de entrada
+    dentro de saida; sem ela, ficam ao lado das origens. Arquivos que já têm
+    o sufixo são ignorados.
+    """
+    pares = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            for raiz, diretorios, arquivos in os.walk(entrada):
+                diretorios.sort()
+                for nome in sorted(arquivos):
+                    if nome.endswith(sufixo):
+                        continue
+                    origem = os.path.join(raiz, nome)
+                    relativo = os.path.relpath(origem, entrada)
+                    base = os.path.join(saida, relativo) if saida else origem
+                    pares.append((origem, base + sufixo))
+        else:
+            base = os.path.join(saida, os.path.basename(entrada)) if saida else entrada
+            pares.append((entrada, base + sufixo))
+    return pares
+
+def comprimir_arquivo(origem, destino, order, params, normalize=False, model=None, shared=None):
+    """
+    Comprime um arquivo do lote (executado nos processos do pool). Com shared,
+    o modelo pré-treinado é o SharedModel publicado com esse nome, em vez do
+    arquivo model.
+
+    Returns:
+        tuple: (origem, símbolos, bytes de entrada, bytes de saída, erro ou None).
+    """
+    try:
+        os.makedirs(os.path.dirname(destino) or '.', exist_ok=True)
+        snapshot = abrir_compartilhado(shared) if shared is not None else abrir_snapshot(model)
+        if snapshot is not None:
+            order = snapshot.order
+            params = dict(params, alphabet=snapshot.alphabet)
+        with open(origem, 'rb') as src, open(destino, 'wb') as dst:
+            entrada = preprocess_chunks(src) if normalize else src
+            encoder = compress_stream(entrada, dst, order, snapshot=snapshot, **params)
+        return origem, encoder.num_symbols, os.path.getsize(origem), os.path.getsize(destino), None
+    except (OSError, ValueError) as erro:
+        if os.path.exists(destino):
+            os.remove(destino)  # Não deixa arquivos comprimidos incompletos
+        return origem, 0, 0, 0, str(erro)
+
+def lote(args):
+    """
+    Comprime vários arquivos em paralelo, um arquivo por tarefa, e mostra a
+    vazão total. Retorna 1 se algum arquivo falhar.
+    """
+    pares = listar_arquivos(args.inputs, args.output_dir, args.suffix)
+    params = dict(model_params(args), alphabet=alfabeto(args), coder=args.coder,
+                  rebuild_interval=args.rebuild_interval)
+    workers = args.workers or os.cpu_count() or 1
+    inicio = time.perf_counter()
+    simbolos = bytes_entrada = bytes_saida = falhas = 0
+
+    def registrar(resultado):
+        nonlocal simbolos, bytes_entrada, bytes_saida, falhas
+        origem, n, tamanho_entrada, tamanho_saida, erro = resultado
+        if erro is not None:
+            falhas += 1
+            print(f"ERRO: {origem}: {erro}", file=sys.stderr)
+            return
+        simbolos += n
+        bytes_entrada += tamanho_entrada
+        bytes_saida += tamanho_saida
+        if args.verbose:
+            print(f"{origem}: {tamanho_entrada} -> {tamanho_saida} bytes", file=sys.stderr)
+
+    if workers == 1:
+        for origem, destino in pares:
+            registrar(comprimir_arquivo(origem, destino, args.order, params, args.normalize, args.model))
+    else:
+        # O modelo pré-treinado é publicado uma vez em memória compartilhada,
+        # em vez de ser carregado inteiro em cada processo
+        snapshot = abrir_snapshot(args.model)
+        shared = None
+        if snapshot is not None and snapshot.flat is not None:
+            shared = SharedModel.publish(snapshot)
+        try:
+            with ProcessPoolExecutor(workers) as executor:
+                # Limita as tarefas em andamento para listas com milhares de arquivos
+                pendentes = deque()
+                for origem, destino in pares:
+                    pendentes.append(executor.submit(comprimir_arquivo, origem, destino, args.order, params,
+                                                     args.normalize, args.model,
+                                                     shared.name if shared is not None else None))
+                    if len(pendentes) >= 2 * workers:
+                        registrar(pendentes.popleft().result())
+                while pendentes:
+                    registrar(pendentes.popleft().result())
+        finally:
+            if shared is not None:
+                shared.unlink()
+
+    tempo = time.perf_counter() - inicio
+    print(f"{len(pares) - falhas} arquivos comprimidos, {falhas} falhas", file=sys.stderr)
+    print(f"{bytes_entrada} -> {bytes_saida} bytes "
+          f"({8 * bytes_saida / max(simbolos, 1):.4f} bits/símbolo)", file=sys.stderr)
+    print(f"Tempo: {tempo:.2f} s, {bytes_entrada / tempo / 1e6:.3f} MB/s, "
+          f"{simbolos / tempo:.0f} símbolos/s", file=sys.stderr)
+    return 1 if falhas else 0
+
+def treinar(args):
+    """Treina um PPMModel com os arquivos de entrada e grava o snapshot."""
+    model = PPMModel(alfabeto(args), args.order, **model_params(args))
+    for caminho in args.inputs:
+        context = model.root  # Cada arquivo começa sem contexto
+        blocos = preprocess_chunks(caminho) if args.normalize else ler_blocos(caminho, binary=args.bytes)
+        for bloco in blocos:
+            context = model.train(bloco, context)
+    crc = escrever_snapshot(args.output, model)
+    print(f"Modelo de ordem {args.order} com {model.node_count} contextos gravado em "
+          f"'{args.output}' (CRC-32 {crc:08x})", file=sys.stderr)
+
+def adicionar_diagnostico(parser):
+    parser.add_argument('--stats', action='store_true', help="mostra a instrumentação em JSON no stderr")
+    parser.add_argument('--profile', nargs='?', const=True, metavar='ARQUIVO',
+                        help="executa sob cProfile e grava os dados em ARQUIVO ou, sem ele, mostra as "
+                             "funções mais custosas no stderr (só o processo principal, não os -j)")
+
+def adicionar_codificador(parser):
+    parser.add_argument('--coder', choices=sorted(BACKENDS), default='huffman',
+                        help="backend de codificação (padrão: huffman)")
+    parser.add_argument('--rebuild-interval', type=inteiro_positivo,
+                        help="refaz a tabela de cada contexto só a cada N contagens (mais rápido, "
+                             "comprime um pouco menos; padrão: a cada símbolo). É o ajuste de "
+                             "velocidade para ordens até 4, em que o cache de tabelas Huffman fica "
+                             "desligado")
+
+def adicionar_modelo(parser):
+    parser.add_argument('-k', '--order', type=ordem, default=4, help="ordem do contexto (padrão: 4); o cache de tabelas "
+                        "Huffman só é ligado a partir da ordem 5, porque abaixo dela custa mais do que "
+                        "economiza (para acelerar as ordens até 4, use --rebuild-interval)")
+    parser.add_argument('--max-nodes', type=inteiro_positivo, help="limite de contextos do modelo")
+    parser.add_argument('--max-bytes', type=inteiro_positivo, help="limite da memória estimada do modelo")
+    parser.add_argument('--policy', choices=POLICIES, default='restart',
+                        help="política ao atingir o limite (padrão: restart)")
+    parser.add_argument('--rescale-threshold', type=inteiro_positivo, default=65535,
+                        help="total de um contexto a partir do qual as contagens são divididas")
+    parser.add_argument('--normalize', action='store_true',
+                        help="normaliza a entrada (pre_processamento) antes de comprimir")
+    parser.add_argument('--bytes', action='store_true',
+                        help="modo binário: alfabeto dos 256 bytes, para qualquer entrada (logs, JSON, "
+                             "binários) sem normalizar")
+    parser.add_argument('--model', help="modelo pré-treinado (ver train); define a ordem e os parâmetros")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='ppm_huffman', description="Compressor PPM-Huffman.")
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    p = subparsers.add_parser('compress', help="comprime um arquivo")
+    p.add_argument('input', nargs='?', default='-', help="arquivo de entrada ('-' = stdin)")
+    p.add_argument('-o', '--output', default='-', help="arquivo de saída ('-' = stdout)")
+    adicionar_modelo(p)
+    p.add_argument('--chunk-size', type=inteiro_positivo, default=CHUNK_SIZE, help="tamanho dos quadros do fluxo")
+    p.add_argument('--blocks', action='store_true', help="gera o contêiner de blocos independentes")
+    p.add_argument('--semi-static', action='store_true',
+                   help="duas passadas com tabelas fixas por contexto (requer numpy)")
+    p.add_argument('--block-size', type=inteiro_positivo, default=BLOCK_SIZE,
+                   help="tamanho dos blocos (com --blocks ou --semi-static)")
+    p.add_argument('--auto-order', choices=GOALS,
+                   help="escolhe a ordem testando amostras da entrada (por bloco com --blocks): "
+                        "ratio = melhor compressão, speed = mais rápida que atinja --min-ratio")
+    p.add_argument('--orders', type=benchmark.lista_inteiros, default=ORDERS,
+                   help="ordens candidatas de --auto-order, ex.: 1-6 ou 2,4,6 (padrão: 1-6)")
+    p.add_argument('--min-ratio', type=float, help="taxa de compressão mínima de --auto-order speed")
+    p.add_argument('--tokens', type=ordem, metavar='ORDEM',
+                   help="modo de palavras com contextos de ORDEM palavras; -k passa a ser a ordem "
+                        "da soletração das palavras novas")
+    p.add_argument('-j', '--workers', type=inteiro_positivo,
+                   help="processos (com --blocks ou --auto-order; padrão: CPUs)")
+    adicionar_diagnostico(p)
+    adicionar_codificador(p)
+    p.set_defaults(func=comprimir)
+    compress_parser = p
+
+    p = subparsers.add_parser('decompress',
+                              help="descomprime um arquivo (fluxo, blocos, semiestático ou de palavras)")
+    p.add_argument('input', nargs='?', default='-', help="arquivo comprimido ('-' = stdin)")
+    p.add_argument('-o', '--output', default='-', help="arquivo de saída ('-' = stdout)")
+    p.add_argument('-j', '--workers', type=inteiro_positivo, help="processos para contêineres de blocos e semiestáticos")
+    p.add_argument('--model', help="modelo pré-treinado usado na compressão")
+    adicionar_diagnostico(p)
+    p.set_defaults(func=descomprimir)
+
+    p = subparsers.add_parser('batch', help="comprime vários arquivos ou diretórios em paralelo")
+    p.add_argument('inputs', nargs='+', help="arquivos ou diretórios (percorridos recursivamente)")
+    p.add_argument('-d', '--output-dir', help="diretório de saída (padrão: ao lado das entradas)")
+    p.add_argument('--suffix', default=SUFIXO, help=f"sufixo dos arquivos gerados (padrão: {SUFIXO})")
+    adicionar_modelo(p)
+    p.add_argument('-j', '--workers', type=inteiro_positivo, help="processos (padrão: CPUs)")
+    p.add_argument('-v', '--verbose', action='store_true', help="mostra cada arquivo")
+    adicionar_codificador(p)
+    p.set_defaults(func=lote)
+
+    p = subparsers.add_parser('train', help="treina um modelo pré-treinado com um corpus de referência")
+    p.add_argument('inputs', nargs='+', help="arquivos do corpus")
+    p.add_argument('-o', '--output', required=True, help="arquivo do modelo gerado")
+    adicionar_modelo(p)
+    p.set_defaults(func=treinar)
+
+    # Os argumentos de bench são repassados sem análise a benchmark.main
+    subparsers.add_parser('bench', help="executa o benchmark (opções: bench --help)", add_help=False)
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['bench']:
+        return benchmark.main(argv[1:])
+
+    args = parser.parse_args(argv)
+    if args.func is comprimir:
+        conflito = conflito_compressao(args, compress_parser)
+        if conflito is not None:
+            compress_parser.error(conflito)
+    try:
+        if getattr(args, 'profile', None) is not None:
+            with profile(None if args.profile is True else args.profile):
+                return args.func(args) or 0
+        return args.func(args) or 0
+    except FileNotFoundError as erro:
+        print(f"ERRO: arquivo não encontrado: {erro.filename}", file=sys.stderr)
+        return 1
+    except (ImportError, ValueError) as erro:
+        print(f"ERRO: {erro}", file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
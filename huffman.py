@@ -1,62 +1,322 @@
-from heapq import heappush, heappop
-
-class HuffmanNode:
-    def __init__(self, symbol=None, frequency=0):
-        self.symbol = symbol
-        self.frequency = frequency
-        self.left = None
-        self.right = None
-
-    def __lt__(self, other):
-        # Compara pela frequência
-        if self.frequency == other.frequency:
-            # Desempata pela ordem alfabética dos símbolos, se ambos os nós forem folhas
-            if self.symbol is not None and other.symbol is not None:
-                return self.symbol < other.symbol
-            # Se um dos nós for interno (symbol=None), não desempata por símbolo
-            return self.symbol is not None  # Nós com símbolo vêm antes de nós internos
-        return self.frequency < other.frequency
+from collections import OrderedDict
+from math import log2
+from time import perf_counter
+
+MAX_CODE_LENGTH = 16  # Comprimento máximo padrão dos códigos (ver HuffmanSimple)
+CACHE_SIZE = 4096  # Tabelas no HuffmanCache (ver cache_size_for)
+CACHE_ENTRY_BYTES = 3200  # Memória medida (tracemalloc) de uma entrada do cache, com ~7 símbolos
+CACHE_MIN_ORDER = 5  # Abaixo desta ordem o cache quase não acerta e só custa tempo
+
+def minimum_redundancy_lengths(weights):
+    """
+    Comprimentos dos códigos Huffman de pesos em ordem crescente, calculados
+    no próprio array (Moffat e Katajainen, 1995), sem nós nem fila de
+    prioridade.
+
+    A primeira fase combina os pesos como o algoritmo das duas filas (folhas
+    e nós internos, em ordem), guardando em cada posição o peso do nó interno
+    ou o índice do seu pai; a segunda converte os pais em profundidades, e a
+    terceira conta as folhas de cada profundidade. Em empates, a folha é
+    combinada antes do nó interno.
+
+    Args:
+        weights (list): Pesos positivos em ordem crescente.
+
+    Returns:
+        list: Comprimento do código de cada peso (não crescentes).
+    """
+    a = list(weights)
+    n = len(a)
+    if n <= 1:
+        return [0] * n
+
+    # Fase 1: a[next] recebe o peso do nó interno next; a[root], o índice do pai
+    a[0] += a[1]
+    root = 0
+    leaf = 2
+    for next_ in range(1, n - 1):
+        if leaf >= n or a[root] < a[leaf]:
+            a[next_] = a[root]
+            a[root] = next_
+            root += 1
+        else:
+            a[next_] = a[leaf]
+            leaf += 1
+        if leaf >= n or (root < next_ and a[root] < a[leaf]):
+            a[next_] += a[root]
+            a[root] = next_
+            root += 1
+        else:
+            a[next_] += a[leaf]
+            leaf += 1
+
+    # Fase 2: profundidade de cada nó interno (a raiz é o último)
+    a[n - 2] = 0
+    for next_ in range(n - 3, -1, -1):
+        a[next_] = a[a[next_]] + 1
+
+    # Fase 3: profundidade das folhas, das mais rasas (pesos maiores) às mais fundas
+    available = 1
+    depth = 0
+    root = n - 2
+    next_ = n - 1
+    while available > 0:
+        used = 0
+        while root >= 0 and a[root] == depth:
+            used += 1
+            root -= 1
+        while available > used:
+            a[next_] = depth
+            next_ -= 1
+            available -= 1
+        available = 2 * used
+        depth += 1
+    return a
+
+def package_merge_lengths(weights, max_length):
+    """
+    Comprimentos ótimos limitados a max_length bits (package-merge), para
+    pesos em ordem crescente.
+
+    Cada nível une as folhas aos pacotes (pares) do nível mais fundo, em
+    ordem de peso; só os pesos e a indicação de folha são guardados. No nível
+    de cima são escolhidos os 2n - 2 primeiros itens, e cada pacote escolhido
+    escolhe dois itens do nível de baixo. Como as escolhas são sempre
+    prefixos, em cada nível entram as folhas de menor peso, e o comprimento de
+    cada símbolo é o número de níveis em que ele entra.
+
+    Raises:
+        ValueError: Se 2 ** max_length < len(weights).
+    """
+    n = len(weights)
+    if n <= 1:
+        return [0] * n
+    if n > 1 << max_length:
+        raise ValueError(f"{n} símbolos não cabem em códigos de {max_length} bits.")
+
+    levels = []  # Indicadores de folha de cada nível, do mais fundo ao de cima
+    packages = []
+    for _ in range(max_length):
+        items = []
+        is_leaf = []
+        i = j = 0
+        while i < n or j < len(packages):
+            if j >= len(packages) or (i < n and weights[i] <= packages[j]):
+                items.append(weights[i])
+                is_leaf.append(1)
+                i += 1
+            else:
+                items.append(packages[j])
+                is_leaf.append(0)
+                j += 1
+        levels.append(is_leaf)
+        packages = [items[k] + items[k + 1] for k in range(0, len(items) - 1, 2)]
+
+    lengths = [0] * n
+    taken = 2 * n - 2
+    for is_leaf in reversed(levels):
+        leaves = sum(is_leaf[:taken])
+        for i in range(leaves):
+            lengths[i] += 1
+        taken = 2 * (taken - leaves)
+    return lengths
 
 class HuffmanSimple:
-    def __init__(self):
+    """
+    Tabela Huffman canônica de uma distribuição de frequências.
+
+    Args:
+        max_length (int): Comprimento máximo dos códigos (ver build_tree);
+            codificador e decodificador precisam usar o mesmo.
+    """
+    def __init__(self, max_length=MAX_CODE_LENGTH):
+        self.max_length = max_length
         self.codes = {}
+        self.lengths = {}
+        # Tabelas do decodificador canônico (ver decode)
+        self.length_counts = [0]  # Quantidade de códigos de cada comprimento
+        self.limits = [0]  # Primeiro código além dos de cada comprimento
+        self.bases = [0]  # Índice em sorted_symbols menos o primeiro código
+        self.sorted_symbols = []  # Símbolos na ordem canônica (comprimento, símbolo)
+        self.frequencies = {}
+        self.total = 0
         
     def build_tree(self, frequencies):
-        # Cria fila de prioridade
-        heap = []
-        for symbol, freq in sorted(frequencies.items()):  # Ordena os símbolos para consistência
-            node = HuffmanNode(symbol, freq)
-            heappush(heap, node)
+        """
+        Monta a tabela a partir das frequências ({símbolo: contagem}).
 
-        # Constrói a árvore
-        while len(heap) > 1:
-            left = heappop(heap)
-            right = heappop(heap)
+        Os comprimentos vêm de minimum_redundancy_lengths sobre as contagens
+        ordenadas por (frequência, símbolo), sem alocar nós; se algum passar de
+        max_length, são recalculados por package_merge_lengths. Os códigos são
+        canônicos.
+        """
+        self.frequencies = frequencies
+        self.total = sum(frequencies.values())
 
-            # Cria nó interno com frequência combinada
-            parent = HuffmanNode(frequency=left.frequency + right.frequency)
-            parent.left = left
-            parent.right = right
+        # Ordena os símbolos para consistência: empates pela ordem dos símbolos
+        symbols = sorted(frequencies, key=lambda symbol: (frequencies[symbol], symbol))
+        weights = [frequencies[symbol] for symbol in symbols]
+        lengths = minimum_redundancy_lengths(weights)
+        if lengths[0] > self.max_length:
+            lengths = package_merge_lengths(weights, self.max_length)
+        self.lengths = dict(zip(symbols, lengths))
+        self._assign_canonical_codes()
 
-            heappush(heap, parent)
+    def build_from_lengths(self, lengths):
+        """
+        Monta a tabela canônica diretamente dos comprimentos dos códigos
+        ({símbolo: bits}, ex.: lidos de um cabeçalho), sem as frequências.
+        """
+        self.frequencies = {}
+        self.total = 0
+        self.lengths = dict(lengths)
+        self._assign_canonical_codes()
 
-        # Gera códigos
+    def _assign_canonical_codes(self):
+        """
+        Atribui códigos canônicos: símbolos ordenados por (comprimento, símbolo)
+        recebem códigos consecutivos, deslocados a cada aumento de comprimento.
+        Cada código é guardado como o par de inteiros (valor, comprimento).
+        """
+        self.sorted_symbols = sorted(self.lengths, key=lambda s: (self.lengths[s], s))
+        max_length = self.lengths[self.sorted_symbols[-1]]
+        self.length_counts = [0] * (max_length + 1)
+        self.limits = [0] * (max_length + 1)
+        self.bases = [0] * (max_length + 1)
         self.codes = {}
-        self._generate_codes(heap[0], "")
-        
-    def _generate_codes(self, node, code):
-        if node is None:
-            return
-            
-        if node.symbol is not None:
-            self.codes[node.symbol] = code
-            return
-            
-        self._generate_codes(node.left, code + "0")
-        self._generate_codes(node.right, code + "1")
+
+        code = 0
+        previous_length = self.lengths[self.sorted_symbols[0]]
+        for index, symbol in enumerate(self.sorted_symbols):
+            length = self.lengths[symbol]
+            code <<= length - previous_length
+            previous_length = length
+            if not self.length_counts[length]:
+                self.bases[length] = index - code  # Índice do símbolo = base + código
+            self.codes[symbol] = (code, length)
+            self.length_counts[length] += 1
+            code += 1
+            self.limits[length] = code
+
+        # Comprimentos sem códigos: limite no primeiro código daquele comprimento,
+        # que nunca é atingido pelo prefixo de um código mais longo
+        first = 0
+        for length in range(1, max_length + 1):
+            if not self.length_counts[length]:
+                self.limits[length] = first
+            first = (first + self.length_counts[length]) << 1
+
+    def ideal_length(self, symbol):
+        """Comprimento ideal (-log2 p, em bits) do código de symbol."""
+        return log2(self.total / self.frequencies[symbol])
+
+    def decode(self, reader):
+        """
+        Decodifica um símbolo lido de um BitReader.
+
+        Lê de uma vez o número de bits do maior código e compara os prefixos com
+        o limite canônico de cada comprimento; só os bits do código encontrado
+        são consumidos.
+
+        Args:
+            reader (BitReader): Leitor posicionado no início do código.
+
+        Returns:
+            O símbolo decodificado.
+        """
+        limits = self.limits
+        max_length = len(limits) - 1
+        if max_length == 0:
+            return self.sorted_symbols[0]  # Código vazio
+
+        bits = reader.peek(max_length)
+        for length in range(1, max_length + 1):
+            code = bits >> (max_length - length)
+            if code < limits[length]:
+                reader.skip(length)
+                return self.sorted_symbols[self.bases[length] + code]
     
     def print_codes(self):
         print("\nCódigos Huffman:")
         print("-" * 20)
-        for symbol, code in sorted(self.codes.items()):
-            print(f"'{symbol}': {code}")
+        for symbol, (code, length) in sorted(self.codes.items()):
+            print(f"'{symbol}': {format(code, f'0{length}b') if length else ''}")
+
+
+class HuffmanCache:
+    """
+    Cache LRU de tabelas Huffman já construídas.
+
+    A chave é a própria tabela de frequências (já com a exclusão aplicada e com
+    o escape), de modo que uma entrada nunca fica desatualizada: como todo
+    contexto visitado é atualizado logo em seguida pelo PPMModel, a tabela só é
+    reaproveitada quando outro contexto (ou o mesmo, com outra exclusão) chega
+    exatamente às mesmas contagens, o que é comum nas ordens altas. A chave é a
+    tupla dos pares na ordem do dicionário: as contagens iguais em outra ordem
+    perdem poucos acertos, e a tupla custa menos da metade de um frozenset.
+
+    As entradas ficam fora de PPMModel.estimated_bytes; cache_size_for limita
+    o cache a uma fração do orçamento do modelo. Com max_size=0, o cache fica
+    desligado: cada tabela é construída sem chave e descartada.
+
+    Args:
+        max_size (int): Número máximo de tabelas mantidas no cache (0 = sem cache).
+        max_length (int): Comprimento máximo dos códigos das tabelas.
+    """
+    def __init__(self, max_size=CACHE_SIZE, max_length=MAX_CODE_LENGTH):
+        self.max_size = max_size
+        self.max_length = max_length
+        self.entries = OrderedDict()  # {tuple(frequências.items()): HuffmanSimple}
+        self.hits = 0
+        self.misses = 0
+        self.instrumentation = None  # Instrumentation opcional (ver instrumentacao.py)
+
+    def table(self, frequencies):
+        if self.max_size:
+            key = tuple(frequencies.items())
+            table = self.entries.get(key)
+        else:
+            table = None
+        if table is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return table
+
+        self.misses += 1
+        table = HuffmanSimple(self.max_length)
+        if self.instrumentation is None:
+            table.build_tree(frequencies)
+        else:
+            inicio = perf_counter()
+            table.build_tree(frequencies)
+            self.instrumentation.times['build_tree'] += perf_counter() - inicio
+            self.instrumentation.build_tree_calls += 1
+        if self.max_size:
+            self.entries[key] = table
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)  # Descarta a tabela menos usada
+        return table
+
+    def clear(self):
+        self.entries.clear()
+
+def cache_size_for(order, max_bytes=None):
+    """
+    Tamanho do HuffmanCache para um modelo de ordem order com orçamento
+    max_bytes (PPMModel.max_bytes).
+
+    Abaixo de CACHE_MIN_ORDER quase nenhuma distribuição se repete (menos de
+    10% de acertos até a ordem 3, 25% na 4) e o cache fica desligado: ele
+    custa mais do que economiza, e o ajuste de velocidade dessas ordens é o
+    rebuild_interval (o cruzamento aparece em 'benchmark.py --caches on off
+    --orders 2-6'). Com orçamento, as tabelas do cache (CACHE_ENTRY_BYTES
+    cada) ocupam no máximo um oitavo de max_bytes.
+
+    Returns:
+        int: Número máximo de tabelas (0 = sem cache).
+    """
+    if order < CACHE_MIN_ORDER:
+        return 0
+    if max_bytes is None:
+        return CACHE_SIZE
+    return min(CACHE_SIZE, max_bytes // (8 * CACHE_ENTRY_BYTES))
@@ -0,0 +1,124 @@
+import cProfile
+import json
+import pstats
+import sys
+from contextlib import contextmanager
+
+class Instrumentation:
+    """
+    Contadores e cronômetros opcionais do codificador, do decodificador, do
+    PPMModel e do HuffmanCache.
+
+    É ligada passando instrumentation= a PPMHuffmanTest ou PPMHuffmanDecoder
+    (ou a compress_stream/decompress_stream). Desligada (None), custa apenas
+    um teste de None por contexto percorrido: os laços cronometrados ficam em
+    ramos separados.
+
+    Os tempos são separados em atualização do modelo ('update'), construção
+    de códigos ('build_tree', só nas faltas do cache) e codificação ('coding':
+    percurso dos contextos, frequências com exclusão e E/S de bits).
+    """
+    def __init__(self):
+        self.hits = {}  # {k: símbolos codificados no contexto de ordem k}
+        self.escapes = {}  # {k: escapes no contexto de ordem k}
+        self.fallbacks = 0  # Símbolos que chegaram a k=-1
+        self.build_tree_calls = 0
+        self.contexts_created = {}  # {k: contextos criados com ordem k}
+        self.rescales = 0
+        self.budget_events = 0  # Vezes em que o orçamento de memória foi aplicado
+        # Tempo (s) de cada fase; 'symbol' inclui 'build_tree' (ver to_dict)
+        self.times = {'update': 0.0, 'symbol': 0.0, 'build_tree': 0.0}
+        self.model = None
+        self.contexts = {}  # {k: contextos de ordem k} dos modelos já desligados (ver detach)
+
+    def attach(self, model, cache):
+        """Liga a instrumentação a um PPMModel e ao seu HuffmanCache (se houver)."""
+        self.model = model
+        model.instrumentation = self
+        if cache is not None:
+            cache.instrumentation = self
+
+    def detach(self):
+        """
+        Desliga o modelo ligado, guardando os seus contextos por ordem, para
+        que a instrumentação possa ser enviada a outro processo (ex.: a de um
+        bloco de compress_blocks) e somada com merge.
+        """
+        self.contexts = self.contexts_per_order()
+        if self.model is not None:
+            self.model.instrumentation = None
+        self.model = None
+
+    def merge(self, other):
+        """Soma a esta os contadores e tempos de other (ver detach)."""
+        for mine, theirs in ((self.hits, other.hits), (self.escapes, other.escapes),
+                             (self.contexts_created, other.contexts_created),
+                             (self.contexts, other.contexts_per_order()), (self.times, other.times)):
+            for k, value in theirs.items():
+                mine[k] = mine.get(k, 0) + value
+        self.fallbacks += other.fallbacks
+        self.build_tree_calls += other.build_tree_calls
+        self.rescales += other.rescales
+        self.budget_events += other.budget_events
+
+    def count(self, k, hit):
+        """Registra um acerto (hit=True) ou escape no contexto de ordem k."""
+        counters = self.hits if hit else self.escapes
+        counters[k] = counters.get(k, 0) + 1
+
+    def contexts_per_order(self):
+        """Número de contextos de cada ordem existentes no modelo ligado (e nos desligados)."""
+        counts = dict(self.contexts)
+        if self.model is None:
+            return counts
+        stack = [self.model.root]
+        while stack:
+            node = stack.pop()
+            counts[node.depth] = counts.get(node.depth, 0) + 1
+            if node.children:
+                stack.extend(node.children.values())
+        return counts
+
+    def to_dict(self):
+        """Estatísticas acumuladas como dict serializável em JSON."""
+        return {
+            'hits': dict(sorted(self.hits.items())),
+            'escapes': dict(sorted(self.escapes.items())),
+            'fallbacks': self.fallbacks,
+            'build_tree_calls': self.build_tree_calls,
+            'contexts_created': dict(sorted(self.contexts_created.items())),
+            'contexts_per_order': dict(sorted(self.contexts_per_order().items())),
+            'rescales': self.rescales,
+            'budget_events': self.budget_events,
+            'times': {
+                'update': self.times['update'],
+                'build_tree': self.times['build_tree'],
+                'coding': self.times['symbol'] - self.times['build_tree'],
+            },
+        }
+
+    def dump(self, arquivo):
+        """Grava to_dict() como JSON no arquivo (aberto em modo texto)."""
+        json.dump(self.to_dict(), arquivo, indent=2)
+
+@contextmanager
+def profile(caminho=None, sort='cumulative', limite=25):
+    """
+    Executa o bloco sob cProfile.
+
+    Args:
+        caminho (str): Grava os dados brutos neste arquivo (para pstats ou
+            snakeviz); se None, imprime as limite funções mais custosas.
+        sort (str): Critério de ordenação do resumo impresso.
+        limite (int): Número de funções no resumo impresso.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if caminho is not None:
+            profiler.dump_stats(caminho)
+        else:
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats(sort).print_stats(limite)
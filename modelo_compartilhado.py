@@ -0,0 +1,123 @@
+import io
+import struct
+import sys
+from array import array
+from multiprocessing import resource_tracker, shared_memory
+from PPM import FlatModel, PPMModel
+from arquivo_utils import MAGIC_SNAPSHOT, escrever_cabecalho, ler_cabecalho
+
+# Nós, símbolos contados, modelo congelado e CRC-32 do modelo pré-treinado
+TAMANHOS_COMPARTILHADO = struct.Struct("<QQBI")
+ALINHAMENTO = 8  # Cada array começa num múltiplo de 8 bytes
+
+def _alinhar(posicao):
+    return -(-posicao // ALINHAMENTO) * ALINHAMENTO
+
+class SharedModel(FlatModel):
+    """
+    Modelo pré-treinado congelado e achatado em multiprocessing.shared_memory,
+    para ser usado por vários processos sem cópia.
+
+    Um processo publica o modelo (publish, a partir de um ModelSnapshot) e os
+    demais se ligam pelo nome (SharedModel(name)); os arrays do FlatModel são
+    memoryviews do segmento compartilhado. Cada documento usa um
+    OverlayModel novo (model()), com a camada privada dos contextos que ele
+    visita, de modo que a memória de cada processo não depende do tamanho do
+    modelo. Tem a interface de ModelSnapshot (order, alphabet, params, crc e
+    model()), e pode ser passado como snapshot aos codificadores: os arquivos
+    gerados são os mesmos do ModelSnapshot de origem.
+
+    O segmento tem o cabeçalho de escrever_cabecalho (MAGIC_SNAPSHOT), os
+    tamanhos e, alinhados, os arrays de FlatModel.arrays na ordem nativa de
+    bytes.
+
+    Args:
+        name (str): Nome do segmento publicado.
+    """
+    def __init__(self, name, _shm=None):
+        if _shm is None:
+            _shm = _ligar(name)
+        self.shm = _shm
+        self.name = _shm.name
+        buf = _shm.buf
+        tamanho, = struct.unpack_from("<I", buf, 0)
+        order, alphabet, params = ler_cabecalho(io.BytesIO(bytes(buf[4:4 + tamanho])), MAGIC_SNAPSHOT)
+        posicao = 4 + tamanho
+        node_count, entry_count, frozen, self.crc = TAMANHOS_COMPARTILHADO.unpack_from(buf, posicao)
+        posicao = _alinhar(posicao + TAMANHOS_COMPARTILHADO.size)
+
+        self._views = []
+        for codigo, n in _layout(PPMModel(alphabet, 0).typecode, node_count, entry_count):
+            fim = posicao + n * array(codigo).itemsize
+            raw = buf[posicao:fim]
+            self._views += [raw, raw.cast(codigo)]
+            posicao = _alinhar(fim)
+        super().__init__(alphabet, order, params, bool(frozen), *self._views[1::2])
+
+    @classmethod
+    def publish(cls, snapshot, name=None):
+        """
+        Publica snapshot (ModelSnapshot) num segmento novo de memória
+        compartilhada. O processo que publica deve chamar unlink() (ou usar o
+        objeto como gerenciador de contexto) quando os demais terminarem.
+
+        Returns:
+            SharedModel: O modelo publicado, já ligado ao segmento.
+
+        Raises:
+            ValueError: Se o modelo usar a política 'prune' com orçamento (ver
+                PPM.overlay_supported).
+        """
+        flat = snapshot.flat
+        if flat is None:
+            raise ValueError("A política 'prune' com orçamento não pode ser usada com um modelo compartilhado.")
+        cabecalho = escrever_cabecalho(io.BytesIO(), snapshot.order, snapshot.alphabet, snapshot.params,
+                                       MAGIC_SNAPSHOT)
+        dados = bytearray(struct.pack("<I", len(cabecalho)) + cabecalho)
+        dados += TAMANHOS_COMPARTILHADO.pack(flat.node_count, flat.entry_count, flat.frozen, snapshot.crc)
+        for valores in flat.arrays:
+            dados += bytes(_alinhar(len(dados)) - len(dados))
+            dados += valores.tobytes()
+
+        shm = shared_memory.SharedMemory(name, create=True, size=max(len(dados), 1))
+        shm.buf[:len(dados)] = dados
+        return cls(shm.name, shm)
+
+    def close(self):
+        """Desliga este processo do segmento (os modelos criados não podem mais copiar nós)."""
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self.shm.close()
+
+    def unlink(self):
+        """Fecha e remove o segmento (só no processo que publicou)."""
+        self.close()
+        if sys.version_info < (3, 13):
+            # Os processos filhos usam o mesmo resource_tracker, e _ligar pode
+            # ter tirado o registro do segmento: registra de novo antes de remover
+            resource_tracker.register(self.shm._name, 'shared_memory')
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.unlink()
+
+def _layout(typecode, node_count, entry_count):
+    """Tipo e tamanho de cada array do segmento, na ordem de FlatModel.arrays."""
+    filhos = max(node_count - 1, 0)
+    return (('I', node_count), ('I', node_count + 1), ('I', node_count + 1), ('I', filhos),
+            (typecode, entry_count), ('I', entry_count), (typecode, filhos))
+
+def _ligar(name):
+    """
+    Liga-se a um segmento existente sem registrá-lo no resource_tracker, que
+    o removeria quando este processo terminasse.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    shm = shared_memory.SharedMemory(name)
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
@@ -0,0 +1,239 @@
+import codecs
+import io
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from arquivo_utils import CHUNK_SIZE, alfabeto_binario, ler_blocos
+from ppm_huffman_encoder import ALPHABET, PPMHuffmanTest
+
+ORDERS = (1, 2, 3, 4, 5, 6)  # Ordens testadas por padrão
+GOALS = ('ratio', 'speed')
+NUM_SAMPLES = 4  # Trechos da entrada codificados em cada ordem
+SAMPLE_SIZE = 16384  # Caracteres por trecho
+
+def amostras(texto, num_samples=NUM_SAMPLES, sample_size=SAMPLE_SIZE):
+    """
+    Trechos de sample_size caracteres espaçados igualmente ao longo de texto,
+    do início ao fim; o texto inteiro se couber nos trechos.
+    """
+    if len(texto) <= num_samples * sample_size:
+        return [texto] if texto else []
+    return [texto[inicio:inicio + sample_size] for inicio in _inicios(len(texto), num_samples, sample_size)]
+
+def _inicios(tamanho, num_samples, sample_size):
+    """Inícios das amostras de amostras numa entrada de tamanho elementos."""
+    if num_samples == 1:
+        return [0]
+    passo = (tamanho - sample_size) / (num_samples - 1)
+    return [round(i * passo) for i in range(num_samples)]
+
+def amostras_do_fluxo(origem, chunk_size=CHUNK_SIZE, binary=False, num_samples=NUM_SAMPLES,
+                      sample_size=SAMPLE_SIZE):
+    """
+    Tira as amostras de origem sem ler a entrada inteira para a memória.
+
+    Num arquivo binário com seek, os trechos são lidos nas posições de
+    amostras (em bytes; no texto, os bytes de continuação UTF-8 do início e o
+    caractere incompleto do fim são descartados), e o arquivo volta à posição
+    inicial. Nos demais casos (entrada padrão, iteráveis), as amostras saem
+    dos primeiros blocos, até num_samples * sample_size caracteres, que são
+    repostos na frente do restante da entrada.
+
+    Args:
+        origem (str | file | iterable): Entrada (ver ler_blocos).
+        chunk_size (int): Tamanho dos blocos lidos.
+        binary (bool): Modo binário (ver ler_blocos).
+        num_samples (int): Número de trechos.
+        sample_size (int): Caracteres (ou bytes) de cada trecho.
+
+    Returns:
+        tuple: (amostras, entrada a ser comprimida, a partir do início).
+    """
+    limite = num_samples * sample_size
+    if (hasattr(origem, 'seekable') and not isinstance(origem, io.TextIOBase) and origem.seekable()):
+        posicao = origem.tell()
+        tamanho = origem.seek(0, io.SEEK_END) - posicao
+        if tamanho > limite:
+            samples = []
+            for inicio in _inicios(tamanho, num_samples, sample_size):
+                origem.seek(posicao + inicio)
+                dados = origem.read(sample_size)
+                if not binary:
+                    descarte = 0
+                    while descarte < min(3, len(dados)) and 0x80 <= dados[descarte] < 0xC0:
+                        descarte += 1
+                    dados = codecs.getincrementaldecoder('utf-8')().decode(dados[descarte:])
+                samples.append(dados)
+            origem.seek(posicao)
+            return samples, origem
+        origem.seek(posicao)
+
+    blocos = ler_blocos(origem, chunk_size, binary=binary)
+    inicio = []
+    lidos = 0
+    for bloco in blocos:
+        inicio.append(bloco)
+        lidos += len(bloco)
+        if lidos >= limite:
+            break
+    texto = (b"" if binary else "").join(inicio)
+    return amostras(texto, num_samples, sample_size), itertools.chain(inicio, blocos)
+
+class OrderTrial:
+    """
+    Resultado da codificação de teste das amostras em uma ordem.
+
+    Args:
+        order (int): Ordem testada.
+        size (int): Bytes (UTF-8, no texto) das amostras.
+        bits (int): Comprimento total dos códigos.
+        elapsed (float): Tempo da codificação (s).
+    """
+    def __init__(self, order, size, bits, elapsed):
+        self.order = order
+        self.size = size
+        self.bits = bits
+        self.elapsed = elapsed
+
+    @property
+    def ratio(self):
+        """Taxa de compressão (tamanho original / comprimido)."""
+        return 8 * self.size / max(self.bits, 1)
+
+    @property
+    def throughput(self):
+        """Bytes da entrada por segundo."""
+        return self.size / max(self.elapsed, 1e-9)
+
+    def to_dict(self):
+        return {
+            'order': self.order,
+            'bits': self.bits,
+            'ratio': self.ratio,
+            'throughput': self.throughput,
+        }
+
+def trial_encode(alphabet, order, samples, params):
+    """
+    Codifica cada amostra com um modelo novo de ordem order, medindo só o
+    comprimento dos códigos (os bytes gerados são descartados).
+
+    Returns:
+        OrderTrial: Resultado da ordem.
+    """
+    bits = 0
+    inicio = time.perf_counter()
+    for amostra in samples:
+        encoder = PPMHuffmanTest(alphabet, order, **params)
+        encoder.encode_block(amostra)
+        bits += encoder.total_bits
+    elapsed = time.perf_counter() - inicio
+    size = sum(len(amostra.encode('utf-8') if isinstance(amostra, str) else amostra) for amostra in samples)
+    return OrderTrial(order, size, bits, elapsed)
+
+class OrderSelector:
+    """
+    Escolhe a ordem do modelo PPM codificando amostras da entrada em cada
+    uma das ordens candidatas.
+
+    Com goal='ratio', vence a ordem com o menor comprimento total (em empate,
+    a menor ordem). Com goal='speed', vence a ordem de maior vazão entre as
+    que atingem a taxa de compressão min_ratio (todas, sem min_ratio); se
+    nenhuma atingir, vence a de melhor taxa. A vazão é medida durante o
+    teste, então a escolha por velocidade pode variar entre execuções; a
+    ordem escolhida vai para o cabeçalho, e o decodificador não repete o
+    teste.
+
+    Args:
+        orders (iterable): Ordens candidatas.
+        goal (str): Objetivo, 'ratio' ou 'speed'.
+        min_ratio (float): Taxa de compressão mínima com goal='speed'.
+        num_samples (int): Número de trechos da entrada testados.
+        sample_size (int): Caracteres de cada trecho.
+    """
+    def __init__(self, orders=ORDERS, goal='ratio', min_ratio=None, num_samples=NUM_SAMPLES,
+                 sample_size=SAMPLE_SIZE):
+        if goal not in GOALS:
+            raise ValueError(f"Objetivo desconhecido: {goal!r} (use {', '.join(GOALS)}).")
+        self.orders = sorted(set(orders))
+        if not self.orders or self.orders[0] < 0 or self.orders[-1] > 255:
+            raise ValueError("As ordens candidatas devem estar entre 0 e 255.")
+        if num_samples < 1 or sample_size < 1:
+            raise ValueError("num_samples e sample_size devem ser positivos.")
+        self.goal = goal
+        self.min_ratio = min_ratio
+        self.num_samples = num_samples
+        self.sample_size = sample_size
+
+    def trials(self, texto, alphabet=ALPHABET, workers=1, **params):
+        """
+        Codifica as amostras de texto em todas as ordens candidatas, em
+        paralelo num ProcessPoolExecutor com workers processos (1 = no
+        próprio processo).
+
+        Args:
+            texto (str | bytes): Entrada (ou bloco) a ser comprimida.
+            alphabet (iterable): Alfabeto dos símbolos de entrada.
+            workers (int): Processos (None = número de CPUs).
+            **params: coder, rebuild_interval e parâmetros do PPMModel, os
+                mesmos da compressão.
+
+        Returns:
+            list: OrderTrial de cada ordem, em ordem crescente.
+
+        Raises:
+            ValueError: Se o texto tiver um símbolo fora do alfabeto.
+        """
+        return self.trial_samples(amostras(texto, self.num_samples, self.sample_size), alphabet, workers,
+                                  **params)
+
+    def trial_samples(self, samples, alphabet=ALPHABET, workers=1, **params):
+        """Como trials, com as amostras já tiradas da entrada."""
+        if not samples:
+            return []
+        alphabet = set(alphabet)
+        workers = min(workers or os.cpu_count() or 1, len(self.orders))
+        if workers == 1:
+            return [trial_encode(alphabet, order, samples, params) for order in self.orders]
+        with ProcessPoolExecutor(workers) as executor:
+            futuros = [executor.submit(trial_encode, alphabet, order, samples, params)
+                       for order in self.orders]
+            return [futuro.result() for futuro in futuros]
+
+    def choose(self, trials):
+        """Ordem vencedora entre os resultados trials (a menor candidata, sem nenhum)."""
+        if not trials:
+            return self.orders[0]
+        melhor = min(trials, key=lambda trial: (trial.bits, trial.order))
+        if self.goal == 'ratio':
+            return melhor.order
+        aceitas = [trial for trial in trials if self.min_ratio is None or trial.ratio >= self.min_ratio]
+        if not aceitas:
+            return melhor.order
+        return max(aceitas, key=lambda trial: (trial.throughput, -trial.order)).order
+
+    def select(self, texto, alphabet=ALPHABET, workers=1, **params):
+        """
+        Escolhe a ordem para texto (ver trials).
+
+        Returns:
+            tuple: (ordem escolhida, lista de OrderTrial).
+        """
+        trials = self.trials(texto, alphabet, workers, **params)
+        return self.choose(trials), trials
+
+    def select_stream(self, origem, chunk_size=CHUNK_SIZE, alphabet=ALPHABET, workers=1, **params):
+        """
+        Escolhe a ordem para a entrada origem, com as amostras de
+        amostras_do_fluxo (modo binário com um alfabeto de bytes, ver
+        arquivo_utils.alfabeto_binario).
+
+        Returns:
+            tuple: (ordem escolhida, lista de OrderTrial, entrada a ser
+                comprimida, a partir do início).
+        """
+        samples, entrada = amostras_do_fluxo(origem, chunk_size, alfabeto_binario(alphabet), self.num_samples,
+                                             self.sample_size)
+        trials = self.trial_samples(samples, alphabet, workers, **params)
+        return self.choose(trials), trials, entrada
@@ -0,0 +1,387 @@
+import io
+from functools import partial
+from backends import make_backend
+from PPM import StaleTable
+from arquivo_utils import (CHUNK_SIZE, MAGIC_PALAVRAS, escrever_cabecalho, escrever_quadro,
+                           ler_blocos, ler_cabecalho, ler_quadro)
+from ppm_huffman_decoder import PPMHuffmanDecoder
+from ppm_huffman_encoder import ALPHABET, PPMHuffmanTest
+
+ESCAPE = -1  # Id do escape nas tabelas de palavras (os ids do vocabulário começam em 0)
+SEPARADOR = ' '  # Separa as palavras; na soletração, marca o fim da palavra
+# Comprimento máximo dos códigos Huffman: k=0 tem o vocabulário inteiro
+MAX_CODE_LENGTH = 32
+
+class TokenContext:
+    """Contagens das palavras que seguiram um contexto (sequência de ids)."""
+    __slots__ = ('counts', 'total', 'table')
+
+    def __init__(self):
+        self.counts = {}  # {id: contagem}
+        self.total = 0
+        self.table = None  # StaleTable (ver TokenModel.stale_table)
+
+class TokenModel:
+    """
+    Modelo PPM sobre palavras, com um vocabulário que cresce durante o texto.
+
+    O texto é dividido em palavras em cada SEPARADOR (o que inclui palavras
+    vazias, de modo que ' '.join das palavras reproduz o texto), e cada
+    palavra nova recebe o próximo id. Os contextos são as sequências das até
+    order palavras anteriores, guardadas em um dict por ordem, e o contexto
+    vazio (k=0) tem todas as palavras já vistas. Não há k=-1: o escape de k=0
+    indica uma palavra nova, soletrada pelo modelo de caracteres (ver
+    TokenEncoder).
+
+    A codificação é a do PPMModel, com exclusão das palavras dos contextos
+    já percorridos e escape com contagem igual ao número de palavras
+    distintas. Como os contextos de palavras podem ter milhares de
+    sucessores, o primeiro contexto codificado (sem exclusão) usa uma tabela
+    reconstruída periodicamente (ver stale_table) se o seu total já chegou a
+    rebuild_interval, e k=0, que tem o vocabulário inteiro, sempre usa. As
+    palavras que faltam na tabela são codificadas com escape; em k=0, as
+    acrescentadas ao vocabulário depois da última reconstrução (ids a partir
+    do tamanho do vocabulário da tabela) são escolhidas, após o escape, por
+    um código uniforme, que também indica uma palavra nova.
+
+    Não há limite de memória: o vocabulário e os contextos só crescem.
+
+    Args:
+        order (int): Número de palavras anteriores no contexto mais longo.
+        rebuild_interval (int): Crescimento do total de um contexto entre
+            reconstruções da sua tabela.
+        rescale_threshold (int): Quando o total de um contexto passa deste
+            valor, suas contagens são divididas por dois; o padrão é maior
+            que o do PPMModel porque k=0 nunca fica abaixo do tamanho do
+            vocabulário.
+    """
+    def __init__(self, order=2, rebuild_interval=64, rescale_threshold=1 << 20):
+        if rebuild_interval < 1:
+            raise ValueError("rebuild_interval deve ser positivo.")
+        self.order = order
+        self.rebuild_interval = rebuild_interval
+        self.rescale_threshold = rescale_threshold
+        self.words = []  # Vocabulário: id -> palavra
+        self.word_ids = {}
+        self.contexts = [{} for _ in range(order + 1)]  # Por ordem: {tupla de ids: TokenContext}
+        self.root = self.contexts[0][()] = TokenContext()
+
+    @property
+    def params(self):
+        """Parâmetros do modelo, além da ordem, para o cabeçalho."""
+        return {'rebuild_interval': self.rebuild_interval, 'rescale_threshold': self.rescale_threshold}
+
+    def add_word(self, word):
+        """Acrescenta word ao vocabulário e retorna o seu id."""
+        word_id = len(self.words)
+        self.words.append(word)
+        self.word_ids[word] = word_id
+        return word_id
+
+    def chain(self, history):
+        """Contextos existentes de history (tupla das últimas palavras), de k=order a k=0."""
+        for k in range(min(self.order, len(history)), -1, -1):
+            context = self.contexts[k].get(history[len(history) - k:])
+            if context is not None:
+                yield context
+
+    def coding_frequencies(self, context, excluded):
+        """
+        Frequências para codificar em context, sem as palavras de excluded,
+        com o escape. Vazio se não restar nenhuma palavra.
+        """
+        frequencies = {w: c for w, c in context.counts.items() if w not in excluded}
+        if frequencies:
+            frequencies[ESCAPE] = len(frequencies)
+        return frequencies
+
+    def uses_table(self, context, excluded):
+        """Se context é codificado pela sua StaleTable (ver stale_table)."""
+        return context is self.root or (not excluded and context.total >= self.rebuild_interval)
+
+    def stale_table(self, context, build):
+        """
+        StaleTable de context, sem exclusão e com o escape, reconstruída
+        quando o total cresce rebuild_interval, dobra ou diminui (como em
+        PPMModel.stale_table). build prepara a tabela do backend.
+        """
+        table = context.table
+        total = context.total
+        if table is None or total - table.total >= self.rebuild_interval or total >= 2 * table.total \
+                or total < table.total:
+            frequencies = dict(context.counts)
+            frequencies[ESCAPE] = len(context.counts) or 1  # k=0 ainda vazio: só o escape
+            table = context.table = StaleTable(build(frequencies), frequencies, None, total)
+        return table
+
+    def update(self, word_id, history):
+        """
+        Conta word_id em todos os contextos de history (criando os que
+        faltam) e retorna o histórico seguinte.
+        """
+        for k in range(min(self.order, len(history)) + 1):
+            key = history[len(history) - k:]
+            context = self.contexts[k].get(key)
+            if context is None:
+                context = self.contexts[k][key] = TokenContext()
+            context.counts[word_id] = context.counts.get(word_id, 0) + 1
+            context.total += 1
+            if context.total > self.rescale_threshold:
+                counts = context.counts
+                for w in counts:
+                    counts[w] = (counts[w] + 1) >> 1
+                context.total = sum(counts.values())
+        return (history + (word_id,))[-self.order:] if self.order else ()
+
+
+def tokens(chunks):
+    """
+    Divide blocos de texto em listas de palavras (separadas por SEPARADOR),
+    sem perder palavras divididas entre blocos.
+
+    Yields:
+        list: Palavras completas de cada bloco; a última lista termina com a
+            última palavra do texto (possivelmente vazia).
+    """
+    pendente = None  # Início da última palavra, que pode continuar no bloco seguinte
+    for chunk in chunks:
+        if not chunk:
+            continue
+        partes = ((pendente or "") + chunk).split(SEPARADOR)
+        pendente = partes.pop()
+        if partes:
+            yield partes
+    if pendente is not None:
+        yield [pendente]
+
+class TokenEncoder:
+    """
+    Codificador do modo de palavras: cada palavra é codificada pelo
+    TokenModel e, se for nova, soletrada (seguida de SEPARADOR) pelo modelo
+    de caracteres de um PPMHuffmanTest de ordem spell_order, no mesmo fluxo
+    de bits.
+
+    Args:
+        alphabet (iterable): Alfabeto dos caracteres, incluindo SEPARADOR.
+        order (int): Ordem do modelo de palavras.
+        spell_order (int): Ordem do modelo de caracteres das palavras novas.
+        coder (str): Backend de codificação (ver backends.py).
+        **model_params: rebuild_interval e rescale_threshold do TokenModel.
+    """
+    def __init__(self, alphabet=ALPHABET, order=2, spell_order=3, coder='huffman', **model_params):
+        if SEPARADOR not in alphabet:
+            raise ValueError("O modo de palavras requer o espaço no alfabeto.")
+        self.model = TokenModel(order, **model_params)
+        self.backend = make_backend(coder, max_length=MAX_CODE_LENGTH)
+        # As StaleTable ficam nos contextos: não vale a pena guardá-las no cache
+        self.build_table = partial(self.backend.table, cached=False)
+        self.speller = PPMHuffmanTest(alphabet, spell_order, coder=coder)
+        self.speller.backend = self.backend  # Mesmo cache de tabelas
+        self.history = ()
+        self.spell_context = self.speller.ppm.root
+        self.num_symbols = 0  # Caracteres, incluindo os separadores
+        self.num_tokens = 0
+        self.novel_words = 0
+        self.total_bits = 0
+
+    def encode_word(self, word, coder):
+        model = self.model
+        word_id = model.word_ids.get(word)
+        excluded = set()
+        frequencies = {}
+        for context in model.chain(self.history):
+            if model.uses_table(context, excluded):
+                table = model.stale_table(context, self.build_table)
+                frequencies = table.frequencies
+                coded = word_id if word_id in frequencies else ESCAPE
+                coder.encode_table(table.coding, coded)
+            else:
+                frequencies = model.coding_frequencies(context, excluded)
+                if not frequencies:
+                    continue
+                coded = word_id if word_id in frequencies else ESCAPE
+                coder.encode(frequencies, coded)
+            if coded != ESCAPE:
+                return word_id
+            if context is not model.root:  # Nada depois de k=0 usa a exclusão
+                excluded.update(frequencies)
+
+        # Depois do escape de k=0: uma palavra recente ou uma palavra nova
+        known = len(frequencies) - 1  # Palavras na tabela de k=0, a última da cadeia
+        recent = len(model.words) - known
+        coder.encode_uniform(recent if word_id is None else word_id - known, recent + 1)
+        if word_id is not None:
+            return word_id
+
+        # Palavra nova: soletrada no modelo de caracteres
+        speller = self.speller
+        symbol_ids = speller.ppm.symbol_ids
+        context = self.spell_context
+        for char in word + SEPARADOR:
+            symbol = symbol_ids.get(char)
+            if symbol is None:
+                raise ValueError(f"Símbolo fora do alfabeto: {char!r}")
+            speller.encode_symbol(symbol, context, coder)
+            context = speller.ppm.update(symbol, context)
+        self.spell_context = context
+        self.novel_words += 1
+        return model.add_word(word)
+
+    def encode_block(self, words):
+        """
+        Codifica uma lista de palavras, continuando o modelo.
+
+        Returns:
+            tuple: (número de palavras, bytes codificados).
+        """
+        buffer = io.BytesIO()
+        coder = self.backend.encoder(buffer)
+        history = self.history
+        for word in words:
+            word_id = self.encode_word(word, coder)
+            history = self.history = self.model.update(word_id, history)
+        self.total_bits += coder.bit_count
+        coder.finish()
+        # Um separador antes de cada palavra, menos a primeira do texto
+        self.num_symbols += sum(map(len, words)) + len(words) - (self.num_tokens == 0)
+        self.num_tokens += len(words)
+        return len(words), buffer.getvalue()
+
+class TokenDecoder:
+    """Decodificador correspondente ao TokenEncoder, com os mesmos parâmetros."""
+    def __init__(self, alphabet=ALPHABET, order=2, spell_order=3, coder='huffman', **model_params):
+        self.model = TokenModel(order, **model_params)
+        self.backend = make_backend(coder, max_length=MAX_CODE_LENGTH)
+        # As StaleTable ficam nos contextos: não vale a pena guardá-las no cache
+        self.build_table = partial(self.backend.table, cached=False)
+        self.speller = PPMHuffmanDecoder(alphabet, spell_order, coder=coder)
+        self.speller.backend = self.backend
+        self.separator = self.speller.ppm.symbol_ids[SEPARADOR]
+        self.history = ()
+        self.spell_context = self.speller.ppm.root
+        self.num_tokens = 0
+
+    def decode_word(self, coder):
+        """
+        Decodifica uma palavra.
+
+        Returns:
+            int: Id da palavra (já no vocabulário).
+
+        Raises:
+            ValueError: Se os dados estiverem corrompidos.
+        """
+        model = self.model
+        excluded = set()
+        frequencies = {}
+        for context in model.chain(self.history):
+            if model.uses_table(context, excluded):
+                table = model.stale_table(context, self.build_table)
+                frequencies = table.frequencies
+                word_id = coder.decode_table(table.coding)
+            else:
+                frequencies = model.coding_frequencies(context, excluded)
+                if not frequencies:
+                    continue
+                word_id = coder.decode(frequencies)
+            if word_id != ESCAPE:
+                return word_id
+            if context is not model.root:
+                excluded.update(frequencies)
+
+        known = len(frequencies) - 1
+        recent = len(model.words) - known
+        index = coder.decode_uniform(recent + 1)
+        if index < recent:
+            return known + index
+
+        speller = self.speller
+        symbols = speller.ppm.symbols
+        context = self.spell_context
+        chars = []
+        while True:
+            symbol = speller.decode_symbol(coder, context)
+            if symbol is None or coder.exhausted:
+                raise ValueError("Decodificação interrompida.")
+            context = speller.ppm.update(symbol, context)
+            if symbol == self.separator:
+                break
+            chars.append(symbols[symbol])
+        self.spell_context = context
+        return model.add_word("".join(chars))
+
+    def decode_block(self, dados, num_tokens):
+        """
+        Decodifica num_tokens palavras de um quadro.
+
+        Returns:
+            str: Texto do quadro, com o separador antes de cada palavra que não
+                seja a primeira do texto.
+        """
+        coder = self.backend.decoder(io.BytesIO(dados))
+        words = self.model.words
+        history = self.history
+        partes = []
+        for _ in range(num_tokens):
+            word_id = self.decode_word(coder)
+            if coder.exhausted:
+                raise ValueError("Decodificação interrompida.")
+            partes.append(words[word_id])
+            history = self.history = self.model.update(word_id, history)
+        texto = SEPARADOR.join(partes)
+        if self.num_tokens and num_tokens:
+            texto = SEPARADOR + texto
+        self.num_tokens += num_tokens
+        return texto
+
+
+def compress_tokens(src, dst, order=2, spell_order=3, chunk_size=CHUNK_SIZE, alphabet=ALPHABET,
+                    use_mmap=False, coder='huffman', **model_params):
+    """
+    Comprime src no modo de palavras, em quadros como compress_stream (com a
+    assinatura MAGIC_PALAVRAS); cada quadro tem as palavras completas de um
+    bloco de entrada, e o número de símbolos do quadro é o de palavras.
+
+    Args:
+        src (str | file | iterable): Entrada (ver ler_blocos), de preferência
+            normalizada (pre_processamento.preprocess_chunks).
+        dst (file): Arquivo de saída aberto para escrita binária.
+        order (int): Ordem do modelo de palavras.
+        spell_order (int): Ordem do modelo de caracteres das palavras novas.
+        chunk_size (int): Tamanho dos blocos lidos de src.
+        alphabet (iterable): Alfabeto dos caracteres, incluindo o espaço.
+        use_mmap (bool): Lê src via mmap (ver ler_blocos).
+        coder (str): Backend de codificação, gravado no cabeçalho.
+        **model_params: rebuild_interval e rescale_threshold (ver TokenModel).
+
+    Returns:
+        TokenEncoder: Codificador usado, com as estatísticas acumuladas.
+
+    Raises:
+        ValueError: Se o texto tiver um símbolo fora do alfabeto.
+    """
+    encoder = TokenEncoder(alphabet, order, spell_order, coder, **model_params)
+    params = dict(encoder.model.params, spell_order=spell_order, coder=coder)
+    escrever_cabecalho(dst, order, alphabet, params, MAGIC_PALAVRAS)
+    for palavras in tokens(ler_blocos(src, chunk_size, use_mmap)):
+        escrever_quadro(dst, *encoder.encode_block(palavras))
+    escrever_quadro(dst, 0, b"")  # Fim do fluxo
+    return encoder
+
+def decompress_tokens(src, dst):
+    """
+    Descomprime src (gerado por compress_tokens) em dst, quadro a quadro.
+
+    Returns:
+        TokenDecoder: Decodificador usado.
+
+    Raises:
+        ValueError: Se o arquivo não for reconhecido ou estiver corrompido.
+    """
+    order, alphabet, params = ler_cabecalho(src, MAGIC_PALAVRAS)
+    decoder = TokenDecoder(alphabet, order, **params)
+    while True:
+        num_tokens, dados = ler_quadro(src)
+        if num_tokens == 0:
+            return decoder
+        dst.write(decoder.decode_block(dados, num_tokens))
@@ -1,155 +1,340 @@
-import math
+import bisect
+import io
+import itertools
+import os
 import time
-import struct
-from huffman import HuffmanSimple
+import zlib
+from collections import deque
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+from backends import make_backend
+from huffman import cache_size_for
 from PPM import PPMModel
-from arquivo_utils import ler_byte
+from arquivo_utils import MAGIC_BLOCOS, alfabeto_binario, ler_cabecalho, ler_indice, ler_quadro
 
 class PPMHuffmanDecoder:
-    def __init__(self, alphabet, order):
-        self.ppm = PPMModel(alphabet, order)
-        self.huffman = HuffmanSimple()
-        self.fixed_codes = {}
-        self.reverse_fixed_codes = {}
-        
-    def update_fixed_codes(self, unseen):
-        bits_per_symbol = math.ceil(math.log2(len(unseen)))
-        self.fixed_codes = {}
-        self.reverse_fixed_codes = {}
-        for i, symbol in enumerate(sorted(unseen)):
-            code = bin(i)[2:].zfill(bits_per_symbol)
-            self.fixed_codes[symbol] = code
-            self.reverse_fixed_codes[code] = symbol
+    """
+    Decodificador correspondente ao PPMHuffmanTest, com os mesmos coder e
+    rebuild_interval (gravados no cabeçalho por compress_stream).
+
+    O cache de tabelas não altera a saída; com cache_size=None, o tamanho vem
+    da ordem e do orçamento do modelo (ver huffman.cache_size_for).
+    """
+    def __init__(self, alphabet, order, cache_size=None, instrumentation=None, snapshot=None,
+                 coder='huffman', rebuild_interval=None, **model_params):
+        if rebuild_interval is not None and rebuild_interval < 1:
+            raise ValueError("rebuild_interval deve ser positivo.")
+        if snapshot is None:
+            self.ppm = PPMModel(alphabet, order, **model_params)
+        else:
+            # Modelo pré-treinado: os parâmetros do modelo vêm do snapshot
+            if snapshot.order != order or snapshot.alphabet != set(alphabet):
+                raise ValueError("O modelo pré-treinado tem outra ordem ou outro alfabeto.")
+            self.ppm = snapshot.model()
+        if cache_size is None:
+            cache_size = cache_size_for(self.ppm.order, self.ppm.max_bytes)
+        self.backend = make_backend(coder, cache_size)
+        self.cache = self.backend.cache  # None se o backend não usa tabelas
+        self.rebuild_interval = rebuild_interval
+        self.instrumentation = instrumentation
+        if instrumentation is not None:
+            instrumentation.attach(self.ppm, self.cache)
+        self.context = self.ppm.root  # Contexto atual entre quadros
     
-    def decode_symbol(self, bitstream, history):
-        for k in range(self.ppm.order, -1, -1):
-            if k > 0:
-                if len(history) < k:
-                    continue
-                context = "".join(history[-k:])
-                if context not in self.ppm.contexts[k]:
-                    continue
-                
-                frequencies = self.ppm.contexts[k][context]['frequencies'].copy()
-                unique_symbols = len(self.ppm.contexts[k][context]['symbols'])
-
-                # Exclusão: Remove símbolos vistos em contextos de ordem superior
-                if k < self.ppm.order and len(history) >= k + 1:
-                    higher_context = "".join(history[-(k + 1):])
-                    if higher_context in self.ppm.contexts[k + 1]:
-                        seen_higher = self.ppm.contexts[k + 1][higher_context]['symbols']
-                        frequencies = {s: f for s, f in frequencies.items() if s not in seen_higher}
-                        unique_symbols = len(set(frequencies.keys()))
-            else:
-                # k = 0
-                frequencies = self.ppm.k0_frequencies.copy()
-                unique_symbols = self.ppm.k0_unique_symbols
-
-                # Exclusão: Remove símbolos vistos em contextos de ordem superior
-                if self.ppm.order > 0 and len(history) >= 1:
-                    higher_context = history[-1]
-                    if higher_context in self.ppm.contexts[1]:
-                        seen_higher = self.ppm.contexts[1][higher_context]['symbols']
-                        frequencies = {s: f for s, f in frequencies.items() if s not in seen_higher}
-                        unique_symbols = len(set(frequencies.keys()))
-
-            if frequencies:
-                freq_for_huffman = frequencies.copy()
-                if unique_symbols > 0 and len(frequencies) < len(self.ppm.alphabet):
-                    freq_for_huffman['esc'] = unique_symbols
-
-                # Verifica se todos os símbolos foram vistos
-                if len(frequencies) == len(self.ppm.alphabet):
-                    freq_for_huffman.pop('esc', None)
-
-                if not freq_for_huffman:
-                    continue
-
-                self.huffman.build_tree(freq_for_huffman)
-
-                # Tenta decodificar com os códigos Huffman atuais
-                current_code = ""
-                remaining_bits = bitstream
-                for bit in bitstream:
-                    current_code += bit
-                    remaining_bits = remaining_bits[1:]
-                    if current_code in self.huffman.codes.values():
-                        symbol = [s for s, c in self.huffman.codes.items() if c == current_code][0]
-                        
-                        if symbol == 'esc':
-                            bitstream = remaining_bits
-                            break
-                        else:
-                            return symbol, remaining_bits
+    def decode_symbol(self, coder, context):
+        """
+        Decodifica um símbolo com o decodificador do backend, partindo do
+        contexto atual context (ContextNode).
+
+        Returns:
+            O id do símbolo decodificado, ou None em caso de erro.
+        """
+        instrumentation = self.instrumentation
+        # Percorre os contextos de k=order até k=0 seguindo os sufixos
+        node = context
+        excluded = 0  # Máscara dos símbolos vistos nos contextos já percorridos
+        while node is not None:
+            if node.symbols:
+                # Exclusão: Remove símbolos vistos nos contextos de ordem superior
+                frequencies = self.ppm.coding_frequencies(node, excluded)
+                if frequencies:
+                    symbol = coder.decode(frequencies)
+                    if instrumentation is not None:
+                        instrumentation.count(node.depth, symbol != self.ppm.escape)
+                    if symbol != self.ppm.escape:
+                        return symbol
+            excluded |= node.mask
+            node = node.suffix
         
         # k = -1: equiprobabilidade para símbolos não vistos (só se ainda houver símbolos não vistos)
-        unseen = sorted(list(self.ppm.alphabet - self.ppm.seen_symbols))
+        unseen = self.ppm.unseen_symbols()
+        if instrumentation is not None:
+            instrumentation.fallbacks += 1
         if unseen:
             # Caso especial: apenas um símbolo não visto
             if len(unseen) == 1:
-                symbol = unseen[0]
-                return symbol, bitstream
-            
-            bits_needed = math.ceil(math.log2(len(unseen)))
-            
-            if len(bitstream) >= bits_needed:
-                fixed_code = bitstream[:bits_needed]
-                
-                self.update_fixed_codes(unseen)
-                
-                if fixed_code in self.reverse_fixed_codes:
-                    symbol = self.reverse_fixed_codes[fixed_code]
-                    return symbol, bitstream[bits_needed:]
-        return None, bitstream
+                return unseen[0]
 
-def main():
-    alphabet = set('abcdefghijklmnopqrstuvwxyz ')
-    order = int(input("Digite a ordem do contexto (K): "))
+            # O símbolo é identificado pelo seu índice entre os não vistos
+            index = coder.decode_uniform(len(unseen))
+            if index < len(unseen):
+                return unseen[index]
+        return None
 
-    decoder = PPMHuffmanDecoder(alphabet, order)
-    
-    history = []
-    decoded_text = []
-    bitstream = ""
-    inicio = time.time()
+    def decode_symbol_stale(self, coder, context):
+        """Versão de decode_symbol com as tabelas periódicas (ver PPMHuffmanTest.encode_symbol_stale)."""
+        ppm = self.ppm
+        instrumentation = self.instrumentation
+        interval = self.rebuild_interval
+        build = self.backend.table
+        node = context
+        excluded = 0  # Máscara das tabelas já percorridas
+        while node is not None:
+            if node.symbols:
+                table = ppm.stale_table(node, excluded, interval, build)
+                if table.mask:
+                    symbol = coder.decode_table(table.coding)
+                    if instrumentation is not None:
+                        instrumentation.count(node.depth, symbol != ppm.escape)
+                    if symbol != ppm.escape:
+                        return symbol
+                    excluded |= table.mask
+            node = node.suffix
 
-    # Leitura do arquivo binário
-    with open("arquivo_codificado.bin", "rb") as arquivo_codificado:
-        # Lê o cabeçalho
-        cabecalho = arquivo_codificado.read(4)
-        if len(cabecalho) != 4:
-            print("ERRO: Cabeçalho inválido.")
-            return
-        num_simbolos = struct.unpack("<I", cabecalho)[0]
-        
+        unseen = [i for i in range(len(ppm.symbols)) if not excluded >> i & 1]
+        if instrumentation is not None:
+            instrumentation.fallbacks += 1
+        if len(unseen) == 1:
+            return unseen[0]
+        if unseen:
+            index = coder.decode_uniform(len(unseen))
+            if index < len(unseen):
+                return unseen[index]
+        return None
 
-        # Lê os dados codificados
-        bitstream = ""
-        while True:
-            byte_lido = ler_byte(arquivo_codificado)
-            if byte_lido is None:
-                break
-            bitstream += byte_lido
+    def decode_block(self, dados, num_simbolos):
+        """
+        Decodifica num_simbolos símbolos dos bytes de um quadro ou bloco,
+        continuando a partir do contexto atual.
+
+        Returns:
+            str | bytes: Texto decodificado (bytes no modo binário).
 
-        # Decodifica os símbolos
+        Raises:
+            ValueError: Se os dados terminarem antes do esperado.
+        """
+        coder = self.backend.decoder(io.BytesIO(dados))
+        decode_symbol = self.decode_symbol if self.rebuild_interval is None else self.decode_symbol_stale
+        symbols = self.ppm.symbols
+        context = self.context
         decoded_text = []
-        history = []
-        for _ in range(num_simbolos):
-            symbol, bitstream = decoder.decode_symbol(bitstream, history)
-            if symbol is None:
-                print("ERRO: Decodificação interrompida.")
-                break
-            decoded_text.append(symbol)
-            decoder.ppm.update(symbol, history)
-            history.append(symbol)
+        if self.instrumentation is None:
+            for _ in range(num_simbolos):
+                symbol = decode_symbol(coder, context)
+                if symbol is None or coder.exhausted:
+                    raise ValueError("Decodificação interrompida.")
+                decoded_text.append(symbols[symbol])
+                context = self.ppm.update(symbol, context)
+        else:
+            times = self.instrumentation.times
+            for _ in range(num_simbolos):
+                inicio = perf_counter()
+                symbol = decode_symbol(coder, context)
+                meio = perf_counter()
+                if symbol is None or coder.exhausted:
+                    raise ValueError("Decodificação interrompida.")
+                decoded_text.append(symbols[symbol])
+                context = self.ppm.update(symbol, context)
+                times['symbol'] += meio - inicio
+                times['update'] += perf_counter() - meio
+        self.context = context
+        if self.ppm.binary:
+            return bytes(decoded_text)
+        return "".join(decoded_text)
+
+    def decode_frames(self, src):
+        """
+        Decodifica os quadros de src até o quadro final, um bloco por vez.
+
+        Args:
+            src (file): Arquivo posicionado após o cabeçalho.
+
+        Yields:
+            str: Texto decodificado de cada quadro.
+
+        Raises:
+            ValueError: Se o fluxo estiver truncado ou corrompido.
+        """
+        while True:
+            num_simbolos, dados = ler_quadro(src)
+            if num_simbolos == 0:
+                return
+            yield self.decode_block(dados, num_simbolos)
+
+def decompress_stream(src, dst, instrumentation=None, snapshot=None, cache_size=None):
+    """
+    Descomprime src (gerado por compress_stream) em dst de forma incremental.
+
+    Args:
+        src (file): Arquivo comprimido aberto para leitura binária.
+        dst (file): Arquivo de saída aberto para escrita em modo texto
+            (binária se o alfabeto for de bytes).
+        instrumentation (Instrumentation): Contadores e tempos opcionais.
+        snapshot (ModelSnapshot): Modelo pré-treinado, obrigatório se src foi
+            comprimido com um (ignorado caso contrário).
+        cache_size (int): Tabelas no cache Huffman (None = pela ordem, ver
+            huffman.cache_size_for); não altera a saída.
+
+    Returns:
+        PPMHuffmanDecoder: Decodificador usado.
+
+    Raises:
+        ValueError: Se o arquivo não for reconhecido ou estiver corrompido, ou
+            se o modelo pré-treinado não for o usado na compressão.
+    """
+    order, alphabet, params = ler_cabecalho(src)
+    crc = params.pop('snapshot', None)
+    if crc is None:
+        snapshot = None
+    elif snapshot is None or snapshot.crc != crc:
+        raise ValueError("O arquivo foi comprimido com outro modelo pré-treinado.")
+    decoder = PPMHuffmanDecoder(alphabet, order, cache_size=cache_size, instrumentation=instrumentation,
+                                snapshot=snapshot, **params)
+    for texto in decoder.decode_frames(src):
+        dst.write(texto)
+    return decoder
+
+def decompress_block(alphabet, order, model_params, dados, num_simbolos, crc, limite=None):
+    """
+    Descomprime um bloco independente, conferindo antes o CRC-32. Com limite,
+    decodifica apenas os primeiros limite símbolos do bloco. Com block_orders
+    nos parâmetros, a ordem do bloco é o primeiro byte dos dados.
+    """
+    if zlib.crc32(dados) != crc:
+        raise ValueError("CRC do bloco não confere.")
+    model_params = dict(model_params)
+    if model_params.pop('block_orders', False):
+        if not dados:
+            raise ValueError("Bloco sem a ordem.")
+        order, dados = dados[0], dados[1:]
+    decoder = PPMHuffmanDecoder(alphabet, order, **model_params)
+    if limite is not None:
+        num_simbolos = min(num_simbolos, limite)
+    return decoder.decode_block(dados, num_simbolos)
+
+def read_block(src, entrada):
+    """Lê os bytes de um bloco do contêiner a partir da sua entrada no índice."""
+    posicao, tamanho, num_simbolos, crc = entrada
+    src.seek(posicao)
+    dados = src.read(tamanho)
+    if len(dados) != tamanho:
+        raise ValueError("Contêiner truncado.")
+    return dados, num_simbolos, crc
+
+def decompress_blocks(src, dst, workers=None):
+    """
+    Descomprime um contêiner gerado por compress_blocks, decodificando os
+    blocos em paralelo e escrevendo-os em ordem.
+
+    Args:
+        src (file): Arquivo comprimido aberto para leitura binária (com seek).
+        dst (file): Arquivo de saída aberto para escrita em modo texto.
+        workers (int): Processos usados (None = número de CPUs, 1 = sem processos).
+
+    Returns:
+        int: Número de símbolos decodificados.
+
+    Raises:
+        ValueError: Se o contêiner estiver corrompido.
+    """
+    indice = ler_indice(src)
+    src.seek(0)
+    order, alphabet, params = ler_cabecalho(src, MAGIC_BLOCOS)
+    total = 0
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for entrada in indice:
+            texto = decompress_block(alphabet, order, params, *read_block(src, entrada))
+            dst.write(texto)
+            total += len(texto)
+        return total
+
+    with ProcessPoolExecutor(workers) as executor:
+        # Limita os blocos em andamento para não carregar o contêiner inteiro
+        pendentes = deque()
+        for entrada in indice:
+            pendentes.append(executor.submit(decompress_block, alphabet, order, params,
+                                             *read_block(src, entrada)))
+            if len(pendentes) >= 2 * workers:
+                texto = pendentes.popleft().result()
+                dst.write(texto)
+                total += len(texto)
+        while pendentes:
+            texto = pendentes.popleft().result()
+            dst.write(texto)
+            total += len(texto)
+    return total
+
+def decompress_range(src, start, length):
+    """
+    Descomprime apenas os símbolos [start, start + length) de um contêiner
+    gerado por compress_blocks.
+
+    Cada bloco recomeça o modelo, então o início de cada bloco é um ponto de
+    acesso: o índice dá o deslocamento em bytes e, acumulando os números de
+    símbolos, a posição no texto. Só os blocos que cobrem o intervalo são
+    lidos, e o último é decodificado só até o fim do intervalo. O espaçamento
+    dos pontos de acesso é o block_size usado na compressão.
+
+    Args:
+        src (str | file): Caminho ou arquivo comprimido (com seek).
+        start (int): Posição do primeiro símbolo.
+        length (int): Número de símbolos (menos, se o texto acabar antes).
+
+    Returns:
+        str | bytes: Texto do intervalo (bytes no modo binário).
+
+    Raises:
+        ValueError: Se o intervalo for inválido ou o contêiner estiver corrompido.
+    """
+    if start < 0 or length < 0:
+        raise ValueError("Intervalo inválido.")
+    if isinstance(src, (str, os.PathLike)):
+        with open(src, 'rb') as arquivo:
+            return decompress_range(arquivo, start, length)
+
+    indice = ler_indice(src)
+    src.seek(0)
+    order, alphabet, params = ler_cabecalho(src, MAGIC_BLOCOS)
+
+    # Posição no texto do primeiro símbolo de cada bloco
+    inicios = list(itertools.accumulate((entrada[2] for entrada in indice), initial=0))
+    fim = min(start + length, inicios[-1])
+    partes = []
+    bloco = bisect.bisect_right(inicios, start) - 1
+    while start < fim and inicios[bloco] < fim:
+        texto = decompress_block(alphabet, order, params, *read_block(src, indice[bloco]),
+                                 limite=fim - inicios[bloco])
+        partes.append(texto[max(start - inicios[bloco], 0):])
+        bloco += 1
+    return (b"" if alfabeto_binario(alphabet) else "").join(partes)
+
+def main():
+    inicio = time.time()
+
+    # Leitura do arquivo binário; a ordem e o alfabeto vêm do cabeçalho
+    with open("arquivo_codificado.bin", "rb") as arquivo_codificado, \
+            open("arquivo_decodificado.txt", "w") as arquivo_decodificado:
+        try:
+            decompress_stream(arquivo_codificado, arquivo_decodificado)
+        except ValueError as erro:
+            print(f"ERRO: {erro}")
+            return
     
     fim = time.time()
     tempo_execucao = fim - inicio
 
-    # Salva o texto decodificado em um arquivo
-    with open("arquivo_decodificado.txt", "w") as arquivo_decodificado:
-        arquivo_decodificado.write("".join(decoded_text))
-
     print("\nDecodificação concluída!")
     print(f"Tempo levado para descomprimir: {tempo_execucao:.2f} segundos")
 
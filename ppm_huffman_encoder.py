@@ -1,157 +1,396 @@
+import io
 import math
+import os
 import time
-import struct
-from huffman import HuffmanSimple
+import zlib
+from collections import deque
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+from backends import make_backend
+from huffman import cache_size_for
 from PPM import PPMModel
-from arquivo_utils import escrever_byte, escrever_bits_restantes
+from arquivo_utils import (BLOCK_SIZE, CHUNK_SIZE, MAGIC_BLOCOS, escrever_cabecalho,
+                           escrever_indice, escrever_quadro, ler_blocos)
+from instrumentacao import Instrumentation
+
+ALPHABET = set('abcdefghijklmnopqrstuvwxyz ')
+BYTE_ALPHABET = range(256)  # Alfabeto do modo binário: a entrada é bytes
 
 class PPMHuffmanTest:
-    def __init__(self, alphabet, order):
-        self.ppm = PPMModel(alphabet, order)
-        self.huffman = HuffmanSimple()
-        self.encoded_bits = []
-        self.fixed_codes = {}
-
-    def update_fixed_codes(self, unseen):
-        bits_per_symbol = math.ceil(math.log2(len(unseen)))
-        for i, symbol in enumerate(sorted(unseen)):
-            self.fixed_codes[symbol] = bin(i)[2:].zfill(bits_per_symbol)
-
-    def encode_symbol(self, symbol, history):
-        codes = []  # Lista para armazenar os códigos gerados
-
-        # Verifica contextos de k=order até k=-1
-        for k in range(self.ppm.order, -2, -1):
-            if k >= 0:
-                # Para k > 0, verifica contexto específico
-                if k > 0:
-                    if len(history) < k:
-                        continue
-                    context = "".join(history[-k:])
-                    if context not in self.ppm.contexts[k]:
-                        continue
-                    frequencies = self.ppm.contexts[k][context]['frequencies'].copy()
-                    unique_symbols = len(self.ppm.contexts[k][context]['symbols'])
-
-                    # Exclusão: Remove símbolos vistos em contextos de ordem superior
-                    if k < self.ppm.order and len(history) >= k + 1:
-                        higher_context = "".join(history[-(k + 1):])
-                        if higher_context in self.ppm.contexts[k + 1]:
-                            seen_higher = self.ppm.contexts[k + 1][higher_context]['symbols']
-                            frequencies = {s: f for s, f in frequencies.items() if s not in seen_higher}
-                            unique_symbols = len(set(frequencies.keys()))
-
-                # Para k = 0
-                else:
-                    frequencies = self.ppm.k0_frequencies.copy()
-                    unique_symbols = self.ppm.k0_unique_symbols
-
-                    # Exclusão: Remove símbolos vistos em contextos de ordem superior
-                    if self.ppm.order > 0 and len(history) >= 1:
-                        higher_context = history[-1]
-                        if higher_context in self.ppm.contexts[1]:
-                            seen_higher = self.ppm.contexts[1][higher_context]['symbols']
-                            frequencies = {s: f for s, f in frequencies.items() if s not in seen_higher}
-                            unique_symbols = len(set(frequencies.keys()))
+    """
+    Codificador PPM com o backend coder (ver backends.py).
+
+    Com rebuild_interval, a tabela de cada contexto só é refeita quando o
+    total do contexto cresce rebuild_interval (ou dobra) desde a última
+    construção, trocando um pouco de compressão por velocidade (ver
+    PPMModel.stale_table); o decodificador precisa do mesmo valor.
+
+    O cache de tabelas não altera a saída; com cache_size=None, o tamanho vem
+    da ordem e do orçamento do modelo (ver huffman.cache_size_for).
+    """
+    def __init__(self, alphabet, order, cache_size=None, instrumentation=None, snapshot=None,
+                 coder='huffman', rebuild_interval=None, **model_params):
+        if rebuild_interval is not None and rebuild_interval < 1:
+            raise ValueError("rebuild_interval deve ser positivo.")
+        if snapshot is None:
+            self.ppm = PPMModel(alphabet, order, **model_params)
+        else:
+            # Modelo pré-treinado: os parâmetros do modelo vêm do snapshot
+            if snapshot.order != order or snapshot.alphabet != set(alphabet):
+                raise ValueError("O modelo pré-treinado tem outra ordem ou outro alfabeto.")
+            self.ppm = snapshot.model()
+        if cache_size is None:
+            cache_size = cache_size_for(self.ppm.order, self.ppm.max_bytes)
+        self.backend = make_backend(coder, cache_size)
+        self.cache = self.backend.cache  # None se o backend não usa tabelas
+        self.rebuild_interval = rebuild_interval
+        self.instrumentation = instrumentation
+        if instrumentation is not None:
+            instrumentation.attach(self.ppm, self.cache)
+        self.context = self.ppm.root  # Contexto atual entre blocos
+        # Estatísticas acumuladas por encode_chunks
+        self.num_symbols = 0
+        self.total_bits = 0
+        self.total_entropy = 0.0  # Só com stats: entropia do contexto de codificação
+        self.ideal_bits = 0.0  # Só com stats: soma de -log2 p dos códigos escritos
 
+    def encode_symbol(self, symbol, context, coder, stats=False):
+        """
+        Codifica symbol (id) com o codificador do backend (escapes e símbolo),
+        partindo do contexto atual context (ContextNode).
+
+        Com stats, acumula em total_entropy a entropia do primeiro contexto
+        usado e em ideal_bits o comprimento ideal dos códigos escritos, a
+        partir das mesmas distribuições usadas na codificação.
+        """
+        instrumentation = self.instrumentation
+        # Percorre os contextos de k=order até k=0 seguindo os sufixos
+        node = context
+        excluded = 0  # Máscara dos símbolos vistos nos contextos já percorridos
+        first = True
+        while node is not None:
+            if node.symbols:
+                # Exclusão: Remove símbolos vistos nos contextos de ordem superior
+                frequencies = self.ppm.coding_frequencies(node, excluded)
                 if frequencies:
-                    freq_for_huffman = {k: int(v) for k, v in frequencies.items()}  # Converte valores para inteiros
-                    if unique_symbols > 0:
-                        freq_for_huffman['esc'] = unique_symbols
-
-                    # Verifica se todos os símbolos foram vistos
-                    if len(frequencies) == len(self.ppm.alphabet):
-                        freq_for_huffman.pop('esc', None)
-
-                    self.huffman.build_tree(freq_for_huffman)
-
-                    # Calcula a probabilidade do símbolo
-                    if symbol in frequencies:
-                        if codes:  # Se já tem códigos de escape acumulados
-                            codes.append(self.huffman.codes[symbol])
-                            return "".join(codes)
-                        else:
-                            return self.huffman.codes[symbol]
-                    else:
-                        codes.append(self.huffman.codes['esc'])
-
-            # k = -1: equiprobabilidade para símbolos não vistos
-            else:
-                unseen = sorted(list(self.ppm.alphabet - self.ppm.seen_symbols))
-                if unseen:
-                    self.update_fixed_codes(unseen)
-                    if len(unseen) == 1:
-                        return "".join(codes) if codes else ""
-                    if symbol in unseen:
-                        
-                        if codes:  # Se já tem códigos de escape
-                            codes.append(self.fixed_codes[symbol])
-                            return "".join(codes)
-                        else:
-                            return self.fixed_codes[symbol]
-
-        return "".join(codes) if codes else None
+                    coded = symbol if symbol in frequencies else self.ppm.escape
+                    coder.encode(frequencies, coded)
+                    if stats:
+                        if first:
+                            self.total_entropy += self.ppm.context_entropy(node)
+                            first = False
+                        self.ideal_bits += coder.ideal_length(frequencies, coded)
+                    if instrumentation is not None:
+                        instrumentation.count(node.depth, coded == symbol)
+                    if coded == symbol:
+                        return
+            excluded |= node.mask
+            node = node.suffix
+
+        # k = -1: equiprobabilidade para símbolos não vistos
+        unseen = self.ppm.unseen_symbols()
+        if instrumentation is not None:
+            instrumentation.fallbacks += 1
+        if stats and len(unseen) > 1:
+            if first:
+                self.total_entropy += math.log2(len(unseen))
+            self.ideal_bits += math.log2(len(unseen))
+        # O símbolo é identificado pelo seu índice entre os não vistos
+        coder.encode_uniform(self.ppm.unseen_index(symbol), len(unseen))
+
+    def encode_symbol_stale(self, symbol, context, coder, stats=False):
+        """
+        Versão de encode_symbol com as tabelas periódicas (rebuild_interval).
+
+        Cada contexto usa a StaleTable da exclusão atual e é pulado se ela não
+        tiver símbolos. A exclusão e k=-1 usam a máscara das tabelas: um
+        símbolo que ainda não está na tabela de nenhum contexto vai para k=-1
+        mesmo que já tenha sido contado.
+        """
+        ppm = self.ppm
+        instrumentation = self.instrumentation
+        interval = self.rebuild_interval
+        build = self.backend.table
+        node = context
+        excluded = 0  # Máscara das tabelas já percorridas
+        first = True
+        while node is not None:
+            if node.symbols:
+                table = ppm.stale_table(node, excluded, interval, build)
+                if table.mask:
+                    coded = symbol if table.mask >> symbol & 1 else ppm.escape
+                    coder.encode_table(table.coding, coded)
+                    if stats:
+                        if first:
+                            self.total_entropy += table.entropy
+                            first = False
+                        self.ideal_bits += coder.ideal_length(table.frequencies, coded)
+                    if instrumentation is not None:
+                        instrumentation.count(node.depth, coded == symbol)
+                    if coded == symbol:
+                        return
+                    excluded |= table.mask
+            node = node.suffix
+
+        # k = -1: símbolos fora de todas as tabelas percorridas
+        unseen = [i for i in range(len(ppm.symbols)) if not excluded >> i & 1]
+        if instrumentation is not None:
+            instrumentation.fallbacks += 1
+        if stats and len(unseen) > 1:
+            if first:
+                self.total_entropy += math.log2(len(unseen))
+            self.ideal_bits += math.log2(len(unseen))
+        coder.encode_uniform(unseen.index(symbol), len(unseen))
+
+    def encode_block(self, text, stats=False):
+        """
+        Codifica um bloco de texto (não vazio) continuando a partir do
+        contexto atual, que fica guardado para o bloco seguinte. O bloco é
+        finalizado pelo backend (completado até o byte seguinte).
+
+        Args:
+            text (str | bytes): Texto do bloco (bytes ou memoryview no modo
+                binário).
+            stats (bool): Acumula total_entropy e ideal_bits (ver encode_symbol).
+
+        Returns:
+            tuple: (número de símbolos, bytes codificados).
+
+        Raises:
+            ValueError: Se o texto tiver um símbolo fora do alfabeto.
+        """
+        if self.ppm.identity and not isinstance(text, str):
+            symbols = text  # Bytes já são os ids
+        else:
+            symbol_ids = self.ppm.symbol_ids
+            try:
+                symbols = [symbol_ids[symbol] for symbol in text]
+            except KeyError as erro:
+                raise ValueError(f"Símbolo fora do alfabeto: {erro.args[0]!r}") from None
+
+        encode_symbol = self.encode_symbol if self.rebuild_interval is None else self.encode_symbol_stale
+        context = self.context
+        buffer = io.BytesIO()
+        coder = self.backend.encoder(buffer)
+        if self.instrumentation is None:
+            for symbol in symbols:
+                encode_symbol(symbol, context, coder, stats)
+
+                context = self.ppm.update(symbol, context)
+        else:
+            times = self.instrumentation.times
+            for symbol in symbols:
+                inicio = perf_counter()
+                encode_symbol(symbol, context, coder, stats)
+                meio = perf_counter()
+                context = self.ppm.update(symbol, context)
+                times['symbol'] += meio - inicio
+                times['update'] += perf_counter() - meio
+        self.context = context
+
+        self.total_bits += coder.bit_count
+        coder.finish()
+        self.num_symbols += len(text)
+        return len(text), buffer.getvalue()
+
+    def encode_chunks(self, chunks, stats=False):
+        """
+        Codifica blocos de texto, gerando um quadro comprimido por bloco (ver
+        encode_block).
+
+        O modelo continua entre os blocos e só o nó do contexto atual é
+        mantido, de modo que a memória fica limitada ao modelo mais um bloco.
+
+        Args:
+            chunks (iterable): Blocos de texto (str).
+            stats (bool): Acumula total_entropy e ideal_bits (ver encode_symbol).
+
+        Yields:
+            tuple: (número de símbolos, bytes codificados) de cada bloco.
+
+        Raises:
+            ValueError: Se o texto tiver um símbolo fora do alfabeto.
+        """
+        for chunk in chunks:
+            if chunk:  # Um quadro vazio marcaria o fim do fluxo
+                yield self.encode_block(chunk, stats)
+
+def compress_stream(src, dst, order, chunk_size=CHUNK_SIZE, alphabet=ALPHABET,
+                    use_mmap=False, stats=False, instrumentation=None, snapshot=None, coder='huffman',
+                    rebuild_interval=None, **model_params):
+    """
+    Comprime src em dst de forma incremental.
+
+    Args:
+        src (str | file | iterable): Caminho, arquivo de entrada (texto ou
+            binário) ou iterável de blocos de texto (ver ler_blocos).
+        dst (file): Arquivo de saída aberto para escrita binária.
+        order (int): Ordem do modelo PPM.
+        chunk_size (int): Tamanho dos blocos lidos de src.
+        alphabet (iterable): Alfabeto dos símbolos de entrada; com
+            BYTE_ALPHABET, src é lido como bytes, sem decodificar.
+        use_mmap (bool): Lê src via mmap (ver ler_blocos).
+        stats (bool): Calcula a entropia e o comprimento ideal durante a codificação.
+        instrumentation (Instrumentation): Contadores e tempos opcionais.
+        snapshot (ModelSnapshot): Modelo pré-treinado usado como ponto de
+            partida (com a mesma ordem e alfabeto); seu CRC-32 vai no cabeçalho.
+        coder (str): Backend de codificação, 'huffman' ou 'range' (ver
+            backends.py), gravado no cabeçalho.
+        rebuild_interval (int): Reconstrução periódica das tabelas (ver
+            PPMHuffmanTest; None = a cada símbolo), gravada no cabeçalho.
+        **model_params: Orçamento de memória e reescala do PPMModel
+            (max_nodes, max_bytes, policy, rescale_threshold), gravados no
+            cabeçalho para o decodificador.
+
+    Returns:
+        PPMHuffmanTest: Codificador usado, com as estatísticas acumuladas.
+
+    Raises:
+        ValueError: Se chunk_size não for positivo ou os parâmetros forem inválidos.
+    """
+    encoder = PPMHuffmanTest(alphabet, order, instrumentation=instrumentation, snapshot=snapshot,
+                             coder=coder, rebuild_interval=rebuild_interval, **model_params)
+    params = dict(encoder.ppm.params, coder=coder, rebuild_interval=rebuild_interval)
+    if snapshot is not None:
+        params['snapshot'] = snapshot.crc
+    blocos = ler_blocos(src, chunk_size, use_mmap, encoder.ppm.binary)
+    escrever_cabecalho(dst, order, alphabet, params)
+    for num_simbolos, dados in encoder.encode_chunks(blocos, stats):
+        escrever_quadro(dst, num_simbolos, dados)
+    escrever_quadro(dst, 0, b"")  # Fim do fluxo
+    return encoder
+
+def compress_block(alphabet, order, model_params, text, selector=None, instrumented=False):
+    """
+    Comprime um bloco de texto com um modelo próprio, independente dos demais.
+    Com selector (ordem_automatica.OrderSelector), a ordem é escolhida para o
+    bloco e gravada no primeiro byte dos dados. Com instrumented, o bloco é
+    codificado com uma Instrumentation própria, devolvida já desligada do
+    modelo (ver Instrumentation.detach).
+
+    Returns:
+        tuple: (número de símbolos, bytes codificados, CRC-32 dos bytes,
+            Instrumentation ou None).
+    """
+    if selector is not None:
+        order = selector.select(text, alphabet, **model_params)[0]
+    instrumentation = Instrumentation() if instrumented else None
+    encoder = PPMHuffmanTest(alphabet, order, instrumentation=instrumentation, **model_params)
+    num_simbolos, dados = encoder.encode_block(text)
+    if selector is not None:
+        dados = bytes([order]) + dados
+    if instrumentation is not None:
+        instrumentation.detach()
+    return num_simbolos, dados, zlib.crc32(dados), instrumentation
+
+def compress_blocks(src, dst, order, block_size=BLOCK_SIZE, workers=None, alphabet=ALPHABET,
+                    use_mmap=False, coder='huffman', rebuild_interval=None, selector=None,
+                    instrumentation=None, **model_params):
+    """
+    Comprime src em blocos independentes, em paralelo, num contêiner indexado.
+
+    Cada bloco tem o seu próprio PPMModel, de modo que os blocos podem ser
+    comprimidos (e descomprimidos) em processos separados. O contêiner tem o
+    cabeçalho de compress_stream (com a assinatura MAGIC_BLOCOS), os blocos na
+    ordem da entrada e, no fim, o índice com deslocamento, tamanho, número de
+    símbolos (64 bits) e CRC-32 de cada bloco, seguido de um rodapé com o
+    CRC-32 do cabeçalho e do índice.
+
+    Com selector, cada bloco tem a sua ordem, escolhida pelo teste das
+    amostras do próprio bloco no processo que o comprime; o cabeçalho marca
+    block_orders e a ordem de cada bloco vai no primeiro byte dos seus dados.
+
+    Args:
+        src (str | file | iterable): Caminho, arquivo de entrada (texto ou
+            binário) ou iterável de blocos de texto (ver ler_blocos).
+        dst (file): Arquivo de saída aberto para escrita binária.
+        order (int): Ordem do modelo PPM.
+        block_size (int): Tamanho de cada bloco de entrada.
+        workers (int): Processos usados (None = número de CPUs, 1 = sem processos).
+        alphabet (iterable): Alfabeto dos símbolos de entrada.
+        use_mmap (bool): Lê src via mmap (ver ler_blocos).
+        coder (str): Backend de codificação (ver compress_stream).
+        rebuild_interval (int): Reconstrução periódica das tabelas (ver compress_stream).
+        selector (OrderSelector): Escolha da ordem por bloco (None = order
+            em todos os blocos; o cabeçalho fica com a maior candidata).
+        instrumentation (Instrumentation): Recebe a soma das instrumentações
+            de todos os blocos (ver Instrumentation.merge).
+        **model_params: Parâmetros do PPMModel (ver compress_stream).
+
+    Returns:
+        list: Entradas do índice, (deslocamento, tamanho, símbolos, CRC-32).
+
+    Raises:
+        ValueError: Se block_size não for positivo ou os parâmetros forem inválidos.
+    """
+    # Valida os parâmetros antes de escrever o cabeçalho
+    encoder = PPMHuffmanTest(alphabet, order, coder=coder, rebuild_interval=rebuild_interval,
+                             **model_params)
+    blocos = ler_blocos(src, block_size, use_mmap, encoder.ppm.binary)
+    model_params = dict(encoder.ppm.params, coder=coder, rebuild_interval=rebuild_interval)
+    params = dict(model_params)
+    if selector is not None:
+        order = selector.orders[-1]
+        params['block_orders'] = True
+    cabecalho = escrever_cabecalho(dst, order, alphabet, params, MAGIC_BLOCOS)
+    posicao = len(cabecalho)
+    indice = []
+
+    def escrever(resultado):
+        nonlocal posicao
+        num_simbolos, dados, crc, instrumentacao_bloco = resultado
+        if instrumentacao_bloco is not None:
+            instrumentation.merge(instrumentacao_bloco)
+        dst.write(dados)
+        indice.append((posicao, len(dados), num_simbolos, crc))
+        posicao += len(dados)
+
+    instrumented = instrumentation is not None
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for bloco in blocos:
+            escrever(compress_block(alphabet, order, model_params, bloco, selector, instrumented))
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            # Limita os blocos em andamento para não carregar a entrada inteira
+            pendentes = deque()
+            limite = 2 * workers
+            for bloco in blocos:
+                pendentes.append(executor.submit(compress_block, alphabet, order, model_params, bloco,
+                                                 selector, instrumented))
+                if len(pendentes) >= limite:
+                    escrever(pendentes.popleft().result())
+            while pendentes:
+                escrever(pendentes.popleft().result())
+
+    escrever_indice(dst, posicao, indice, cabecalho)
+    return indice
 
 def main():
-    alphabet = set('abcdefghijklmnopqrstuvwxyz ')
     order = int(input("Digite a ordem do contexto (K): "))
-
-    model = PPMHuffmanTest(alphabet, order)
+    inicio = time.time()
 
     try:
-        with open("memorias_processed.txt", "r") as arquivo:
-            text = arquivo.read()
-            print(f"Processando texto do arquivo 'memorias_processed.txt' (tamanho: {len(text)} caracteres)")
+        with open("memorias_processed.txt", "rb") as arquivo, \
+                open("arquivo_codificado.bin", "wb") as arquivo_codificado:
+            print("Processando texto do arquivo 'memorias_processed.txt'")
+            model = compress_stream(arquivo, arquivo_codificado, order, use_mmap=True, stats=True)
     except FileNotFoundError:
         print("Arquivo 'memorias_processed.txt' não encontrado.")
         return
 
-    history = []
-    bit_codificado = ""
-    entropia_total = 0.0
-    contador_bit = 0
-    num_simbolos = len(text)
-    inicio = time.time()
-
-    with open("arquivo_codificado.bin", "wb") as arquivo_codificado:
-        # Codifica os símbolos
-        for symbol in text:
-            # Calcula a entropia antes de codificar
-            entropia = model.ppm.calculate_entropy(history)
-            entropia_total += entropia
-            
-            code = model.encode_symbol(symbol, history)
-            if code:
-                bit_codificado += code
-
-            model.ppm.update(symbol, history)
-            history.append(symbol)
-
-        # Escreve o cabeçalho e dados
-        arquivo_codificado.write(struct.pack("<I", num_simbolos))
-        
-        # Escreve todos os bits completos (múltiplos de 8)
-        for i in range(0, len(bit_codificado), 8):
-            byte = bit_codificado[i:i+8]
-            if len(byte) == 8:
-                contador_bit += 8
-                escrever_byte(arquivo_codificado, byte)
-        
-        # Escreve bits restantes (se houver)
-        bits_restantes = len(bit_codificado) % 8
-        if bits_restantes > 0:
-            contador_bit += 8 - bits_restantes
-            escrever_bits_restantes(arquivo_codificado, bit_codificado[-bits_restantes:])
-
     fim = time.time()
     tempo_execucao = fim - inicio
 
     #Calcula a entropia média
-    entropia_media = entropia_total / num_simbolos
-    comprimento_medio = contador_bit / num_simbolos
-    print("\nCodificação concluída. Dados escritos em 'arquivo_codificado.bin'.")
+    num_simbolos = max(model.num_symbols, 1)
+    entropia_media = model.total_entropy / num_simbolos
+    comprimento_medio = model.total_bits / num_simbolos
+    comprimento_ideal = model.ideal_bits / num_simbolos
+    print(f"\nCodificação concluída ({model.num_symbols} caracteres). Dados escritos em 'arquivo_codificado.bin'.")
     print(f"Tempo levado para comprimir: {tempo_execucao:.2f} segundos")
     print(f"Comprimento médio: {comprimento_medio: .4f} bits/símbolo")
+    print(f"Comprimento ideal: {comprimento_ideal:.4f} bits/símbolo")
     print(f"Entropia média: {entropia_media:.4f} bits/símbolo")
 
 if __name__ == "__main__":
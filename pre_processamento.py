@@ -1,5 +1,8 @@
-import unicodedata
+import codecs
+import itertools
 import re
+import unicodedata
+from arquivo_utils import CHUNK_SIZE, ler_blocos
 
 def fix_double_encoding(text):
     try:
@@ -7,88 +10,189 @@ def fix_double_encoding(text):
     except UnicodeError:
         return text
 
-def remove_artifacts(text):
-    # Removendo artefatos e convertendo tudo para minusculo
-    
+# Sequências de caracteres UTF-8 lidos como cp1252 (mojibake) e sua substituição
+MOJIBAKE = {
     # Primeiro tratar os travessões e outros símbolos especiais
-    text = text.replace('â€”', ' ')  # Travessão -> espaço â€“
-    text = text.replace('â€“', ' ')  # Travessão -> espaço
-    text = text.replace('â€œ', ' ')  # Aspas esquerda -> espaço
-    text = text.replace('â€', ' ')  # Aspas direita -> espaço
-    text = text.replace('â€™', ' ')  # Apóstrofo -> espaço
+    'â€”': ' ',  # Travessão -> espaço â€“
+    'â€“': ' ',  # Travessão -> espaço
+    'â€œ': ' ',  # Aspas esquerda -> espaço
+    'â€': ' ',  # Aspas direita -> espaço
+    'â€™': ' ',  # Apóstrofo -> espaço
 
     # Acentos agudos (á, é, í, ó, ú)
-    text = text.replace('Ã', 'a')  # Á -> a
-    text = text.replace('Ã¡', 'a')  # á -> a
-    text = text.replace('Ã‰', 'e')  # É -> e
-    text = text.replace('Ã©', 'e')  # é -> e
-    text = text.replace('Ã', 'i')  # Í -> i
-    text = text.replace('Ã­', 'i')  # í -> i
-    text = text.replace('Ã“', 'o')  # Ó -> o
-    text = text.replace('Ã³', 'o')  # ó -> o
-    text = text.replace('Ãš', 'u')  # Ú -> u
-    text = text.replace('Ãº', 'u')  # ú -> u
+    'Ã': 'a',  # Á -> a
+    'Ã¡': 'a',  # á -> a
+    'Ã‰': 'e',  # É -> e
+    'Ã©': 'e',  # é -> e
+    'Ã': 'i',  # Í -> i
+    'Ã­': 'i',  # í -> i
+    'Ã“': 'o',  # Ó -> o
+    'Ã³': 'o',  # ó -> o
+    'Ãš': 'u',  # Ú -> u
+    'Ãº': 'u',  # ú -> u
 
     # Acentos graves (à)
-    text = text.replace('Ã€', 'a')  # À -> a
-    text = text.replace('Ã ', 'a')  # à -> a
-    text = text.replace('Ã¨', 'e')  # È -> e
+    'Ã€': 'a',  # À -> a
+    'Ã ': 'a',  # à -> a
+    'Ã¨': 'e',  # È -> e
 
     # Acentos circunflexos (â, ê, î, ô, û)
-    text = text.replace('Ã‚', 'a')  # Â -> a
-    text = text.replace('Ã¢', 'a')  # â -> a
-    text = text.replace('Ãª', 'e')  # ê -> e
-    text = text.replace('Ã®', 'i')  # î -> i
-    text = text.replace('Ã´', 'o')  # ô -> o
-    text = text.replace('Ã»', 'u')  # û -> u
+    'Ã‚': 'a',  # Â -> a
+    'Ã¢': 'a',  # â -> a
+    'Ãª': 'e',  # ê -> e
+    'Ã®': 'i',  # î -> i
+    'Ã´': 'o',  # ô -> o
+    'Ã»': 'u',  # û -> u
 
     # Til (ã, õ)
-    text = text.replace('Ãƒ', 'a')  # Ã -> a
-    text = text.replace('Ã£', 'a')  # ã -> a
-    text = text.replace('Ã±', 'n')  # ñ -> n
-    text = text.replace('Ã•', 'o')  # Õ -> o
-    text = text.replace('Ãµ', 'o')  # õ -> o
-    
+    'Ãƒ': 'a',  # Ã -> a
+    'Ã£': 'a',  # ã -> a
+    'Ã±': 'n',  # ñ -> n
+    'Ã•': 'o',  # Õ -> o
+    'Ãµ': 'o',  # õ -> o
+
     # Cedilha (ç)
-    text = text.replace('Ã‡', 'c')  # Ç -> c
-    text = text.replace('Ã§', 'c')  # ç -> c
+    'Ã‡': 'c',  # Ç -> c
+    'Ã§': 'c',  # ç -> c
 
     # Trema (ü)
-    text = text.replace('Ã¼', 'u')  # ü -> u
-    text = text.replace("Âº", "") # nº
+    'Ã¼': 'u',  # ü -> u
+    "Âº": "",  # nº
+}
+
+MAX_MOJIBAKE = max(map(len, MOJIBAKE))
+# Toda sequência começa por um destes caracteres
+INICIAIS_MOJIBAKE = frozenset(sequencia[0] for sequencia in MOJIBAKE)
+
+# Números, pontuação e espaços: cada sequência vira um único espaço
+LIMPEZA_RE = re.compile(r'[\W\d]+')
+
+def clean_text(text):
+    """
+    Substitui o mojibake, troca números/pontuação/espaços por um espaço e
+    converte para minúsculas.
+
+    As substituições são feitas em cadeia, na ordem de MOJIBAKE: o espaço
+    de um travessão depois de um 'Ã' forma 'Ã ', que vira 'a'.
+    """
+    for sequencia, substituta in MOJIBAKE.items():
+        text = text.replace(sequencia, substituta)
+    return LIMPEZA_RE.sub(' ', text).lower()
+
+def remove_artifacts(text):
+    # Removendo artefatos e convertendo tudo para minusculo
+    return "".join(normalize_chunks([text]))
+
+def fix_double_encoding_chunks(chunks, amostra=CHUNK_SIZE):
+    """
+    Versão incremental de fix_double_encoding.
+
+    Como o texto não é lido inteiro, a correção é decidida pelos primeiros
+    amostra caracteres: se eles não forem UTF-8 lido como latin1, nenhum bloco
+    é alterado. Se forem, os blocos seguintes passam por um decodificador
+    incremental (que trata sequências divididas entre blocos), e um bloco
+    posterior que não puder ser corrigido passa sem alteração.
+    """
+    chunks = iter(chunks)
+    inicio = []
+    tamanho = 0
+    for chunk in chunks:
+        inicio.append(chunk)
+        tamanho += len(chunk)
+        if tamanho >= amostra:
+            break
+    texto = "".join(inicio)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        texto = decoder.decode(texto.encode('latin1'))
+    except UnicodeError:
+        if texto:
+            yield texto
+        yield from chunks
+        return
+
+    if texto:
+        yield texto
+    for chunk in chunks:
+        pendente = decoder.getstate()[0]
+        try:
+            chunk = decoder.decode(chunk.encode('latin1'))
+        except UnicodeError:
+            decoder.reset()
+            chunk = pendente.decode('latin1') + chunk
+        if chunk:
+            yield chunk
+    resto = decoder.getstate()[0]
+    if resto:
+        yield resto.decode('latin1')
+
+def normalize_chunks(chunks):
+    """
+    Normaliza blocos de texto em uma passada: cada bloco passa uma vez por
+    clean_text, com o mesmo resultado para o texto inteiro, independentemente
+    do tamanho dos blocos.
+
+    Os últimos caracteres de um bloco que podem iniciar uma sequência de
+    MOJIBAKE (ou uma cadeia, como 'Ã' seguido de 'â€”') ficam para o bloco
+    seguinte, e um espaço no fim de um bloco só é emitido quando aparece mais
+    texto (o que equivale ao strip no fim).
+
+    Args:
+        chunks (iterable): Blocos de texto (str).
 
-    # Remove todos os números substituindo por espaço
-    text = re.sub(r'\d+', ' ', text)
+    Yields:
+        str: Blocos normalizados, nunca vazios.
+    """
+    resto = ""
+    iniciado = False  # Já houve texto (strip no início)
+    espaco = False  # Espaço pendente entre o texto já emitido e o próximo
+    for chunk in itertools.chain(chunks, [None]):
+        if chunk is None:
+            texto, resto = resto, ""
+        else:
+            texto = resto + chunk
+            corte = len(texto)
+            for i in range(max(len(texto) - MAX_MOJIBAKE + 1, 0), len(texto)):
+                if texto[i] in INICIAIS_MOJIBAKE:
+                    corte = i
+                    break
+            # Uma cadeia pode começar antes: 'Ã' + 'â€”' -> 'Ã ' -> 'a'
+            while corte > 0 and texto[corte - 1] in INICIAIS_MOJIBAKE:
+                corte -= 1
+            texto, resto = texto[:corte], texto[corte:]
 
-    # Remove pontuação substituindo por espaço
-    text = re.sub(r'[^\w\s]', ' ', text)
+        texto = clean_text(texto)
+        nucleo = texto.strip(' ')
+        if not nucleo:
+            espaco = espaco or (iniciado and bool(texto))
+            continue
+        if iniciado and (espaco or texto[0] == ' '):
+            nucleo = ' ' + nucleo
+        iniciado = True
+        espaco = texto[-1] == ' '
+        yield nucleo
 
-    # Remove espaços duplicados
-    text = re.sub(r'\s+', ' ', text) 
+def preprocess_chunks(origem, chunk_size=CHUNK_SIZE):
+    """
+    Lê e normaliza origem em blocos, para alimentar diretamente o codificador
+    (ex.: compress_stream(preprocess_chunks("memorias.txt"), ...)), sem
+    arquivo intermediário.
 
-    # Converte para minúsculas
-    text = text.lower()
+    Args:
+        origem (str | file): Caminho ou arquivo de entrada (ver ler_blocos).
+        chunk_size (int): Tamanho dos blocos lidos.
 
-    # Remove espaços no início e fim
-    text = text.strip()
-    
-    return text
+    Yields:
+        str: Blocos de texto normalizado.
+    """
+    return normalize_chunks(fix_double_encoding_chunks(ler_blocos(origem, chunk_size)))
 
-def preprocess_text(input_file, output_file):
+def preprocess_text(input_file, output_file, chunk_size=CHUNK_SIZE):
     """Main preprocessing function"""
-    # Primeiro lemos como bytes para poder corrigir a dupla codificação
-    with open(input_file, 'rb') as f:
-        raw_text = f.read().decode('utf-8')
-    
-    # Corrigimos a dupla codificação
-    text = fix_double_encoding(raw_text)
-    
-    # Aplicamos as outras transformações
-    text = remove_artifacts(text)
-    
-    # Salvamos o texto processado
+    # A correção da dupla codificação e as transformações são feitas por blocos
     with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(text)
+        for chunk in preprocess_chunks(input_file, chunk_size):
+            f.write(chunk)
 
 if __name__ == "__main__":
     input_file = "memorias.txt"
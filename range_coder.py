@@ -0,0 +1,109 @@
+TOP = 1 << 24  # O intervalo é renormalizado (um byte) sempre que fica abaixo disto
+MASCARA = 0xFFFFFFFF
+MAX_TOTAL = TOP  # Maior total de frequências aceito por encode/decode_freq
+
+class RangeEncoder:
+    """
+    Codificador aritmético de intervalo (range coder) com inteiros de 32 bits
+    e propagação de carry, no estilo do LZMA.
+
+    Cada símbolo é codificado pela sua frequência acumulada cum, sua frequência
+    freq e o total da distribuição; o intervalo atual é dividido em total
+    partes e reduzido às freq partes a partir de cum. O primeiro byte gerado é
+    sempre zero (cache inicial), e finish grava os 4 bytes finais.
+
+    Args:
+        arquivo (file): Objeto de arquivo aberto para escrita binária.
+    """
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+        self.buffer = bytearray()
+        self.low = 0  # Até 33 bits: o bit 32 é o carry pendente
+        self.range = MASCARA
+        self.cache = 0  # Último byte ainda sujeito a carry
+        self.cache_size = 1  # cache mais os bytes 0xFF pendentes
+
+    @property
+    def bit_count(self):
+        """Bits usados até agora (bytes gerados ou pendentes mais a fração do intervalo)."""
+        return 8 * (len(self.buffer) + self.cache_size - 1) + 32 - self.range.bit_length()
+
+    def encode(self, cum, freq, total):
+        """Codifica o símbolo de frequência freq, com frequência acumulada cum, entre total."""
+        r = self.range // total
+        self.low += r * cum
+        self.range = r * freq
+        while self.range < TOP:
+            self.range <<= 8
+            self._shift_low()
+
+    def _shift_low(self):
+        # Emite o byte mais alto de low; um 0xFF fica pendente até se saber se há carry
+        low = self.low
+        if low < 0xFF000000 or low > MASCARA:
+            carry = low >> 32
+            byte = self.cache
+            buffer = self.buffer
+            while self.cache_size:
+                buffer.append((byte + carry) & 0xFF)
+                byte = 0xFF
+                self.cache_size -= 1
+            self.cache = (low >> 24) & 0xFF
+        self.cache_size += 1
+        self.low = (low << 8) & MASCARA
+
+    def finish(self):
+        """Grava os bytes pendentes e os 4 bytes que identificam o intervalo final."""
+        for _ in range(5):
+            self._shift_low()
+        self.arquivo.write(self.buffer)
+        self.buffer = bytearray()
+
+
+class RangeDecoder:
+    """
+    Decodificador correspondente ao RangeEncoder.
+
+    Para cada símbolo, decode_freq(total) dá a frequência acumulada alvo, e
+    depois de identificar o símbolo o chamador consome-o com decode_update.
+    Após o fim dos dados, os bytes lidos são zeros (ver exhausted).
+
+    Args:
+        arquivo (file): Objeto de arquivo aberto para leitura binária.
+    """
+    def __init__(self, arquivo):
+        self.data = arquivo.read()
+        self.index = 0
+        self.padding = 0  # Bytes lidos além do fim dos dados
+        self.range = MASCARA
+        self.code = 0
+        self.r = 0
+        for _ in range(5):
+            self.code = ((self.code << 8) | self._next_byte()) & MASCARA
+
+    @property
+    def exhausted(self):
+        """Indica se foram lidos bytes além do fim dos dados."""
+        return self.padding > 0
+
+    def _next_byte(self):
+        if self.index < len(self.data):
+            byte = self.data[self.index]
+            self.index += 1
+            return byte
+        self.padding += 1
+        return 0
+
+    def decode_freq(self, total):
+        """Frequência acumulada (entre 0 e total - 1) do próximo símbolo."""
+        self.r = self.range // total
+        value = self.code // self.r
+        return value if value < total else total - 1
+
+    def decode_update(self, cum, freq):
+        """Consome o símbolo identificado por (cum, freq), como no encode."""
+        self.code -= self.r * cum
+        self.range = self.r * freq
+        while self.range < TOP:
+            self.code = ((self.code << 8) | self._next_byte()) & MASCARA
+            self.range <<= 8
@@ -0,0 +1,429 @@
+import io
+import itertools
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from arquivo_utils import (BLOCK_SIZE, MAGIC_SEMIESTATICO, BitReader, escrever_cabecalho,
+                           escrever_indice, ler_blocos, ler_cabecalho, ler_indice)
+from huffman import HuffmanSimple
+
+try:
+    import numpy as np
+except ImportError:  # Só a compressão precisa do numpy
+    np = None
+
+# Contextos, entradas (contexto, símbolo) e tamanho das tabelas comprimidas
+TAMANHOS_TABELAS = struct.Struct("<QQQ")
+CONTEXTO_INICIAL = struct.Struct("<Q")  # Contexto do primeiro símbolo de cada bloco
+CODIGOS_POR_FATIA = 1 << 16  # Códigos empacotados de cada vez por _pack_bits
+
+def _base(alphabet, order):
+    """
+    Base dos ids de contexto: um dígito por símbolo anterior, com o valor
+    len(alphabet) para as posições antes do início do texto.
+    """
+    base = len(alphabet) + 1
+    if base ** (order + 1) >= 1 << 63:
+        raise ValueError("Ordem alta demais para o modo semiestático.")
+    return base
+
+class SemiStaticTables:
+    """
+    Tabelas Huffman canônicas fixas do modo semiestático, uma por contexto de
+    ordem order, e a decodificação dos blocos com elas.
+
+    Como as tabelas não mudam durante a codificação, cada bloco é decodificado
+    só com elas e o contexto do seu primeiro símbolo, em qualquer ordem e em
+    qualquer processo. Contextos com um único símbolo têm código vazio.
+
+    Args:
+        alphabet (iterable): Símbolos do alfabeto.
+        order (int): Ordem dos contextos.
+        contexts (iterable): Ids dos contextos, em ordem crescente.
+        sizes (iterable): Número de símbolos de cada contexto.
+        symbols (iterable): Ids dos símbolos de cada contexto, em sequência.
+        lengths (iterable): Comprimento do código de cada símbolo.
+    """
+    def __init__(self, alphabet, order, contexts, sizes, symbols, lengths):
+        self.symbols = sorted(alphabet)
+        self.order = order
+        self.base = _base(self.symbols, order)
+        self.modulo = self.base ** order
+        self.tables = {}
+        iguais = {}  # Contextos com os mesmos códigos compartilham a tabela
+        symbols = iter(symbols)
+        lengths = iter(lengths)
+        for context, size in zip(contexts, sizes):
+            chave = tuple(zip(itertools.islice(symbols, size), itertools.islice(lengths, size)))
+            table = iguais.get(chave)
+            if table is None:
+                table = HuffmanSimple()
+                table.build_from_lengths(dict(chave))
+                iguais[chave] = table
+            self.tables[context] = table
+
+    @classmethod
+    def from_bytes(cls, alphabet, order, num_contextos, num_entradas, dados):
+        """
+        Lê as tabelas gravadas por compress_semistatic: os arrays (deltas dos
+        ids de contexto, tamanhos, símbolos e comprimentos), little-endian,
+        comprimidos juntos com zlib.
+
+        Raises:
+            ValueError: Se os dados estiverem corrompidos.
+        """
+        try:
+            dados = zlib.decompress(dados)
+        except zlib.error:
+            raise ValueError("Tabelas semiestáticas corrompidas.") from None
+        arrays = []
+        posicao = 0
+        for codigo, tamanho in (('Q', num_contextos), ('H', num_contextos),
+                                ('H', num_entradas), ('B', num_entradas)):
+            valores = array(codigo)
+            fim = posicao + tamanho * valores.itemsize
+            if fim > len(dados):
+                raise ValueError("Tabelas semiestáticas truncadas.")
+            valores.frombytes(dados[posicao:fim])
+            if sys.byteorder == 'big':
+                valores.byteswap()
+            arrays.append(valores)
+            posicao = fim
+        deltas, sizes, symbols, lengths = arrays
+        return cls(alphabet, order, itertools.accumulate(deltas), sizes, symbols, lengths)
+
+    def decode_block(self, dados, num_simbolos):
+        """
+        Decodifica um bloco: o contexto inicial seguido dos códigos.
+
+        Returns:
+            str: Texto decodificado.
+
+        Raises:
+            ValueError: Se os dados terminarem antes do esperado ou levarem a
+                um contexto sem tabela.
+        """
+        if len(dados) < CONTEXTO_INICIAL.size:
+            raise ValueError("Bloco truncado.")
+        context, = CONTEXTO_INICIAL.unpack_from(dados)
+        reader = BitReader(io.BytesIO(dados[CONTEXTO_INICIAL.size:]))
+        tables = self.tables
+        symbols = self.symbols
+        base = self.base
+        modulo = self.modulo
+        decoded_text = []
+        for _ in range(num_simbolos):
+            table = tables.get(context)
+            if table is None:
+                raise ValueError("Contexto sem tabela: dados corrompidos.")
+            symbol = table.decode(reader)
+            if symbol is None or reader.exhausted:
+                raise ValueError("Decodificação interrompida.")
+            decoded_text.append(symbols[symbol])
+            context = (context * base + symbol) % modulo
+        return "".join(decoded_text)
+
+
+def _symbol_ids(texto, codepoints):
+    """Ids (índices no alfabeto ordenado) dos símbolos de texto, como array int64."""
+    pontos = np.frombuffer(texto.encode('utf-32-le'), dtype='<u4')
+    ids = np.searchsorted(codepoints, pontos)
+    fora = ids >= len(codepoints)
+    fora[~fora] = codepoints[ids[~fora]] != pontos[~fora]
+    if fora.any():
+        raise ValueError(f"Símbolo fora do alfabeto: {chr(pontos[fora.argmax()])!r}")
+    return ids.astype(np.int64)
+
+def _contexts(ids, anteriores, base):
+    """
+    Ids dos contextos de cada símbolo de ids, calculados de uma vez: cada
+    passada acrescenta um dígito (um símbolo anterior) a todos os ids.
+
+    Args:
+        ids (ndarray): Símbolos do bloco.
+        anteriores (ndarray): Os order símbolos antes do bloco.
+        base (int): Base dos ids (ver _base).
+
+    Returns:
+        tuple: (ids dos contextos, os order últimos símbolos para o bloco seguinte).
+    """
+    order = len(anteriores)
+    texto = np.concatenate((anteriores, ids))
+    contexts = np.zeros(len(ids), dtype=np.int64)
+    for deslocamento in range(order):
+        contexts = contexts * base + texto[deslocamento:deslocamento + len(ids)]
+    return contexts, texto[len(texto) - order:]
+
+def _codes(counts, cache):
+    """
+    Comprimentos e valores dos códigos Huffman canônicos de um contexto, na
+    ordem dos símbolos.
+
+    Os símbolos de cada contexto estão em ordem crescente, e tanto o
+    desempate da HuffmanSimple quanto a ordem canônica seguem essa ordem; por
+    isso os códigos dependem só da sequência de contagens, e contextos com as
+    mesmas contagens reaproveitam o resultado.
+    """
+    chave = tuple(counts)
+    codes = cache.get(chave)
+    if codes is None:
+        table = HuffmanSimple()
+        table.build_tree(dict(enumerate(chave)))
+        codes = ([table.codes[i][1] for i in range(len(chave))],
+                 [table.codes[i][0] for i in range(len(chave))])
+        cache[chave] = codes
+    return codes
+
+def _pack_bits(values, lengths):
+    """
+    Concatena os códigos (valor, comprimento) em bytes, do bit mais
+    significativo para o menos, completando o último byte com zeros (o mesmo
+    que BitWriter.write seguido de flush).
+
+    Cada código (até 64 bits) é deslocado para a sua posição numa palavra de
+    64 bits, ou dividido entre duas, pelo fim acumulado dos códigos; como os
+    códigos não se sobrepõem, somar as partes de cada palavra equivale ao OU.
+    Os códigos são empacotados em fatias de CODIGOS_POR_FATIA, com os bits
+    que não completam uma palavra passados para a fatia seguinte, de modo que
+    a memória temporária não depende do tamanho do bloco.
+    """
+    partes = []
+    resto = 0  # Últimos bits_resto bits da fatia anterior
+    bits_resto = 0
+    for inicio in range(0, len(lengths), CODIGOS_POR_FATIA):
+        comprimentos = lengths[inicio:inicio + CODIGOS_POR_FATIA].astype(np.int64)
+        valores = values[inicio:inicio + CODIGOS_POR_FATIA]
+        fins = np.cumsum(comprimentos) + bits_resto  # Fim de cada código, contando o resto
+        total = int(fins[-1])
+        usados = comprimentos > 0
+        comprimentos, valores, fins = comprimentos[usados], valores[usados], fins[usados]
+        palavra = (fins - comprimentos) // 64  # Palavra do primeiro bit de cada código
+        fim = fins - 64 * palavra  # Fim do código dentro da palavra (até 64 + comprimento)
+
+        palavras = np.zeros(total // 64 + 2, dtype=np.uint64)
+        if bits_resto:
+            palavras[0] = resto << (64 - bits_resto)
+        cabe = fim <= 64
+        np.add.at(palavras, palavra[cabe], valores[cabe] << (64 - fim[cabe]).astype(np.uint64))
+        excesso = (fim[~cabe] - 64).astype(np.uint64)
+        np.add.at(palavras, palavra[~cabe], valores[~cabe] >> excesso)
+        np.add.at(palavras, palavra[~cabe] + 1, valores[~cabe] << (np.uint64(64) - excesso))
+
+        completas = total // 64
+        partes.append(palavras[:completas].astype('>u8').tobytes())
+        bits_resto = total % 64
+        resto = int(palavras[completas]) >> (64 - bits_resto) if bits_resto else 0
+    if bits_resto:
+        tamanho = (bits_resto + 7) // 8
+        partes.append((resto << (8 * tamanho - bits_resto)).to_bytes(tamanho, 'big'))
+    return b"".join(partes)
+
+@contextmanager
+def _passes(src, block_size, use_mmap):
+    """
+    Gerenciador de contexto com a função que gera os blocos de src a cada
+    chamada, para as duas passadas. Caminhos são reabertos e arquivos com seek
+    voltam à posição inicial; arquivos sem seek (ex.: a entrada padrão) e
+    outros iteráveis são copiados, na primeira leitura, para um arquivo
+    temporário (em UTF-8), removido na saída, de modo que a memória continua
+    limitada aos blocos.
+    """
+    if isinstance(src, (str, os.PathLike)):
+        yield lambda: ler_blocos(src, block_size, use_mmap)
+        return
+    if hasattr(src, 'read') and src.seekable():
+        inicio = src.tell()
+
+        def blocos():
+            src.seek(inicio)
+            return ler_blocos(src, block_size, use_mmap)
+        yield blocos
+        return
+    with tempfile.TemporaryFile() as copia:
+        for bloco in ler_blocos(src, block_size):
+            copia.write(bloco.encode('utf-8'))
+
+        def blocos():
+            copia.seek(0)
+            return ler_blocos(copia, block_size)
+        yield blocos
+
+def compress_semistatic(src, dst, order, block_size=BLOCK_SIZE, alphabet=None, use_mmap=False):
+    """
+    Comprime src em duas passadas, com tabelas Huffman fixas por contexto.
+
+    A primeira passada conta, com numpy, todos os pares (contexto de ordem
+    order, símbolo): os ids de contexto são calculados para o bloco inteiro
+    de uma vez (ver _contexts) e contados com np.unique. Cada contexto recebe
+    uma tabela canônica com as suas contagens, sem escapes, já que todo par
+    do texto foi contado. A segunda passada codifica cada símbolo consultando
+    o código do seu par, também vetorizada.
+
+    O contêiner tem o cabeçalho (MAGIC_SEMIESTATICO), as tabelas (ver
+    SemiStaticTables.from_bytes), os blocos, cada um com o contexto do seu
+    primeiro símbolo, e o índice e rodapé de compress_blocks. Os blocos são
+    independentes na decodificação (ver decompress_semistatic).
+
+    Args:
+        src (str | file | iterable): Caminho, arquivo ou iterável de blocos
+            de texto (ver _passes).
+        dst (file): Arquivo de saída aberto para escrita binária.
+        order (int): Ordem dos contextos.
+        block_size (int): Tamanho dos blocos (símbolos por entrada do índice).
+        alphabet (iterable): Alfabeto (padrão: ppm_huffman_encoder.ALPHABET).
+        use_mmap (bool): Lê src via mmap (ver ler_blocos).
+
+    Returns:
+        list: Entradas do índice, (deslocamento, tamanho, símbolos, CRC-32).
+
+    Raises:
+        ImportError: Se o numpy não estiver instalado.
+        ValueError: Se o texto tiver um símbolo fora do alfabeto ou a ordem
+            for alta demais.
+    """
+    if np is None:
+        raise ImportError("O modo semiestático requer o numpy.")
+    if alphabet is None:
+        from ppm_huffman_encoder import ALPHABET as alphabet
+    symbols = sorted(alphabet)
+    base = _base(symbols, order)
+    codepoints = np.array([ord(symbol) for symbol in symbols], dtype=np.uint32)
+    inicio = np.full(order, len(symbols), dtype=np.int64)  # Antes do início do texto
+    with _passes(src, block_size, use_mmap) as blocos:
+        # Primeira passada: contagem dos pares contexto * base + símbolo
+        chaves = []
+        contagens = []
+        anteriores = inicio
+        for bloco in blocos():
+            ids = _symbol_ids(bloco, codepoints)
+            contexts, anteriores = _contexts(ids, anteriores, base)
+            pares, counts = np.unique(contexts * base + ids, return_counts=True)
+            chaves.append(pares)
+            contagens.append(counts)
+        if chaves:
+            pares, inverso = np.unique(np.concatenate(chaves), return_inverse=True)
+            counts = np.bincount(inverso, weights=np.concatenate(contagens)).astype(np.int64)
+        else:
+            pares = np.zeros(0, dtype=np.int64)
+            counts = pares
+
+        # Tabelas: os pares ordenados já vêm agrupados por contexto
+        contexts = pares // base
+        entradas = (pares % base).astype(np.uint16)
+        fronteiras = np.flatnonzero(np.diff(contexts)) + 1
+        inicios = np.concatenate(([0], fronteiras)) if len(pares) else fronteiras
+        sizes = np.diff(np.append(inicios, len(pares)))
+        cache = {}
+        lengths = np.zeros(len(pares), dtype=np.uint8)
+        values = np.zeros(len(pares), dtype=np.uint64)
+        for comeco, fim in zip(inicios.tolist(), (inicios + sizes).tolist()):
+            if fim - comeco > 1:  # Um único símbolo tem código vazio
+                lengths[comeco:fim], values[comeco:fim] = _codes(counts[comeco:fim].tolist(), cache)
+
+        unicos = contexts[inicios]
+        deltas = np.diff(unicos, prepend=0).astype('<u8')
+        tabelas = zlib.compress(b"".join((deltas.tobytes(), sizes.astype('<u2').tobytes(),
+                                          entradas.astype('<u2').tobytes(), lengths.tobytes())), 9)
+        cabecalho = escrever_cabecalho(dst, order, symbols, {}, MAGIC_SEMIESTATICO)
+        tamanhos = TAMANHOS_TABELAS.pack(len(unicos), len(pares), len(tabelas))
+        dst.write(tamanhos)
+        dst.write(tabelas)
+        cabecalho += tamanhos + tabelas  # O CRC do índice cobre também as tabelas
+
+        # Segunda passada: um código por símbolo, buscado pelo par
+        posicao = len(cabecalho)
+        indice = []
+        anteriores = inicio
+        for bloco in blocos():
+            ids = _symbol_ids(bloco, codepoints)
+            contexts, proximos = _contexts(ids, anteriores, base)
+            primeiro = int(contexts[0]) if len(contexts) else 0
+            entrada = np.searchsorted(pares, contexts * base + ids)
+            dados = CONTEXTO_INICIAL.pack(primeiro) + _pack_bits(values[entrada], lengths[entrada])
+            anteriores = proximos
+            dst.write(dados)
+            indice.append((posicao, len(dados), len(ids), zlib.crc32(dados)))
+            posicao += len(dados)
+
+        escrever_indice(dst, posicao, indice, cabecalho)
+        return indice
+
+
+_tabelas = None  # SemiStaticTables de cada processo do pool (ver _iniciar_processo)
+
+def _iniciar_processo(alphabet, order, tamanhos, dados):
+    global _tabelas
+    _tabelas = SemiStaticTables.from_bytes(alphabet, order, *tamanhos, dados)
+
+def _decompress_block(dados, num_simbolos, crc, tabelas=None):
+    if zlib.crc32(dados) != crc:
+        raise ValueError("CRC do bloco não confere.")
+    return (tabelas or _tabelas).decode_block(dados, num_simbolos)
+
+def decompress_semistatic(src, dst, workers=None):
+    """
+    Descomprime um contêiner gerado por compress_semistatic. Os blocos são
+    decodificados em paralelo (cada processo lê as tabelas uma vez) e
+    escritos em ordem. Não requer o numpy.
+
+    Args:
+        src (file): Arquivo comprimido aberto para leitura binária (com seek).
+        dst (file): Arquivo de saída aberto para escrita em modo texto.
+        workers (int): Processos usados (None = número de CPUs, 1 = sem processos).
+
+    Returns:
+        int: Número de símbolos decodificados.
+
+    Raises:
+        ValueError: Se o contêiner estiver corrompido.
+    """
+    indice = ler_indice(src)  # Confere também o CRC do cabeçalho e das tabelas
+    src.seek(0)
+    order, alphabet, _ = ler_cabecalho(src, MAGIC_SEMIESTATICO)
+    tamanhos = src.read(TAMANHOS_TABELAS.size)
+    if len(tamanhos) != TAMANHOS_TABELAS.size:
+        raise ValueError("Cabeçalho inválido.")
+    num_contextos, num_entradas, tamanho = TAMANHOS_TABELAS.unpack(tamanhos)
+    dados = src.read(tamanho)
+    if len(dados) != tamanho:
+        raise ValueError("Cabeçalho inválido.")
+    total = 0
+
+    def blocos():
+        for posicao, tamanho, num_simbolos, crc in indice:
+            src.seek(posicao)
+            bloco = src.read(tamanho)
+            if len(bloco) != tamanho:
+                raise ValueError("Contêiner truncado.")
+            yield bloco, num_simbolos, crc
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        tabelas = SemiStaticTables.from_bytes(alphabet, order, num_contextos, num_entradas, dados)
+        for bloco in blocos():
+            texto = _decompress_block(*bloco, tabelas)
+            dst.write(texto)
+            total += len(texto)
+        return total
+
+    with ProcessPoolExecutor(workers, initializer=_iniciar_processo,
+                             initargs=(alphabet, order, (num_contextos, num_entradas), dados)) as executor:
+        # Limita os blocos em andamento para não carregar o contêiner inteiro
+        pendentes = deque()
+        for bloco in blocos():
+            pendentes.append(executor.submit(_decompress_block, *bloco))
+            if len(pendentes) >= 2 * workers:
+                texto = pendentes.popleft().result()
+                dst.write(texto)
+                total += len(texto)
+        while pendentes:
+            texto = pendentes.popleft().result()
+            dst.write(texto)
+            total += len(texto)
+    return total
@@ -0,0 +1,22 @@
+import pytest
+
+import cli
+
+
+@pytest.mark.parametrize('opcao', ['--max-nodes', '--max-bytes', '-j', '--rebuild-interval'])
+def test_opcoes_numericas_recusam_zero(opcao, tmp_path, capsys):
+    entrada = tmp_path / 'entrada.txt'
+    entrada.write_text('abc', encoding='utf-8')
+    with pytest.raises(SystemExit):
+        cli.main(['compress', str(entrada), opcao, '0'])
+    assert 'inteiro positivo' in capsys.readouterr().err
+
+
+def test_compress_com_erro_nao_deixa_saida(tmp_path, capsys):
+    # O símbolo fora do alfabeto só aparece depois do primeiro quadro
+    entrada = tmp_path / 'entrada.txt'
+    entrada.write_text('abc ' * 5000 + 'Ω', encoding='utf-8')
+    saida = tmp_path / 'saida.bin'
+    assert cli.main(['compress', str(entrada), '-o', str(saida), '--chunk-size', '1000']) == 1
+    assert 'ERRO' in capsys.readouterr().err
+    assert not saida.exists()
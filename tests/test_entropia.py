@@ -0,0 +1,34 @@
+import math
+import os
+import pytest
+from PPM import FlatModel, PPMModel
+from ppm_huffman_encoder import ALPHABET
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'memorias_processed.txt')
+
+def entropia(frequencies):
+    total = sum(frequencies.values())
+    return sum(count * math.log2(total / count) for count in frequencies.values()) / total
+
+def nos(model):
+    pilha = [model.root]
+    while pilha:
+        node = pilha.pop()
+        if node.symbols:
+            yield node
+        pilha.extend((node.children or {}).values())
+
+@pytest.mark.parametrize('rescale_threshold', [40, 65535])
+def test_entropia_incremental(rescale_threshold):
+    with open(CORPUS, encoding='utf-8') as arquivo:
+        texto = arquivo.read(20000)
+    model = PPMModel(ALPHABET, 3, rescale_threshold=rescale_threshold)
+    model.train(texto)
+    flat = FlatModel.from_arrays(model.alphabet, model.order, model.params, model.frozen, *model.to_arrays())
+    overlay = flat.model()
+    overlay.train(texto[:2000])
+    for modelo in (model, PPMModel.from_arrays(model.alphabet, model.order, model.params, model.frozen,
+                                               *model.to_arrays()), overlay):
+        for node in nos(modelo):
+            esperada = entropia(modelo.coding_frequencies(node))
+            assert modelo.context_entropy(node) == pytest.approx(esperada, abs=1e-9)
@@ -0,0 +1,56 @@
+import itertools
+import random
+from fractions import Fraction
+import pytest
+from huffman import HuffmanSimple, minimum_redundancy_lengths, package_merge_lengths
+
+def kraft(lengths):
+    return sum(Fraction(1, 2 ** length) for length in lengths)
+
+def custo(weights, lengths):
+    return sum(weight * length for weight, length in zip(weights, lengths))
+
+def otimo_por_forca_bruta(weights, max_length):
+    """Menor custo entre todos os comprimentos de 1 a max_length com Kraft <= 1."""
+    return min(custo(weights, lengths)
+               for lengths in itertools.product(range(1, max_length + 1), repeat=len(weights))
+               if kraft(lengths) <= 1)
+
+def pesos(gerador, n):
+    return sorted(gerador.choice([1, 1, 2, 3, 5, 8, 50, 1000]) * gerador.randint(1, 4) for _ in range(n))
+
+@pytest.mark.parametrize('n', [2, 3, 4, 5, 6])
+def test_package_merge_otimo(n):
+    gerador = random.Random(n)
+    for _ in range(10):
+        weights = pesos(gerador, n)
+        for max_length in range((n - 1).bit_length(), 6):
+            lengths = package_merge_lengths(weights, max_length)
+            assert max(lengths) <= max_length
+            assert kraft(lengths) == 1
+            assert custo(weights, lengths) == otimo_por_forca_bruta(weights, max_length)
+
+def test_package_merge_sem_limite_igual_ao_huffman():
+    gerador = random.Random(7)
+    for n in range(2, 60):
+        weights = pesos(gerador, n)
+        lengths = package_merge_lengths(weights, 32)
+        assert custo(weights, lengths) == custo(weights, minimum_redundancy_lengths(weights))
+
+def test_package_merge_recusa_alfabeto_grande():
+    assert max(package_merge_lengths([1] * 16, 4)) == 4
+    with pytest.raises(ValueError):
+        package_merge_lengths([1] * 17, 4)
+
+def test_tabela_limitada():
+    # Pesos de Fibonacci levam o Huffman sem limite a códigos de n - 1 bits
+    fibonacci = [1, 1]
+    while len(fibonacci) < 30:
+        fibonacci.append(fibonacci[-1] + fibonacci[-2])
+    assert max(minimum_redundancy_lengths(fibonacci)) == 29
+    table = HuffmanSimple(max_length=8)
+    table.build_tree(dict(enumerate(fibonacci)))
+    assert max(table.lengths.values()) == 8
+    assert kraft(table.lengths.values()) == 1
+    codigos = {format(code, f'0{length}b') for code, length in table.codes.values()}
+    assert not any(a != b and b.startswith(a) for a in codigos for b in codigos)
@@ -0,0 +1,58 @@
+import gc
+import os
+import tracemalloc
+import pytest
+from huffman import CACHE_ENTRY_BYTES, CACHE_SIZE
+from ppm_huffman_encoder import ALPHABET, PPMHuffmanTest
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'memorias_processed.txt')
+MAX_BYTES = 500_000
+TOLERANCIA = 1.25  # Erro admitido da estimativa de PPMModel.estimated_bytes
+
+@pytest.fixture(scope='module')
+def texto():
+    with open(CORPUS, encoding='utf-8') as arquivo:
+        return arquivo.read(30000)
+
+def memoria_do_modelo(encoder, texto):
+    """Bytes alocados (tracemalloc) que continuam vivos depois de codificar texto."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        inicio = tracemalloc.get_traced_memory()[0]
+        encoder.encode_block(texto)
+        gc.collect()
+        return tracemalloc.get_traced_memory()[0] - inicio
+    finally:
+        tracemalloc.stop()
+
+@pytest.mark.parametrize('coder', ['huffman', 'range'])
+@pytest.mark.parametrize('policy', ['restart', 'freeze', 'prune'])
+def test_orcamento_com_reconstrucao_periodica(texto, coder, policy):
+    encoder = PPMHuffmanTest(ALPHABET, 4, cache_size=0, coder=coder, rebuild_interval=16,
+                             max_bytes=MAX_BYTES, policy=policy)
+    memoria = memoria_do_modelo(encoder, texto)
+    assert encoder.ppm.table_count > 0
+    assert memoria <= TOLERANCIA * MAX_BYTES
+
+def test_tabelas_contadas_na_estimativa(texto):
+    sem_tabelas = PPMHuffmanTest(ALPHABET, 4)
+    sem_tabelas.encode_block(texto)
+    com_tabelas = PPMHuffmanTest(ALPHABET, 4, rebuild_interval=16)
+    com_tabelas.encode_block(texto)
+    ppm = com_tabelas.ppm
+    assert ppm.node_count == sem_tabelas.ppm.node_count
+    assert ppm.estimated_bytes > sem_tabelas.ppm.estimated_bytes
+    assert sem_tabelas.ppm.table_count == 0
+
+def test_cache_dimensionado_pela_ordem_e_orcamento(texto):
+    assert PPMHuffmanTest(ALPHABET, 4).cache.max_size == 0
+    sem_orcamento = PPMHuffmanTest(ALPHABET, 6)
+    assert sem_orcamento.cache.max_size == CACHE_SIZE
+    encoder = PPMHuffmanTest(ALPHABET, 6, max_bytes=MAX_BYTES)
+    assert 0 < encoder.cache.max_size * CACHE_ENTRY_BYTES <= MAX_BYTES // 8
+    memoria = memoria_do_modelo(encoder, texto)
+    assert encoder.cache.hits > 0
+    assert memoria <= TOLERANCIA * MAX_BYTES
+    # O cache não altera a saída
+    assert sem_orcamento.encode_block(texto) == PPMHuffmanTest(ALPHABET, 6, cache_size=0).encode_block(texto)
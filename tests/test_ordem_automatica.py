@@ -0,0 +1,46 @@
+import io
+import random
+import pytest
+from ordem_automatica import OrderSelector, amostras, amostras_do_fluxo
+
+TEXTO = "".join(f"linha {i} com texto ção " for i in range(5000))
+
+class SemSeek(io.RawIOBase):
+    """Entrada binária sem seek, como a entrada padrão."""
+    def __init__(self, dados):
+        self.dados = io.BytesIO(dados)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self.dados.readinto(buffer)
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_amostras_por_seek(binary):
+    dados = TEXTO.encode('utf-8')
+    origem = io.BytesIO(dados)
+    samples, entrada = amostras_do_fluxo(origem, binary=binary, num_samples=4, sample_size=1000)
+    assert entrada is origem and origem.tell() == 0
+    assert len(samples) == 4
+    if binary:
+        assert samples == amostras(dados, 4, 1000)
+    else:
+        # Os trechos são pedaços do texto, sem caracteres cortados
+        assert all(amostra in TEXTO and 995 <= len(amostra.encode('utf-8')) <= 1000 for amostra in samples)
+
+def test_amostras_sem_seek_repoem_o_inicio():
+    samples, entrada = amostras_do_fluxo(SemSeek(TEXTO.encode('utf-8')), chunk_size=700, num_samples=4,
+                                         sample_size=1000)
+    # Amostras só dos primeiros blocos lidos (até 4000 caracteres e mais um bloco)
+    assert len(samples) == 4 and samples[0] == TEXTO[:1000]
+    assert all(amostra in TEXTO[:4700] for amostra in samples)
+    assert "".join(entrada) == TEXTO
+
+def test_select_stream_com_alfabeto_de_bytes_igual():
+    # Bytes que não são UTF-8 válido: só funcionam no modo binário
+    dados = bytes(random.Random(3).randrange(128, 256) for _ in range(20000))
+    selector = OrderSelector([0, 1], num_samples=2, sample_size=4000)
+    order, trials, entrada = selector.select_stream(io.BytesIO(dados), alphabet=set(range(256)))
+    assert order in (0, 1) and len(trials) == 2
+    assert entrada.read() == dados
@@ -0,0 +1,41 @@
+import random
+import re
+import pytest
+from ppm_huffman_encoder import ALPHABET
+from pre_processamento import MOJIBAKE, normalize_chunks
+
+def referencia(text):
+    """O remove_artifacts original: as substituições em cadeia e as regex em sequência."""
+    for sequencia, substituta in MOJIBAKE.items():
+        text = text.replace(sequencia, substituta)
+    text = re.sub(r'\d+', ' ', text)
+    text = re.sub(r'[^\w\s]', ' ', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.lower().strip()
+
+PEDACOS = list(MOJIBAKE) + list("abcdefghijklmnopqrstuvwxyzABCXYZ") + [" ", "  ", "\n", ".", ",", "-", "7", "42"]
+ORFAOS = ["Ã", "â", "Â", "€", "Ãâ", "â€"]
+
+def mojibake(gerador, pedacos):
+    return "".join(gerador.choice(pedacos) for _ in range(gerador.randint(0, 40)))
+
+def normalizar(texto, gerador):
+    # Blocos de tamanhos aleatórios, para exercitar as sequências divididas
+    cortes = sorted(gerador.sample(range(len(texto) + 1), min(len(texto) + 1, 4)))
+    blocos = [texto[a:b] for a, b in zip([0] + cortes, cortes + [len(texto)])]
+    return "".join(normalize_chunks(blocos))
+
+def test_mojibake_dentro_do_alfabeto():
+    gerador = random.Random(0)
+    for _ in range(3000):
+        texto = mojibake(gerador, PEDACOS)
+        normalizado = normalizar(texto, gerador)
+        assert normalizado == referencia(texto)
+        assert set(normalizado) <= ALPHABET
+
+@pytest.mark.parametrize('seed', range(3))
+def test_mojibake_com_orfaos_igual_ao_original(seed):
+    gerador = random.Random(seed)
+    for _ in range(3000):
+        texto = mojibake(gerador, PEDACOS + ORFAOS)
+        assert normalizar(texto, gerador) == referencia(texto)
@@ -0,0 +1,72 @@
+import io
+import random
+import pytest
+from backends import RangeBackend
+from range_coder import MAX_TOTAL, RangeDecoder, RangeEncoder
+
+def ida_e_volta(simbolos):
+    """Codifica e decodifica simbolos, uma lista de (cum, freq, total)."""
+    destino = io.BytesIO()
+    encoder = RangeEncoder(destino)
+    for cum, freq, total in simbolos:
+        encoder.encode(cum, freq, total)
+    encoder.finish()
+    decoder = RangeDecoder(io.BytesIO(destino.getvalue()))
+    decodificados = []
+    for cum, freq, total in simbolos:
+        alvo = decoder.decode_freq(total)
+        assert cum <= alvo < cum + freq
+        decoder.decode_update(cum, freq)
+        decodificados.append((cum, freq, total))
+    return decodificados, len(destino.getvalue())
+
+@pytest.mark.parametrize('total', [2, 27, 65536, MAX_TOTAL - 1])
+def test_ida_e_volta(total):
+    gerador = random.Random(total)
+    simbolos = []
+    for _ in range(3000):
+        cum = gerador.randrange(total)
+        freq = gerador.randint(1, total - cum)
+        simbolos.append((cum, freq, total))
+    assert ida_e_volta(simbolos)[0] == simbolos
+
+def test_totais_perto_do_limite():
+    # Símbolos raros (freq 1) e quase certos num total próximo de MAX_TOTAL
+    total = MAX_TOTAL - 1
+    gerador = random.Random(1)
+    simbolos = [(0, 1, total) if gerador.random() < 0.01 else (1, total - 1, total) for _ in range(20000)]
+    decodificados, tamanho = ida_e_volta(simbolos)
+    assert decodificados == simbolos
+    # Com total perto de MAX_TOTAL, range // total perde precisão, mas os
+    # símbolos quase certos continuam custando bem menos de um bit
+    assert tamanho < len(simbolos) // 8
+
+def test_backend_ida_e_volta():
+    gerador = random.Random(2)
+    backend = RangeBackend()
+    frequencias = [{s: gerador.randint(1, 1000) for s in range(gerador.randint(1, 30))} for _ in range(50)]
+    simbolos = [(f, gerador.choice(list(f))) for f in frequencias for _ in range(20)]
+    destino = io.BytesIO()
+    encoder = backend.encoder(destino)
+    for i, (f, simbolo) in enumerate(simbolos):
+        if i % 2:
+            encoder.encode_table(backend.table(f), simbolo)
+        else:
+            encoder.encode(f, simbolo)
+        encoder.encode_uniform(simbolo, 30)
+    encoder.finish()
+    decoder = backend.decoder(io.BytesIO(destino.getvalue()))
+    for i, (f, simbolo) in enumerate(simbolos):
+        assert (decoder.decode_table(backend.table(f)) if i % 2 else decoder.decode(f)) == simbolo
+        assert decoder.decode_uniform(30) == simbolo
+
+def test_total_alto_demais_recusado():
+    backend = RangeBackend()
+    frequencias = {0: MAX_TOTAL - 1, 1: 1}
+    with pytest.raises(ValueError):
+        backend.table(frequencias)
+    with pytest.raises(ValueError):
+        backend.encoder(io.BytesIO()).encode(frequencias, 0)
+    with pytest.raises(ValueError):
+        backend.decoder(io.BytesIO(b"\0" * 8)).decode(frequencias)
+    assert backend.table({0: MAX_TOTAL - 2, 1: 1}).total == MAX_TOTAL - 1
@@ -0,0 +1,32 @@
+import io
+import os
+import random
+import pytest
+from arquivo_utils import BitWriter
+
+np = pytest.importorskip('numpy')
+from semi_estatico import CODIGOS_POR_FATIA, _pack_bits, compress_semistatic, decompress_semistatic
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'memorias_processed.txt')
+
+@pytest.mark.parametrize('n', [0, 1, 7, CODIGOS_POR_FATIA + 3])
+def test_pack_bits_igual_ao_bitwriter(n):
+    gerador = random.Random(n)
+    lengths = [gerador.choice([0, 1, 2, 5, 16, 33, 63, 64]) for _ in range(n)]
+    values = [gerador.getrandbits(length) for length in lengths]
+    destino = io.BytesIO()
+    writer = BitWriter(destino)
+    for value, length in zip(values, lengths):
+        writer.write(value, length)
+    writer.flush()
+    assert _pack_bits(np.array(values, dtype=np.uint64), np.array(lengths, dtype=np.uint8)) == destino.getvalue()
+
+def test_entrada_sem_seek():
+    with open(CORPUS, encoding='utf-8') as arquivo:
+        texto = arquivo.read(50000)
+    destino = io.BytesIO()
+    # Um iterável de blocos só pode ser lido uma vez
+    compress_semistatic((texto[i:i + 3000] for i in range(0, len(texto), 3000)), destino, 2, block_size=8192)
+    saida = io.StringIO()
+    decompress_semistatic(io.BytesIO(destino.getvalue()), saida, workers=1)
+    assert saida.getvalue() == texto
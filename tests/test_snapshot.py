@@ -0,0 +1,48 @@
+import io
+import os
+import pytest
+from PPM import OverlayModel, PPMModel
+from arquivo_utils import ModelSnapshot, escrever_snapshot
+from ppm_huffman_encoder import ALPHABET, compress_stream
+from ppm_huffman_decoder import decompress_stream
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'memorias_processed.txt')
+
+@pytest.fixture(scope='module')
+def corpus():
+    with open(CORPUS, encoding='utf-8') as arquivo:
+        texto = arquivo.read(60000)
+    return texto[:50000], texto[50000:]
+
+def comprimir(mensagem, snapshot, **params):
+    destino = io.BytesIO()
+    compress_stream(io.StringIO(mensagem), destino, snapshot.order, snapshot=snapshot, **params)
+    return destino.getvalue()
+
+@pytest.mark.parametrize('params', [{}, {'max_nodes': 6000, 'policy': 'restart'},
+                                    {'max_nodes': 6000, 'policy': 'freeze'}])
+def test_overlay_igual_ao_modelo_completo(tmp_path, corpus, params):
+    treino, mensagem = corpus
+    model = PPMModel(ALPHABET, 3, **params)
+    model.train(treino)
+    caminho = tmp_path / 'modelo.ppms'
+    escrever_snapshot(caminho, model)
+
+    snapshot = ModelSnapshot(caminho)
+    assert isinstance(snapshot.model(), OverlayModel)
+    completo = ModelSnapshot(caminho)
+    completo.flat = None  # Força PPMModel.from_arrays
+    for coder in ('huffman', 'range'):
+        dados = comprimir(mensagem, snapshot, coder=coder, rebuild_interval=16)
+        assert dados == comprimir(mensagem, completo, coder=coder, rebuild_interval=16)
+        saida = io.StringIO()
+        decompress_stream(io.BytesIO(dados), saida, snapshot=snapshot)
+        assert saida.getvalue() == mensagem
+
+def test_prune_usa_modelo_completo(tmp_path, corpus):
+    model = PPMModel(ALPHABET, 3, max_nodes=6000, policy='prune')
+    model.train(corpus[0])
+    escrever_snapshot(tmp_path / 'modelo.ppms', model)
+    snapshot = ModelSnapshot(tmp_path / 'modelo.ppms')
+    assert snapshot.flat is None
+    assert not isinstance(snapshot.model(), OverlayModel)